@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Client Allociné GEDEON
+- get_client() : client allocineAPI long-vivant par thread (et par worker),
+  sur une requests.Session à connexions persistantes (keep-alive), avec
+  timeouts et nouvelles tentatives ; réutilisation visible dans metrics
+- fetch_cinema_day(client, cinema_id, day) : films d'une journée, séances
+  typées (Showtime) et triées
+- FixtureAllocineClient : rejoue des réponses enregistrées (hors ligne)
+- RecordingAllocineClient : enregistre les réponses d'un client réel
+
+Fixtures : un fichier JSON par cinéma et par jour, réponse brute de get_showtime
+    <dossier>/<cinema_id>/<AAAA-MM-JJ>.json
+
+Utilisation :
+    from allocine_client import get_client, fetch_cinema_day
+    movies = fetch_cinema_day(get_client(), 'P0671', date.today())
+
+ALLOCINE_FIXTURES=<dossier> remplace l'API réelle par les fixtures (dev, tests).
+"""
+
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from functools import partial
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+import metrics
+from reference_data import Showtime
+
+try:
+    from allocineAPI.allocineAPI import allocineAPI as _AllocineAPI
+except ImportError:
+    _AllocineAPI = None
+
+ALLOCINE_FIXTURES = os.environ.get('ALLOCINE_FIXTURES')
+
+# Timeouts (s) de connexion / lecture et nouvelles tentatives (erreurs réseau,
+# 429 et 5xx, avec backoff exponentiel et respect de Retry-After)
+ALLOCINE_CONNECT_TIMEOUT = float(os.environ.get('ALLOCINE_CONNECT_TIMEOUT', 3.05))
+ALLOCINE_READ_TIMEOUT = float(os.environ.get('ALLOCINE_READ_TIMEOUT', 10))
+ALLOCINE_RETRIES = int(os.environ.get('ALLOCINE_RETRIES', 3))
+ALLOCINE_BACKOFF = 0.5
+ALLOCINE_RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Connexions keep-alive conservées par hôte
+ALLOCINE_POOL_SIZE = 4
+
+# Versions de diffusion dans l'ordre d'affichage
+SHOWTIME_VERSIONS = ('VF', 'VO', 'VOST')
+
+
+# ============================================================================
+# CLIENTS
+# ============================================================================
+
+class _CountingPoolMixin:
+    """Pool urllib3 signalant chaque nouvelle connexion (les autres requêtes réutilisent une connexion)."""
+
+    def __init__(self, *args, on_new_connection=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_new_connection = on_new_connection
+
+    def _new_conn(self):
+        if self.on_new_connection is not None:
+            self.on_new_connection()
+        return super()._new_conn()
+
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class MeteredHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter comptant les connexions TCP/TLS ouvertes par ses pools."""
+
+    def __init__(self, *args, **kwargs):
+        self.connections_opened = 0
+        super().__init__(*args, **kwargs)
+
+    def _connection_opened(self):
+        self.connections_opened += 1
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': partial(_CountingHTTPConnectionPool, on_new_connection=self._connection_opened),
+            'https': partial(_CountingHTTPSConnectionPool, on_new_connection=self._connection_opened),
+        }
+
+
+def create_session():
+    """requests.Session à connexions persistantes, avec politique de nouvelles tentatives."""
+    retry = Retry(
+        total=ALLOCINE_RETRIES,
+        backoff_factor=ALLOCINE_BACKOFF,
+        status_forcelist=ALLOCINE_RETRY_STATUSES,
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = MeteredHTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=ALLOCINE_POOL_SIZE)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class PooledAllocineAPI(_AllocineAPI or object):
+    """
+    allocineAPI dont les requêtes passent par une Session partagée (keep-alive,
+    timeouts, nouvelles tentatives) au lieu d'un requests.get par appel.
+    """
+
+    def __init__(self, session=None):
+        self.session = session or create_session()
+        self.timeout = (ALLOCINE_CONNECT_TIMEOUT, ALLOCINE_READ_TIMEOUT)
+        self.adapter = self.session.get_adapter('https://')
+
+    def _get_json_request(self, path, url_params: dict = None) -> dict:
+        return json.loads(self._get(path, url_params))
+
+    def _get_request(self, path, params=None):
+        return self._get(path, params)
+
+    def _get(self, path, params):
+        start = time.perf_counter()
+        opened_before = getattr(self.adapter, 'connections_opened', 0)
+        try:
+            response = self.session.get(path, params=params, timeout=self.timeout)
+        except requests.RequestException:
+            metrics.increment('allocine', 'errors')
+            raise
+        metrics.observe('allocine', 'request_ms', (time.perf_counter() - start) * 1000)
+        metrics.increment('allocine', 'requests')
+        # Connexions keep-alive : nouvelles connexions ouvertes par cette requête (retries compris)
+        opened = getattr(self.adapter, 'connections_opened', 0) - opened_before
+        if opened:
+            metrics.increment('allocine', 'connections_opened', opened)
+        else:
+            metrics.increment('allocine', 'connections_reused')
+        retries = getattr(response.raw, 'retries', None)
+        if retries is not None and retries.history:
+            metrics.increment('allocine', 'retries', len(retries.history))
+        if response.status_code != 200:
+            metrics.increment('allocine', 'errors')
+            raise Exception("Error " + str(response.status_code))
+        return response.text
+
+
+_clients = threading.local()
+
+
+def get_client():
+    """
+    Client Allociné long-vivant du thread courant (recréé après un fork) :
+    fixtures si ALLOCINE_FIXTURES est défini, sinon API réelle sur Session partagée.
+    """
+    if getattr(_clients, 'pid', None) != os.getpid():
+        _clients.client = None
+        _clients.pid = os.getpid()
+    client = _clients.client
+    if client is None:
+        if ALLOCINE_FIXTURES:
+            client = FixtureAllocineClient(ALLOCINE_FIXTURES)
+        elif _AllocineAPI is None:
+            raise ImportError("allocineAPI (allocine-seances) non installé")
+        else:
+            client = PooledAllocineAPI()
+        _clients.client = client
+    return client
+
+
+def _fixture_path(path, cinema_id, date_str):
+    return os.path.join(path, cinema_id, date_str + '.json')
+
+
+class FixtureAllocineClient:
+    """
+    Remplaçant hors ligne d'allocineAPI : rejoue les réponses enregistrées.
+    Sans fixture pour le jour demandé, rejoue la plus récente du cinéma en
+    recalant les séances sur ce jour (rebase=True).
+    """
+
+    def __init__(self, path, rebase=True):
+        self.path = path
+        self.rebase = rebase
+        self.calls = 0
+
+    def _latest(self, cinema_id):
+        try:
+            names = sorted(name for name in os.listdir(os.path.join(self.path, cinema_id)) if name.endswith('.json'))
+        except OSError:
+            return None
+        return names[-1][:-len('.json')] if names else None
+
+    def get_showtime(self, cinema_id, date_str):
+        self.calls += 1
+        recorded = date_str
+        if not os.path.exists(_fixture_path(self.path, cinema_id, date_str)):
+            recorded = self._latest(cinema_id) if self.rebase else None
+            if recorded is None:
+                return []
+        with open(_fixture_path(self.path, cinema_id, recorded), encoding='utf-8') as f:
+            text = f.read()
+        if recorded != date_str:
+            text = text.replace(recorded + 'T', date_str + 'T')
+        return json.loads(text)
+
+    def get_movies(self, cinema_id, date_str):
+        return []
+
+
+class RecordingAllocineClient:
+    """Enveloppe un client réel et enregistre chaque réponse get_showtime en fixture."""
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+
+    def get_showtime(self, cinema_id, date_str):
+        showtimes = self.client.get_showtime(cinema_id, date_str)
+        target = _fixture_path(self.path, cinema_id, date_str)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(showtimes or [], f, ensure_ascii=False)
+        os.replace(target + '.tmp', target)
+        return showtimes
+
+    def get_movies(self, cinema_id, date_str):
+        return self.client.get_movies(cinema_id, date_str)
+
+
+# ============================================================================
+# SÉANCES
+# ============================================================================
+
+def parse_starts_at(starts_at):
+    """datetime d'une séance Allociné (« 2024-03-08T14:00:00 »), None si illisible."""
+    try:
+        return datetime.fromisoformat(starts_at[:19])
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_showtimes(shows, cinema_id, date_str):
+    """Réponse get_showtime → films {title, runtime, genres, showtimes, duration}."""
+    all_movies = {}
+    for show in shows or []:
+        title = show.get('title', 'Film')
+        show_times = show.get('showtimes', [])
+        parsed = []
+
+        if show_times:
+            for st in show_times:
+                version = 'VF' if st.get('diffusionVersion', '') == 'LOCAL' else 'VO'
+                parsed.append((st.get('startsAt', ''), version))
+        else:
+            for version in SHOWTIME_VERSIONS:
+                parsed.extend((f"{date_str}T{t}", version) for t in show.get(version, []))
+
+        movie = all_movies.get(title)
+        if movie is None:
+            movie = all_movies[title] = {
+                'title': title,
+                'runtime': 0,
+                'genres': [],
+                'showtimes': [],
+                'duration': show.get('duration', ''),
+            }
+        for starts_at, version in parsed:
+            start = parse_starts_at(starts_at)
+            if start is not None:
+                movie['showtimes'].append(Showtime(start, version, cinema_id))
+
+    for movie in all_movies.values():
+        movie['showtimes'].sort()
+    return list(all_movies.values())
+
+
+def fetch_cinema_day(client, cinema_id, day):
+    """
+    Films d'un cinéma pour une journée.
+    Retourne None si Allociné n'a pas répondu (journée à redemander).
+    """
+    date_str = day.strftime("%Y-%m-%d")
+    try:
+        showtimes = client.get_showtime(cinema_id, date_str)
+    except Exception as e:
+        print(f"      ⚠️ get_showtime({cinema_id}, {date_str}) failed: {e}")
+        return None
+
+    movies = parse_showtimes(showtimes, cinema_id, date_str)
+    if movies:
+        return movies
+
+    try:
+        movies = client.get_movies(cinema_id, date_str)
+        if movies:
+            # Films sans séances détaillées
+            return [dict(movie, showtimes=[]) for movie in movies]
+    except Exception:
+        pass
+    return []
@@ -4,20 +4,52 @@ GEDEON Interface Utilisateur - Lecture Seule
 Serveur minimal pour consultation de la base (pas d'écriture sauf inscription)
 """
 
-from flask import Flask, request, jsonify, send_from_directory, session, redirect
+from flask import Flask, request, jsonify, send_from_directory, session, redirect, g
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from functools import wraps
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.errors import UniqueViolation, DuplicatePreparedStatement
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from psycopg2.extensions import TRANSACTION_STATUS_UNKNOWN
 import os
 import re
-import math
 import json
 import time
+import gzip
 import base64
-from datetime import datetime, timedelta, date
+import atexit
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta, date, timezone
 from urllib.parse import urlparse
 from werkzeug.security import generate_password_hash, check_password_hash
+from migrations import ensure_schema
+from reference_data import load_cinemas_table, load_salons_table, NearbyCinema, DepartmentIndex, TextIndex
+from allocine_client import get_client, fetch_cinema_day, SHOWTIME_VERSIONS
+from showtime_store import create_store
+from department_mapping import get_all_dept_ids_for_location, fold_name, haversine_km
+from session_store import (
+    ServerSideSessionInterface,
+    MemoryBackend,
+    SQLiteBackend,
+    PostgresBackend,
+    CachedBackend,
+)
+import metrics
+
+# Encodeur JSON rapide et compression brotli (optionnels)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # Module d'authentification email
 try:
@@ -27,6 +59,8 @@ try:
         send_password_reset_email,
         is_valid_email,
         is_token_expired,
+        configure_outbox,
+        start_outbox_sender,
         TOKEN_EXPIRY_HOURS
     )
     AUTH_EMAIL_AVAILABLE = True
@@ -39,8 +73,47 @@ except ImportError:
 # CONFIGURATION
 # ============================================================================
 
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Fournisseur JSON Flask : orjson si installé, json standard sinon.
+    Dates et datetimes sont sérialisées en ISO 8601 dans les deux cas.
+    Le temps d'encodage de la réponse est noté dans g.json_encode_ms.
+    """
+
+    sort_keys = False
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, (date, datetime)):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+        kwargs.setdefault('default', self.default)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        start = time.perf_counter()
+        if orjson is not None:
+            body = orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS)
+        else:
+            body = self.dumps(obj) + "\n"
+        g.json_encode_ms = (time.perf_counter() - start) * 1000
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
 app = Flask(__name__, static_folder='.', static_url_path='')
-app.config['JSON_SORT_KEYS'] = False
+app.json = FastJSONProvider(app)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'gedeon-user-secret-key-change-in-prod')
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)
 CORS(app, supports_credentials=True)
@@ -63,9 +136,387 @@ else:
     print("⚠️ DATABASE_URL not set")
 
 
+# ============================================================================
+# COMPRESSION & MÉTRIQUES DES RÉPONSES
+# ============================================================================
+
+COMPRESS_MIN_SIZE = 500
+COMPRESS_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript'}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def choose_encoding():
+    """Encodage accepté par le client : br (si brotli installé), sinon gzip, sinon None."""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+@app.after_request
+def compress_response(response):
+    """Compresse les réponses selon Accept-Encoding et mesure taille et temps par endpoint."""
+    endpoint = request.endpoint or 'unknown'
+    encode_ms = g.pop('json_encode_ms', None)
+    if encode_ms is not None:
+        metrics.observe(endpoint, 'encode_ms', encode_ms)
+
+    # Fichiers statiques et réponses en flux : laissés tels quels
+    if response.direct_passthrough or response.is_streamed:
+        return response
+    if response.mimetype not in COMPRESS_MIMETYPES or 'Content-Encoding' in response.headers:
+        return response
+
+    data = response.get_data()
+    metrics.observe(endpoint, 'response_bytes', len(data))
+    response.vary.add('Accept-Encoding')
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    start = time.perf_counter()
+    if encoding == 'br':
+        compressed = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(data, compresslevel=GZIP_LEVEL)
+    metrics.observe(endpoint, 'compress_ms', (time.perf_counter() - start) * 1000)
+    metrics.observe(endpoint, 'compressed_bytes', len(compressed))
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def raw_json_response(payload, key, raw_json):
+    """
+    Réponse JSON construite autour d'un texte JSON déjà encodé (ex. produit
+    par PostgreSQL) : `raw_json` est inséré tel quel sous la clé `key`.
+    """
+    head = app.json.dumps(payload)
+    separator = ',' if payload else ''
+    body = head[:-1] + separator + app.json.dumps(key) + ':' + raw_json + '}'
+    return app.response_class(body, mimetype='application/json')
+
+
+# Taille des paquets de lignes lus sur un curseur serveur et envoyés en flux
+STREAM_ITERSIZE = 500
+
+
+def open_server_side_cursor(conn, query, params=None, name='gedeon_stream'):
+    """
+    Exécute une requête sur un curseur nommé (côté serveur) : les lignes sont
+    ramenées STREAM_ITERSIZE par STREAM_ITERSIZE au fil de l'itération.
+    Les erreurs SQL sont levées ici (DECLARE), avant tout envoi de réponse.
+    """
+    cur = conn.cursor(name=name)
+    cur.itersize = STREAM_ITERSIZE
+    cur.execute(query, params)
+    return cur
+
+
+def stream_json_response(payload, key, rows, encode=None, on_close=None):
+    """
+    Réponse JSON en flux (chunked) : le tableau `key` est encodé au fil de
+    l'itérateur `rows`, envoyé par paquets de STREAM_ITERSIZE éléments, puis
+    le nombre d'éléments est ajouté sous "count". `encode` transforme une
+    ligne en texte JSON (app.json.dumps par défaut) ; `on_close` libère le
+    curseur et la connexion une fois le flux terminé ou interrompu.
+    """
+    encode = encode or app.json.dumps
+    endpoint = request.endpoint or 'unknown'
+    head = app.json.dumps(payload)
+    separator = ',' if payload else ''
+    opening = head[:-1] + separator + app.json.dumps(key) + ':['
+
+    def generate():
+        count = size = 0
+        try:
+            chunk = [opening]
+            for row in rows:
+                chunk.append(',' + encode(row) if count else encode(row))
+                count += 1
+                if len(chunk) >= STREAM_ITERSIZE:
+                    data = ''.join(chunk).encode()
+                    size += len(data)
+                    yield data
+                    chunk = []
+            chunk.append('],"count":%d}' % count)
+            data = ''.join(chunk).encode()
+            size += len(data)
+            yield data
+            metrics.observe(endpoint, 'streamed_rows', count)
+            metrics.observe(endpoint, 'streamed_bytes', size)
+        finally:
+            if on_close:
+                on_close()
+
+    return app.response_class(generate(), mimetype='application/json')
+
+
+# ============================================================================
+# POOL DE CONNEXIONS & REQUÊTES PRÉPARÉES
+# ============================================================================
+
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', 2))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+# Connexion inactive depuis plus longtemps : vérifiée (SELECT 1) avant d'être prêtée
+DB_POOL_PING_IDLE = float(os.environ.get('DB_POOL_PING_IDLE', 30))
+PREPARE_ENABLED = os.environ.get('DB_PREPARE', '1') != '0'
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """
+    Connexion psycopg2 dont close() la rend au pool du worker au lieu de la
+    fermer. Garde la liste des requêtes déjà préparées (PREPARE) sur la session.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        self.prepared = set()
+        self.uses = 0
+        self.returned_at = time.time()
+        self._returning = False
+
+    def close(self):
+        pool = self.pool
+        if pool is None or self._returning or pool.closed or id(self) not in pool._rused:
+            super().close()
+            return
+        # Toujours rendre la connexion au pool (même morte) pour libérer sa place
+        broken = self.closed or self.info.transaction_status == TRANSACTION_STATUS_UNKNOWN
+        self.returned_at = time.time()
+        self._returning = True
+        try:
+            try:
+                pool.putconn(self, close=broken)
+            except psycopg2.Error:
+                # ROLLBACK impossible (serveur perdu) : la connexion est jetée
+                pool.putconn(self, close=True)
+        finally:
+            self._returning = False
+
+
+class WorkerConnectionPool(ThreadedConnectionPool):
+    """
+    Pool psycopg2 ouvrant `minconn` connexions au démarrage mais gardant jusqu'à
+    `maxconn` connexions inactives (psycopg2 fermerait au retour toute connexion
+    au-delà de minconn, et ses requêtes préparées avec elle).
+    """
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self.minconn = self.maxconn
+
+
+_db_pool = None
+_db_pool_pid = None
+_db_pool_lock = threading.Lock()
+
+
+def _get_db_pool():
+    """Pool de connexions du processus (créé à la demande, un par worker après fork)."""
+    global _db_pool, _db_pool_pid
+    if _db_pool_pid != os.getpid():
+        with _db_pool_lock:
+            if _db_pool_pid != os.getpid():
+                _db_pool = WorkerConnectionPool(
+                    DB_POOL_MIN, DB_POOL_MAX,
+                    connection_factory=PooledConnection, cursor_factory=RealDictCursor, **DB_CONFIG
+                )
+                _db_pool_pid = os.getpid()
+    return _db_pool
+
+
+def close_db_pool():
+    """Ferme le pool du processus courant (ex: fin de l'initialisation dans le master gunicorn)."""
+    global _db_pool, _db_pool_pid
+    with _db_pool_lock:
+        if _db_pool is not None and _db_pool_pid == os.getpid() and not _db_pool.closed:
+            _db_pool.closeall()
+        _db_pool = None
+        _db_pool_pid = None
+
+
+def _connection_alive(conn):
+    """
+    Connexion du pool encore utilisable : ouverte, état libpq connu et, si elle
+    est restée inactive plus de DB_POOL_PING_IDLE s (redémarrage de la base,
+    timeout d'inactivité), répondant à un SELECT 1.
+    """
+    if conn.closed or conn.info.transaction_status == TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if time.time() - getattr(conn, 'returned_at', 0) < DB_POOL_PING_IDLE:
+        return True
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
 def get_db_connection():
-    """Crée une connexion à la base PostgreSQL."""
-    return psycopg2.connect(**DB_CONFIG, cursor_factory=RealDictCursor)
+    """Connexion PostgreSQL prise dans le pool du worker (close() la rend au pool)."""
+    pool = _get_db_pool()
+    while True:
+        try:
+            conn = pool.getconn()
+        except PoolError:
+            # Pool épuisé : connexion hors pool, réellement fermée par close()
+            metrics.increment('db_pool', 'overflow')
+            return psycopg2.connect(**DB_CONFIG, connection_factory=PooledConnection, cursor_factory=RealDictCursor)
+        if _connection_alive(conn):
+            break
+        metrics.increment('db_pool', 'discarded')
+        conn.pool = None
+        pool.putconn(conn, close=True)
+    conn.pool = pool
+    conn.uses += 1
+    metrics.increment('db_pool', 'opened' if conn.uses == 1 else 'reused')
+    return conn
+
+
+# Requêtes chaudes : préparées une fois par connexion du pool puis exécutées
+# par nom (EXECUTE). Écrites avec des %s comme le reste du code.
+PREPARED_STATEMENTS = {
+    'login_user': (
+        "SELECT id, pseudo, pseudo_number, email, password_hash, email_confirmed, "
+        "COALESCE(preferences, '{}') as preferences FROM users WHERE email = %s"
+    ),
+    'user_preferences': "SELECT COALESCE(preferences, '{}') as preferences FROM users WHERE id = %s",
+    'pseudo_next_number': (
+        "SELECT last_number + 1 AS next_number FROM pseudo_counters WHERE pseudo_key = LOWER(%s)"
+    ),
+    'scanned_image': "SELECT image_data, image_mime, image_path FROM scanned_events WHERE id = %s",
+}
+
+
+# Requêtes dont le PREPARE a échoué (ex. PostGIS absent) → nom: instant de
+# l'échec ; exécutées en texte SQL sans nouvel essai pendant PREPARE_RETRY_DELAY
+PREPARE_FAILURES = {}
+PREPARE_RETRY_DELAY = 600
+
+
+def _positional_sql(sql):
+    """Convertit les %s d'une requête psycopg2 en $1, $2... pour PREPARE."""
+    parts = sql.replace('%%', '\0').split('%s')
+    return ''.join(
+        part + (f'${i + 1}' if i < len(parts) - 1 else '') for i, part in enumerate(parts)
+    ).replace('\0', '%')
+
+
+def _prepare(cur, name, sql, params):
+    """
+    PREPARE de la requête sur la connexion (sous savepoint : un échec ne casse
+    pas la transaction en cours), puis mesure du temps de planification via
+    EXPLAIN EXECUTE. Retourne False si la préparation échoue.
+    """
+    start = time.perf_counter()
+    cur.execute("SAVEPOINT gedeon_prepare")
+    try:
+        cur.execute(f"PREPARE {name} AS {_positional_sql(sql)}")
+    except DuplicatePreparedStatement:
+        # Déjà préparée sur cette session (registre perdu) : utilisable telle quelle
+        cur.execute("ROLLBACK TO SAVEPOINT gedeon_prepare")
+        cur.execute("RELEASE SAVEPOINT gedeon_prepare")
+        return True
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK TO SAVEPOINT gedeon_prepare")
+        cur.execute("RELEASE SAVEPOINT gedeon_prepare")
+        print(f"⚠️ PREPARE {name} impossible (texte SQL pendant {PREPARE_RETRY_DELAY}s): {e}")
+        PREPARE_FAILURES[name] = time.time()
+        return False
+    metrics.observe('sql:' + name, 'prepare_ms', (time.perf_counter() - start) * 1000)
+
+    # Les requêtes préparées ne sont pas transactionnelles : un échec ici
+    # n'annule pas le PREPARE
+    try:
+        placeholders = ', '.join(['%s'] * len(params))
+        cur.execute(f"EXPLAIN (SUMMARY) EXECUTE {name} ({placeholders})" if params
+                    else f"EXPLAIN (SUMMARY) EXECUTE {name}", params)
+        for row in cur.fetchall():
+            line = next(iter(row.values()))
+            if line.startswith('Planning Time:'):
+                metrics.observe('sql:' + name, 'planning_ms', float(line.split()[2]))
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK TO SAVEPOINT gedeon_prepare")
+        print(f"⚠️ EXPLAIN {name} impossible: {e}")
+    cur.execute("RELEASE SAVEPOINT gedeon_prepare")
+    return True
+
+
+def execute_prepared(cur, name, params=()):
+    """
+    Exécute une requête de PREPARED_STATEMENTS : EXECUTE par nom si elle est
+    (ou peut être) préparée sur cette connexion, texte SQL complet sinon.
+    """
+    sql = PREPARED_STATEMENTS[name]
+    conn = cur.connection
+    prepared = getattr(conn, 'prepared', None)
+    failed_at = PREPARE_FAILURES.get(name)
+    recently_failed = failed_at is not None and time.time() - failed_at < PREPARE_RETRY_DELAY
+    if not PREPARE_ENABLED or prepared is None or conn.autocommit or recently_failed:
+        metrics.increment('sql:' + name, 'unprepared')
+        cur.execute(sql, params)
+        return
+    if name not in prepared:
+        if not _prepare(cur, name, sql, params):
+            metrics.increment('sql:' + name, 'unprepared')
+            cur.execute(sql, params)
+            return
+        prepared.add(name)
+    metrics.increment('sql:' + name, 'executions')
+    placeholders = ', '.join(['%s'] * len(params))
+    cur.execute(f"EXECUTE {name} ({placeholders})" if params else f"EXECUTE {name}", params)
+
+
+# Sessions côté serveur : le cookie ne transporte qu'un identifiant opaque.
+# SESSION_BACKEND = postgres | sqlite | memory | cookie (cookie signé Flask d'origine)
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND') or ('postgres' if DB_CONFIG else 'memory')
+# Cache LRU local devant le backend partagé, invalidé à l'écriture dans le
+# worker ; une déconnexion faite par un autre worker y est vue après au plus
+# SESSION_CACHE_TTL secondes (0 = pas de cache).
+SESSION_CACHE_TTL = int(os.environ.get('SESSION_CACHE_TTL', 5))
+
+
+def cached_session_backend(backend):
+    """Backend partagé précédé du cache LRU local (si SESSION_CACHE_TTL > 0)."""
+    if SESSION_CACHE_TTL <= 0:
+        return backend
+    return CachedBackend(backend, MemoryBackend(max_age=SESSION_CACHE_TTL))
+
+
+if SESSION_BACKEND == 'postgres':
+    app.session_interface = ServerSideSessionInterface(cached_session_backend(PostgresBackend(get_db_connection)))
+elif SESSION_BACKEND == 'sqlite':
+    app.session_interface = ServerSideSessionInterface(cached_session_backend(
+        SQLiteBackend(os.environ.get('SESSION_SQLITE_PATH', 'sessions.sqlite3'))))
+elif SESSION_BACKEND == 'memory':
+    app.session_interface = ServerSideSessionInterface(MemoryBackend())
+print(f"✅ Sessions: {SESSION_BACKEND}")
+
+# File d'emails persistante (table email_outbox) : un worker tué ne perd pas
+# ses envois, le thread d'envoi d'un worker les reprend au démarrage.
+if AUTH_EMAIL_AVAILABLE and DB_CONFIG:
+    configure_outbox(get_db_connection)
+
+    @app.before_request
+    def ensure_email_sender():
+        start_outbox_sender()
+
+# Séances Allociné persistantes (job ingest_showtimes.py), lues avant l'API.
+# SHOWTIMES_STORE = postgres | sqlite | none
+SHOWTIMES_STORE = os.environ.get('SHOWTIMES_STORE') or ('postgres' if DB_CONFIG else 'none')
+SHOWTIME_STORE = create_store(SHOWTIMES_STORE, get_connection=get_db_connection,
+                              sqlite_path=os.environ.get('SHOWTIMES_SQLITE_PATH'))
 
 
 # ============================================================================
@@ -76,44 +527,100 @@ RADIUS_KM_DEFAULT = 21
 DAYS_AHEAD_DEFAULT = 10
 
 CINEMAS_ALLOCINE_DATA = []
+CINEMAS_DEPT_INDEX = None
+CINEMAS_TEXT_INDEX = None
+# Séances par (cinema_id, date) : chaque journée est récupérée une fois et
+# conservée jusqu'à ce qu'elle soit passée
 FILMS_CACHE = {}
-FILMS_CACHE_TTL = 3600  # 1 heure
+CINEMA_DAYS_DEFAULT = 2  # aujourd'hui et demain
+CINEMA_DAYS_MAX = 7
+# Journées en échec côté Allociné (cinema_id, date) → instant de l'échec :
+# non redemandées pendant FILMS_FAILURE_TTL, jamais écrites dans le store
+FILMS_FAILURES = {}
+FILMS_FAILURE_TTL = 300  # 5 minutes
+# Workers gthread : FILMS_CACHE et FILMS_FAILURES ne sont lus, écrits et
+# purgés que sous ce verrou (jamais pendant un appel réseau)
+_films_lock = threading.Lock()
 
 SALONS_DATA = []
+SALONS_TEXT_INDEX = None
+
+# Recherche : score = pertinence / (1 + distance / échelle) / (1 + jours avant l'événement / échelle)
+SEARCH_DISTANCE_SCALE_KM = 20
+SEARCH_DATE_SCALE_DAYS = 14
+SEARCH_LIMIT_DEFAULT = 50
+SEARCH_LIMIT_MAX = 200
+
+# Attribution des numéros de pseudo (table pseudo_counters)
+PSEUDO_UNIQUE_CONSTRAINT = 'users_pseudo_pseudo_number_key'
+PSEUDO_ALLOCATION_RETRIES = 3
+
+# Hachage des mots de passe hors du thread de requête
+PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'  # paramètres courants (rehash transparent au login)
+HASH_POOL_SIZE = int(os.environ.get('HASH_POOL_SIZE', '2'))
+HASH_QUEUE_MAX = int(os.environ.get('HASH_QUEUE_MAX', '8'))  # calculs en cours/en attente par worker
+HASH_TIMEOUT = 10  # secondes
+
+# Limitation des tentatives de connexion (fenêtre glissante)
+LOGIN_WINDOW = 300  # 5 minutes
+LOGIN_MAX_ATTEMPTS_PER_IP = 20
+LOGIN_MAX_FAILURES_PER_EMAIL = 5
+
+# Préférences utilisateur : cache LRU borné par processus, mis à jour à
+# l'enregistrement ; un autre worker les voit après au plus PREFERENCES_CACHE_TTL s
+PREFERENCES_CACHE_TTL = int(os.environ.get('PREFERENCES_CACHE_TTL', 30))
+PREFERENCES_CACHE = MemoryBackend(max_entries=10000)  # user_id → préférences
+
+# Écriture différée de users.last_seen
+LAST_SEEN_FLUSH_INTERVAL = int(os.environ.get('LAST_SEEN_FLUSH_INTERVAL', '60'))  # secondes
 
 # Mots-clés par centre d'intérêt pour le scoring de pertinence
 INTEREST_KEYWORDS = {
-    'sport': ['sport', 'sportif', 'marathon', 'course', 'football', 'basketball',
-              'tennis', 'rugby', 'natation', 'cyclisme', 'athlétisme', 'tournoi', 'compétition'],
-    'musique': ['concert', 'musique', 'musical', 'festival', 'orchestre', 'jazz',
-                'rock', 'pop', 'electro', 'chanson', 'chorale', 'opéra', 'récital'],
-    'arts': ['art', 'exposition', 'théâtre', 'musée', 'danse', 'peinture',
-             'sculpture', 'galerie', 'spectacle', 'cirque'],
-    'festivals': ['festival', 'fête', 'célébration', 'carnaval', 'foire'],
-    'gastro': ['gastronomie', 'dégustation', 'marché', 'culinaire', 'cuisine',
-               'vin', 'bière', 'food', 'chocolat'],
-    'nature': ['nature', 'randonnée', 'environnement', 'jardins', 'écologie',
-               'plein air', 'forêt', 'parc'],
-    'business': ['salon', 'conférence', 'professionnel', 'forum', 'networking',
-                 'entrepreneuriat', 'startup', 'business'],
-    'famille': ['famille', 'enfant', 'kid', 'jeunesse', 'parents', 'scolaire'],
-    'bienetre': ['bien-être', 'yoga', 'méditation', 'santé', 'spa', 'relaxation'],
-    'tech': ['technologie', 'numérique', 'innovation', 'informatique', 'digital',
-             'intelligence artificielle', 'tech', 'hackathon'],
-    'mode': ['mode', 'fashion', 'design', 'couture', 'styliste', 'défilé'],
-    'nightlife': ['soirée', 'club', 'nuit', 'discothèque', 'bal'],
-    'patrimoine': ['patrimoine', 'histoire', 'monument', 'historique', 'château',
-                   'abbaye', 'cathédrale'],
-    'cinema': ['cinéma', 'film', 'cinématographique'],
-    'communaute': ['communauté', 'bénévolat', 'solidarité', 'association'],
-    'education': ['conférence', 'formation', 'atelier', 'workshop', 'séminaire', 'cours'],
-    'religion': ['religion', 'spiritualité', 'foi', 'église', 'mosquée', 'temple'],
+    'sport': ('sport', 'sportif', 'marathon', 'course', 'football', 'basketball',
+              'tennis', 'rugby', 'natation', 'cyclisme', 'athlétisme', 'tournoi', 'compétition'),
+    'musique': ('concert', 'musique', 'musical', 'festival', 'orchestre', 'jazz',
+                'rock', 'pop', 'electro', 'chanson', 'chorale', 'opéra', 'récital'),
+    'arts': ('art', 'exposition', 'théâtre', 'musée', 'danse', 'peinture',
+             'sculpture', 'galerie', 'spectacle', 'cirque'),
+    'festivals': ('festival', 'fête', 'célébration', 'carnaval', 'foire'),
+    'gastro': ('gastronomie', 'dégustation', 'marché', 'culinaire', 'cuisine',
+               'vin', 'bière', 'food', 'chocolat'),
+    'nature': ('nature', 'randonnée', 'environnement', 'jardins', 'écologie',
+               'plein air', 'forêt', 'parc'),
+    'business': ('salon', 'conférence', 'professionnel', 'forum', 'networking',
+                 'entrepreneuriat', 'startup', 'business'),
+    'famille': ('famille', 'enfant', 'kid', 'jeunesse', 'parents', 'scolaire'),
+    'bienetre': ('bien-être', 'yoga', 'méditation', 'santé', 'spa', 'relaxation'),
+    'tech': ('technologie', 'numérique', 'innovation', 'informatique', 'digital',
+             'intelligence artificielle', 'tech', 'hackathon'),
+    'mode': ('mode', 'fashion', 'design', 'couture', 'styliste', 'défilé'),
+    'nightlife': ('soirée', 'club', 'nuit', 'discothèque', 'bal'),
+    'patrimoine': ('patrimoine', 'histoire', 'monument', 'historique', 'château',
+                   'abbaye', 'cathédrale'),
+    'cinema': ('cinéma', 'film', 'cinématographique'),
+    'communaute': ('communauté', 'bénévolat', 'solidarité', 'association'),
+    'education': ('conférence', 'formation', 'atelier', 'workshop', 'séminaire', 'cours'),
+    'religion': ('religion', 'spiritualité', 'foi', 'église', 'mosquée', 'temple'),
+}
+
+# Mapping catégories DATAtourisme → intérêts Gedeon
+DT_CATEGORY_MAP = {
+    'musique':   ('concert', 'musicevent', 'musicfestival'),
+    'sport':     ('sportsevent', 'sportscompetition', 'sportsleisure'),
+    'arts':      ('culturalevent', 'exhibition', 'theaterperformance', 'danceperformance', 'showperformance'),
+    'festivals': ('festival', 'entertain'),
+    'gastro':    ('foodestablishment', 'wineestate', 'market'),
+    'nature':    ('naturalheritage', 'park', 'garden'),
+    'business':  ('conference', 'trade', 'businessevent'),
+    'cinema':    ('screeningevent', 'film'),
+    'education': ('educationandscience', 'workshop'),
+    'bienetre':  ('wellbeing', 'sport', 'leisuresport'),
 }
 
 # Source préférée par intérêt
 INTEREST_SOURCES = {
-    'cinema': ['Allocine'],
-    'business': ['EventsEye'],
+    'cinema': ('Allocine',),
+    'business': ('EventsEye',),
 }
 
 # Correspondance préférence distance → rayon km
@@ -129,39 +636,30 @@ DISTANCE_TO_KM = {
 # FONCTIONS UTILITAIRES (géo, data loading)
 # ============================================================================
 
-def haversine_km(lat1, lon1, lat2, lon2):
-    """Distance en km entre deux points GPS."""
-    R = 6371.0
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda/2)**2
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+def memory_stats():
+    """Mémoire du processus courant en Ko (RSS, PSS, partagée/privée) depuis /proc."""
+    stats = {'pid': os.getpid()}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty'):
+                    stats[key.lower()] = int(value.split()[0])
+    except OSError:
+        import resource
+        stats['rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return stats
 
 
 def load_cinemas_allocine():
-    """Charge la base complète des cinémas Allociné avec GPS."""
-    global CINEMAS_ALLOCINE_DATA
-
-    def fix_encoding(text):
-        if not isinstance(text, str):
-            return text
-        try:
-            return text.encode('latin-1').decode('utf-8')
-        except (UnicodeDecodeError, UnicodeEncodeError):
-            return text
-
+    """Charge la base complète des cinémas Allociné avec GPS (snapshot mmap)."""
+    global CINEMAS_ALLOCINE_DATA, CINEMAS_DEPT_INDEX, CINEMAS_TEXT_INDEX
     try:
-        allocine_file = os.path.join(os.path.dirname(__file__), 'cinemas_france_data.json')
-        if os.path.exists(allocine_file):
-            with open(allocine_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            for cinema in data:
-                if 'name' in cinema:
-                    cinema['name'] = fix_encoding(cinema['name'])
-                if 'address' in cinema:
-                    cinema['address'] = fix_encoding(cinema['address'])
-            CINEMAS_ALLOCINE_DATA = data
+        table = load_cinemas_table()
+        if table is not None:
+            CINEMAS_ALLOCINE_DATA = table
+            CINEMAS_DEPT_INDEX = DepartmentIndex(table)
+            CINEMAS_TEXT_INDEX = TextIndex(table, ('name', 'address', 'city'))
             print(f"✅ Cinémas Allociné chargés: {len(CINEMAS_ALLOCINE_DATA)}")
         else:
             print("⚠️ Fichier cinemas_france_data.json non trouvé")
@@ -170,64 +668,20 @@ def load_cinemas_allocine():
 
 
 def load_salons_data():
-    """Charge les données des salons depuis le fichier JSON."""
-    global SALONS_DATA
+    """Charge les données des salons (snapshot mmap)."""
+    global SALONS_DATA, SALONS_TEXT_INDEX
     try:
-        salons_file = os.path.join(os.path.dirname(__file__), 'salons_france.json')
-        if os.path.exists(salons_file):
-            with open(salons_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            if isinstance(data, list):
-                SALONS_DATA = data
-            elif isinstance(data, dict) and 'events' in data:
-                SALONS_DATA = data['events']
-            else:
-                SALONS_DATA = []
-            if SALONS_DATA and not isinstance(SALONS_DATA[0], dict):
-                SALONS_DATA = []
-            else:
-                print(f"✅ Salons chargés: {len(SALONS_DATA)}")
+        table = load_salons_table()
+        if table is not None:
+            SALONS_DATA = table
+            SALONS_TEXT_INDEX = TextIndex(table, ('name', 'city', 'venue'))
+            print(f"✅ Salons chargés: {len(SALONS_DATA)}")
         else:
             print("⚠️ Fichier salons_france.json non trouvé")
     except Exception as e:
         print(f"❌ Erreur chargement salons: {e}")
 
 
-def parse_salon_date(date_str):
-    """Parse une date de salon (formats: DD/MM/YYYY ou 'mois YYYY')."""
-    if not date_str:
-        return None
-    try:
-        if '/' in date_str:
-            return datetime.strptime(date_str, '%d/%m/%Y').date()
-
-        MOIS = {
-            'janv': 1, 'janvier': 1,
-            'fév': 2, 'fevr': 2, 'février': 2, 'fevrier': 2,
-            'mars': 3,
-            'avril': 4, 'avr': 4,
-            'mai': 5,
-            'juin': 6,
-            'juil': 7, 'juillet': 7,
-            'août': 8, 'aout': 8,
-            'sept': 9, 'septembre': 9,
-            'oct': 10, 'octobre': 10,
-            'nov': 11, 'novembre': 11,
-            'déc': 12, 'dec': 12, 'décembre': 12, 'decembre': 12
-        }
-
-        date_lower = date_str.lower().replace('.', '').strip()
-        for mois_str, mois_num in MOIS.items():
-            if mois_str in date_lower:
-                year_match = re.search(r'(\d{4})', date_str)
-                if year_match:
-                    year = int(year_match.group(1))
-                    return datetime(year, mois_num, 1).date()
-        return None
-    except Exception:
-        return None
-
-
 def score_event(event, preferences):
     """Score de pertinence d'un événement selon les préférences utilisateur (0-10)."""
     if not preferences:
@@ -245,41 +699,51 @@ def score_event(event, preferences):
     dt_cats = event.get('categories') or []
     dt_cats_str = ' '.join(dt_cats).lower()
 
-    # Mapping catégories DATAtourisme → intérêts Gedeon
-    DT_CATEGORY_MAP = {
-        'musique':   ['concert', 'musicevent', 'musicfestival'],
-        'sport':     ['sportsevent', 'sportscompetition', 'sportsleisure'],
-        'arts':      ['culturalevent', 'exhibition', 'theaterperformance', 'danceperformance', 'showperformance'],
-        'festivals': ['festival', 'entertain'],
-        'gastro':    ['foodestablishment', 'wineestate', 'market'],
-        'nature':    ['naturalheritage', 'park', 'garden'],
-        'business':  ['conference', 'trade', 'businessevent'],
-        'cinema':    ['screeningevent', 'film'],
-        'education': ['educationandscience', 'workshop'],
-        'bienetre':  ['wellbeing', 'sport', 'leisuresport'],
-    }
 
     for interest in interests:
         # Score par mots-clés titre/description
-        for kw in INTEREST_KEYWORDS.get(interest, []):
+        for kw in INTEREST_KEYWORDS.get(interest, ()):
             if kw in text:
                 score += 2
                 break
         # Score par catégories DATAtourisme (bonus +3 car plus fiable que les mots-clés)
-        for cat_kw in DT_CATEGORY_MAP.get(interest, []):
+        for cat_kw in DT_CATEGORY_MAP.get(interest, ()):
             if cat_kw in dt_cats_str:
                 score += 3
                 break
         # Score par source
-        if source in INTEREST_SOURCES.get(interest, []):
+        if source in INTEREST_SOURCES.get(interest, ()):
             score += 2
 
     return min(score, 10)
 
 
+def cache_user_preferences(user_id, preferences):
+    """Met à jour le cache des préférences d'un utilisateur (lecture ou enregistrement)."""
+    PREFERENCES_CACHE.set(user_id, preferences or {}, time.time() + PREFERENCES_CACHE_TTL)
+
+
 def get_user_preferences():
-    """Récupère les préférences de l'utilisateur connecté depuis la session."""
-    return session.get('user_preferences') or {}
+    """Préférences de l'utilisateur connecté (cache LRU du processus, sinon PostgreSQL)."""
+    user_id = session.get('user_id')
+    if not user_id:
+        return {}
+    cached = PREFERENCES_CACHE.get(user_id)
+    if cached is not None:
+        return cached[0]
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        execute_prepared(cur, 'user_preferences', (user_id,))
+        row = cur.fetchone()
+        cur.close()
+        conn.close()
+        preferences = row['preferences'] if row else {}
+    except Exception as e:
+        print(f"⚠️ Chargement préférences user_id={user_id}: {e}")
+        return {}
+    cache_user_preferences(user_id, preferences)
+    return preferences
 
 
 def get_default_radius_from_prefs(preferences):
@@ -290,18 +754,128 @@ def get_default_radius_from_prefs(preferences):
     return DISTANCE_TO_KM.get(dist_pref, RADIUS_KM_DEFAULT)
 
 
-def _haversine_km(lat1, lon1, lat2, lon2):
-    """Distance en km entre deux points GPS."""
-    from math import radians, sin, cos, sqrt, atan2
-    R = 6371
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-    return R * 2 * atan2(sqrt(a), sqrt(1-a))
+def cinema_candidates(center_lat, center_lon, radius_km):
+    """
+    Indices des cinémas à tester : départements à portée de ceux qui contiennent
+    le point (table des voisinages), ou toute la table à défaut.
+    """
+    if CINEMAS_DEPT_INDEX is not None:
+        candidates = CINEMAS_DEPT_INDEX.candidates(center_lat, center_lon, radius_km)
+        if candidates is not None:
+            return candidates
+    return range(len(CINEMAS_ALLOCINE_DATA))
+
+
+# Événements DATAtourisme à proximité (PostGIS), mis en forme en JSON par
+# PostgreSQL : renommages, URL extraite des contacts, dates ISO, distance
+# arrondie. Paramètres : lon, lat, lon, lat, rayon (m), date limite x2.
+DATATOURISME_NEARBY_SQL = """
+    WITH nearby_events AS (
+        SELECT uri, nom, description, date_debut, date_fin,
+               latitude, longitude, adresse, commune, code_postal, contacts, image, categories,
+               ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) / 1000 AS distance_km
+        FROM evenements
+        WHERE ST_DWithin(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, %s)
+          AND (
+              (date_fin IS NOT NULL AND date_fin >= CURRENT_DATE AND date_debut <= %s)
+              OR
+              (date_fin IS NULL AND date_debut >= CURRENT_DATE AND date_debut <= %s)
+          )
+        LIMIT 500
+    )
+    SELECT json_build_object(
+               'uid', uri, 'title', nom, 'description', description,
+               'begin', date_debut, 'end', date_fin,
+               'latitude', latitude, 'longitude', longitude,
+               'address', adresse, 'city', commune, 'zipcode', code_postal,
+               'contacts', contacts, 'image', image, 'categories', categories,
+               'distanceKm', ROUND(distance_km::numeric, 1),
+               'locationName', commune,
+               'source', 'DATAtourisme', 'agendaTitle', 'DATAtourisme',
+               'openagendaUrl', CASE WHEN contacts LIKE '%%#%%'
+                                     THEN COALESCE(SUBSTRING('#' || contacts FROM '#(http[^#]*)'), '')
+                                     ELSE '' END,
+               'relevanceScore', 0
+           ) AS event, distance_km, date_debut
+    FROM nearby_events
+"""
+
+# Même ordre que le tri Python de /api/events/nearby (scores nuls) :
+# distance arrondie (0.0 classée comme 999, `distanceKm or 999`), puis début
+# (sans date en tête, `begin or ""`), puis distance exacte.
+DATATOURISME_NEARBY_ORDER = (
+    "COALESCE(NULLIF(ROUND(distance_km::numeric, 1), 0), 999), date_debut NULLS FIRST, distance_km"
+)
+
+
+PREPARED_STATEMENTS['datatourisme_nearby_json'] = (
+    "SELECT COALESCE(json_agg(event ORDER BY " + DATATOURISME_NEARBY_ORDER + "), '[]')::text AS events, "
+    "COUNT(*) AS count FROM (" + DATATOURISME_NEARBY_SQL + ") AS nearby"
+)
+
+
+def datatourisme_nearby_params(center_lat, center_lon, radius_km, days_ahead):
+    """Paramètres de DATATOURISME_NEARBY_SQL."""
+    date_limite = datetime.now().date() + timedelta(days=days_ahead)
+    return (center_lon, center_lat, center_lon, center_lat, radius_km * 1000, date_limite, date_limite)
+
+
+def fetch_datatourisme_events_json(center_lat, center_lon, radius_km, days_ahead):
+    """
+    Événements DATAtourisme mis en forme par PostgreSQL (PostGIS) : renvoie
+    (texte JSON du tableau d'événements trié par distance, nombre), ou None
+    si la requête PostGIS échoue.
+    """
+    try:
+        start_time = time.time()
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            execute_prepared(cur, 'datatourisme_nearby_json',
+                             datatourisme_nearby_params(center_lat, center_lon, radius_km, days_ahead))
+            row = cur.fetchone()
+            cur.close()
+        finally:
+            conn.close()
+        print(f"   ⚡ DATAtourisme (JSON SQL): {row['count']} événements en {time.time()-start_time:.3f}s")
+        return row['events'], row['count']
+    except Exception as e:
+        print(f"   ⚠️ DATAtourisme JSON SQL indisponible: {e}")
+        return None
+
+
+def stream_datatourisme_events(payload, center_lat, center_lon, radius_km, days_ahead):
+    """
+    Réponse en flux des événements DATAtourisme (triés par distance) lus sur
+    un curseur serveur : le JSON de chaque ligne, produit par PostgreSQL, est
+    recopié tel quel. None si la requête PostGIS échoue.
+    """
+    conn = get_db_connection()
+    try:
+        cur = open_server_side_cursor(
+            conn,
+            "SELECT event::text AS event FROM (" + DATATOURISME_NEARBY_SQL + ") AS nearby "
+            "ORDER BY " + DATATOURISME_NEARBY_ORDER,
+            datatourisme_nearby_params(center_lat, center_lon, radius_km, days_ahead)
+        )
+    except Exception as e:
+        conn.close()
+        print(f"   ⚠️ DATAtourisme flux SQL indisponible: {e}")
+        return None
+
+    def close():
+        cur.close()
+        conn.close()
+
+    return stream_json_response(payload, "events", (row['event'] for row in cur),
+                                encode=lambda text: text, on_close=close)
 
 
 def fetch_datatourisme_events(center_lat, center_lon, radius_km, days_ahead):
-    """Récupère les événements DATAtourisme depuis PostgreSQL."""
+    """
+    Événements DATAtourisme sans PostGIS (repli de fetch_datatourisme_events_json) :
+    bounding box en SQL puis filtre Haversine en Python.
+    """
     try:
         start_time = time.time()
         conn = get_db_connection()
@@ -309,74 +883,38 @@ def fetch_datatourisme_events(center_lat, center_lon, radius_km, days_ahead):
 
         date_limite = datetime.now().date() + timedelta(days=days_ahead)
 
-        # Essayer avec PostGIS, sinon fallback sans geom
-        try:
-            query = """
-                WITH nearby_events AS (
-                    SELECT uri, nom, description, date_debut, date_fin,
-                           latitude, longitude, adresse, commune, code_postal, contacts, image, categories, geom
-                    FROM evenements
-                    WHERE ST_DWithin(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, %s)
-                      AND (
-                          (date_fin IS NOT NULL AND date_fin >= CURRENT_DATE AND date_debut <= %s)
-                          OR
-                          (date_fin IS NULL AND date_debut >= CURRENT_DATE AND date_debut <= %s)
-                      )
-                    LIMIT 500
-                )
-                SELECT uri as uid, nom as title, description,
-                       date_debut as begin, date_fin as end,
-                       latitude, longitude, adresse as address, commune as city,
-                       code_postal as zipcode, contacts, image, categories,
-                       ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) / 1000 as "distanceKm"
-                FROM nearby_events
-                ORDER BY "distanceKm", date_debut
-            """
-            cur.execute(query, (center_lon, center_lat, radius_km * 1000, date_limite, date_limite, center_lon, center_lat))
-            rows = cur.fetchall()
-        except Exception:
-            # Fallback sans PostGIS : bounding box large + filtre Haversine Python
-            conn.rollback()
-            deg = radius_km / 111.0
-            query_fallback = """
-                SELECT uri as uid, nom as title, description,
-                       date_debut as begin, date_fin as end,
-                       latitude, longitude, adresse as address, commune as city,
-                       code_postal as zipcode, contacts, image, categories
-                FROM evenements
-                WHERE latitude BETWEEN %s AND %s
-                  AND longitude BETWEEN %s AND %s
-                  AND (
-                      (date_fin IS NOT NULL AND date_fin >= CURRENT_DATE AND date_debut <= %s)
-                      OR
-                      (date_fin IS NULL AND date_debut >= CURRENT_DATE AND date_debut <= %s)
-                      OR date_debut IS NULL
-                  )
-                LIMIT 500
-            """
-            cur.execute(query_fallback, (
-                center_lat - deg, center_lat + deg,
-                center_lon - deg, center_lon + deg,
-                date_limite, date_limite
-            ))
-            rows = cur.fetchall()
+        deg = radius_km / 111.0
+        query_fallback = """
+            SELECT uri as uid, nom as title, description,
+                   date_debut as begin, date_fin as end,
+                   latitude, longitude, adresse as address, commune as city,
+                   code_postal as zipcode, contacts, image, categories
+            FROM evenements
+            WHERE latitude BETWEEN %s AND %s
+              AND longitude BETWEEN %s AND %s
+              AND (
+                  (date_fin IS NOT NULL AND date_fin >= CURRENT_DATE AND date_debut <= %s)
+                  OR
+                  (date_fin IS NULL AND date_debut >= CURRENT_DATE AND date_debut <= %s)
+                  OR date_debut IS NULL
+              )
+            LIMIT 500
+        """
+        cur.execute(query_fallback, (
+            center_lat - deg, center_lat + deg,
+            center_lon - deg, center_lon + deg,
+            date_limite, date_limite
+        ))
+        rows = cur.fetchall()
 
         events = []
         for row in rows:
             event = dict(row)
-            if event.get('begin'):
-                event['begin'] = event['begin'].isoformat()
-            if event.get('end'):
-                event['end'] = event['end'].isoformat()
-            # Calcul distance si pas fourni par PostGIS
-            if 'distanceKm' not in event or event.get('distanceKm') is None:
-                lat = event.get('latitude') or event.get('lat')
-                lon = event.get('longitude') or event.get('lon')
-                if lat and lon:
-                    event['distanceKm'] = round(_haversine_km(center_lat, center_lon, float(lat), float(lon)), 1)
-            else:
-                event['distanceKm'] = round(event['distanceKm'], 1)
-            # Filtrer par rayon réel si fallback
+            lat = event.get('latitude')
+            lon = event.get('longitude')
+            if lat and lon:
+                event['distanceKm'] = round(haversine_km(center_lat, center_lon, float(lat), float(lon)), 1)
+            # Filtrer par rayon réel
             if event.get('distanceKm') is not None and event['distanceKm'] > radius_km:
                 continue
             event['locationName'] = event.get('city', '')
@@ -400,88 +938,200 @@ def fetch_datatourisme_events(center_lat, center_lon, radius_km, days_ahead):
         return []
 
 
-def fetch_movies_for_cinema(cinema_info, today_str, tomorrow_str=None):
-    """Récupère les films d'un cinéma via Allociné."""
+# Horaires affichés par version et par jour
+SHOWTIMES_DISPLAY_MAX = 3
+
+
+def fetch_movies_for_cinema(cinema_info, day):
+    """
+    Récupère les films d'un cinéma pour une journée via Allociné (séances typées, triées).
+    Films = None si Allociné n'a pas répondu (journée à redemander).
+    """
     try:
-        from allocineAPI.allocineAPI import allocineAPI
-        api = allocineAPI()
-        cinema_id = cinema_info['id']
-        all_movies = {}
+        return cinema_info, fetch_cinema_day(get_client(), cinema_info.id, day)
+    except Exception as e:
+        print(f"      ❌ Erreur cinéma {cinema_info.name}: {e}")
+        return cinema_info, None
+
+
+_films_cache_day = None
 
-        for date_str in [today_str, tomorrow_str] if tomorrow_str else [today_str]:
-            try:
-                showtimes = api.get_showtime(cinema_id, date_str)
-                if showtimes:
-                    is_today = (date_str == today_str)
-                    date_label = "Auj" if is_today else "Dem"
-
-                    for show in showtimes:
-                        title = show.get('title', 'Film')
-                        show_times = show.get('showtimes', [])
-
-                        if show_times:
-                            vf_times = []
-                            vo_times = []
-                            for st in show_times:
-                                starts_at = st.get('startsAt', '')
-                                version = st.get('diffusionVersion', '')
-                                time_part = starts_at.split('T')[1][:5] if 'T' in starts_at else starts_at
-                                if version == 'LOCAL':
-                                    vf_times.append(time_part)
-                                else:
-                                    vo_times.append(time_part)
-                            versions = []
-                            if vf_times:
-                                versions.append(f"VF {date_label}: {', '.join(vf_times[:3])}")
-                            if vo_times:
-                                versions.append(f"VO {date_label}: {', '.join(vo_times[:3])}")
-                            showtimes_str = " | ".join(versions) if versions else ""
-                        else:
-                            vf = show.get('VF', [])
-                            vo = show.get('VO', [])
-                            vost = show.get('VOST', [])
-                            versions = []
-                            if vf:
-                                versions.append(f"VF {date_label}: {', '.join(vf[:3])}")
-                            if vo:
-                                versions.append(f"VO {date_label}: {', '.join(vo[:3])}")
-                            if vost:
-                                versions.append(f"VOST {date_label}: {', '.join(vost[:3])}")
-                            showtimes_str = " | ".join(versions) if versions else ""
-
-                        if title in all_movies:
-                            if showtimes_str:
-                                existing = all_movies[title]['showtimes_str']
-                                if existing:
-                                    all_movies[title]['showtimes_str'] = existing + " | " + showtimes_str
-                                else:
-                                    all_movies[title]['showtimes_str'] = showtimes_str
-                        else:
-                            all_movies[title] = {
-                                'title': title,
-                                'runtime': 0,
-                                'genres': [],
-                                'showtimes_str': showtimes_str,
-                                'duration': show.get('duration', ''),
-                            }
-            except Exception as e:
-                if date_str == today_str:
-                    print(f"      ⚠️ get_showtime({cinema_id}, {date_str}) failed: {e}")
 
-        if all_movies:
-            return cinema_info, list(all_movies.values())
+def purge_films_cache(today):
+    """Retire du cache et de l'index films les journées passées (une fois par jour)."""
+    global _films_cache_day
+    if _films_cache_day == today:
+        return
+    _films_cache_day = today
+    with _films_lock:
+        for key in [key for key in FILMS_CACHE if key[1] < today]:
+            del FILMS_CACHE[key]
+        for key in [key for key in FILMS_FAILURES if key[1] < today]:
+            del FILMS_FAILURES[key]
+    purge_films_index(today)
 
+
+def _recent_failure(key, now):
+    """True si la journée a échoué il y a moins de FILMS_FAILURE_TTL (verrou _films_lock tenu)."""
+    failed_at = FILMS_FAILURES.get(key)
+    if failed_at is None:
+        return False
+    if now - failed_at < FILMS_FAILURE_TTL:
+        return True
+    FILMS_FAILURES.pop(key, None)
+    return False
+
+
+def merge_cinema_films(cinema_id, days):
+    """Films d'un cinéma sur des journées en cache (croissantes), séances fusionnées par titre."""
+    with _films_lock:
+        cached = [FILMS_CACHE.get((cinema_id, day), ()) for day in days]
+    merged = {}
+    for movies in cached:
+        for movie in movies:
+            title = movie.get('title', 'Film')
+            entry = merged.get(title)
+            if entry is None:
+                merged[title] = dict(movie, showtimes=list(movie.get('showtimes', ())))
+            else:
+                entry['showtimes'].extend(movie.get('showtimes', ()))
+    return list(merged.values())
+
+
+def get_cinema_films(cinema, days):
+    """
+    Films d'un cinéma sur les journées demandées : cache mémoire, puis store
+    persistant, puis Allociné pour les seules journées encore absentes (une
+    journée en échec récent est considérée vide, sans nouvel appel).
+    Retourne (films, nombre de journées demandées à Allociné).
+    """
+    now = time.time()
+    with _films_lock:
+        missing = [day for day in days
+                   if (cinema.id, day) not in FILMS_CACHE and not _recent_failure((cinema.id, day), now)]
+    stored = {}
+    if missing and SHOWTIME_STORE is not None:
+        try:
+            stored = SHOWTIME_STORE.get_days(cinema.id, missing)
+        except Exception as e:
+            print(f"      ⚠️ Store séances indisponible: {e}")
+            stored = {}
+        with _films_lock:
+            for day, movies in stored.items():
+                FILMS_CACHE[(cinema.id, day)] = movies
+        missing = [day for day in missing if day not in stored]
+
+    fetched = {}
+    for day in missing:
+        cinema_info, movies = fetch_movies_for_cinema(cinema, day)
+        with _films_lock:
+            if movies is None:
+                FILMS_FAILURES[(cinema.id, day)] = time.time()
+            else:
+                FILMS_FAILURES.pop((cinema.id, day), None)
+                FILMS_CACHE[(cinema.id, day)] = movies
+        if movies is not None:
+            fetched[day] = movies
+    if fetched and SHOWTIME_STORE is not None:
         try:
-            movies = api.get_movies(cinema_id, today_str)
-            if movies:
-                return cinema_info, movies
-        except Exception:
-            pass
+            SHOWTIME_STORE.put_days(cinema.id, fetched)
+        except Exception as e:
+            print(f"      ⚠️ Écriture des séances impossible: {e}")
+
+    if stored or fetched:
+        index_cinema_films(cinema, days[0])
+    return merge_cinema_films(cinema.id, days), len(missing)
+
+
+def format_showtimes(showtimes, today):
+    """Texte d'affichage « VF Auj: 14:00, 16:30 | VO Dem: 20:00 » de séances triées."""
+    by_day = {}
+    for showtime in showtimes:
+        day = showtime.starts_at.date()
+        by_day.setdefault(day, {}).setdefault(showtime.version, []).append(showtime.starts_at.strftime("%H:%M"))
+
+    parts = []
+    for day in sorted(by_day):
+        if day == today:
+            label = "Auj"
+        elif day == today + timedelta(days=1):
+            label = "Dem"
+        else:
+            label = day.strftime("%d/%m")
+        for version in SHOWTIME_VERSIONS:
+            times = by_day[day].get(version)
+            if times:
+                parts.append(f"{version} {label}: {', '.join(times[:SHOWTIMES_DISPLAY_MAX])}")
+    return " | ".join(parts)
 
-        return cinema_info, []
-    except Exception as e:
-        print(f"      ❌ Erreur cinéma {cinema_info.get('name')}: {e}")
-        return cinema_info, []
+
+# ============================================================================
+# INDEX FILMS → SÉANCES (construit depuis le cache des séances)
+# ============================================================================
+
+FILMS_INDEX = {}             # titre replié → {cinema_id: (cinéma, titre, séances)}
+_FILMS_INDEX_BY_CINEMA = {}  # cinema_id → titres repliés indexés pour ce cinéma
+_films_index_lock = threading.Lock()
+
+
+def film_key(title):
+    """Clé d'index d'un titre de film (minuscules, sans accents ni ponctuation)."""
+    return " ".join(re.findall(r"[a-z0-9]+", fold_name(title)))
+
+
+def index_cinema_films(cinema, today):
+    """Réindexe par titre les séances en cache d'un cinéma (toutes journées à venir)."""
+    movies = merge_cinema_films(cinema.id, [today + timedelta(days=n) for n in range(CINEMA_DAYS_MAX)])
+    with _films_index_lock:
+        for key in _FILMS_INDEX_BY_CINEMA.pop(cinema.id, ()):
+            entries = FILMS_INDEX.get(key)
+            if entries is not None:
+                entries.pop(cinema.id, None)
+                if not entries:
+                    del FILMS_INDEX[key]
+        keys = set()
+        for movie in movies:
+            key = film_key(movie.get('title', ''))
+            if key and movie.get('showtimes'):
+                FILMS_INDEX.setdefault(key, {})[cinema.id] = (cinema, movie['title'], movie['showtimes'])
+                keys.add(key)
+        if keys:
+            _FILMS_INDEX_BY_CINEMA[cinema.id] = keys
+
+
+def find_film_screenings(title):
+    """Entrées (cinéma, titre, séances) des films correspondant au titre : exact, sinon contenu."""
+    key = film_key(title)
+    if not key:
+        return []
+    with _films_index_lock:
+        if key in FILMS_INDEX:
+            return list(FILMS_INDEX[key].values())
+        padded = f" {key} "
+        return [entry for indexed, entries in FILMS_INDEX.items()
+                if padded in f" {indexed} " for entry in entries.values()]
+
+
+def purge_films_index(today):
+    """Retire de l'index les séances des journées passées et les entrées devenues vides."""
+    with _films_index_lock:
+        for key in list(FILMS_INDEX):
+            entries = FILMS_INDEX[key]
+            for cinema_id, (cinema, title, showtimes) in list(entries.items()):
+                upcoming = [st for st in showtimes if st.starts_at.date() >= today]
+                if len(upcoming) == len(showtimes):
+                    continue
+                if upcoming:
+                    entries[cinema_id] = (cinema, title, upcoming)
+                    continue
+                del entries[cinema_id]
+                indexed = _FILMS_INDEX_BY_CINEMA.get(cinema_id)
+                if indexed is not None:
+                    indexed.discard(key)
+                    if not indexed:
+                        del _FILMS_INDEX_BY_CINEMA[cinema_id]
+            if not entries:
+                del FILMS_INDEX[key]
 
 
 # ============================================================================
@@ -499,10 +1149,86 @@ def require_auth(f):
     def decorated(*args, **kwargs):
         if not check_auth():
             return jsonify({"status": "error", "message": "Non autorisé"}), 401
+        touch_last_seen(session.get('user_id'))
         return f(*args, **kwargs)
     return decorated
 
 
+# ============================================================================
+# PRÉSENCE - users.last_seen en écriture différée
+# ============================================================================
+
+_last_seen_buffer = {}  # user_id → dernière activité (coalescée)
+_last_seen_lock = threading.Lock()
+_last_seen_pid = None
+
+
+def touch_last_seen(user_id):
+    """
+    Note l'activité d'un utilisateur ; écrite en base au prochain flush.
+    Instant en UTC, converti au flush comme CURRENT_TIMESTAMP (fuseau de la session).
+    """
+    if not user_id:
+        return
+    _ensure_last_seen_flusher()
+    seen = datetime.now(timezone.utc)
+    with _last_seen_lock:
+        _last_seen_buffer[user_id] = seen
+
+
+def flush_last_seen():
+    """
+    Écrit le buffer en une seule requête UPDATE ... FROM (VALUES ...).
+    last_seen est un TIMESTAMP sans fuseau rempli par CURRENT_TIMESTAMP : les
+    instants UTC passent par timestamptz pour être convertis de la même façon.
+    """
+    global _last_seen_buffer
+    with _last_seen_lock:
+        pending, _last_seen_buffer = _last_seen_buffer, {}
+    if not pending or not DB_CONFIG:
+        return 0
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        execute_values(cur, """
+            UPDATE users SET last_seen = GREATEST(users.last_seen, v.seen)
+            FROM (VALUES %s) AS v(id, seen)
+            WHERE users.id = v.id
+        """, list(pending.items()), template="(%s, %s::timestamptz::timestamp)", page_size=1000)
+        conn.commit()
+        cur.close()
+        conn.close()
+        return len(pending)
+    except Exception as e:
+        print(f"❌ Erreur flush last_seen: {e}")
+        # Remettre les entrées non écrites (sans écraser une activité plus récente)
+        with _last_seen_lock:
+            for user_id, seen in pending.items():
+                _last_seen_buffer.setdefault(user_id, seen)
+        return 0
+
+
+def _last_seen_flusher():
+    """Boucle du thread de flush périodique."""
+    while True:
+        time.sleep(LAST_SEEN_FLUSH_INTERVAL)
+        flush_last_seen()
+
+
+def _ensure_last_seen_flusher():
+    """Démarre le thread de flush (une fois par processus, y compris après un fork)."""
+    global _last_seen_pid
+    if _last_seen_pid == os.getpid():
+        return
+    with _last_seen_lock:
+        if _last_seen_pid != os.getpid():
+            threading.Thread(target=_last_seen_flusher, name='last-seen-flush', daemon=True).start()
+            _last_seen_pid = os.getpid()
+
+
+atexit.register(flush_last_seen)
+
+
 def validate_pseudo(pseudo):
     """Valide un pseudo (2-20 chars, lettres uniquement)"""
     if not pseudo or len(pseudo) < 2 or len(pseudo) > 20:
@@ -512,107 +1238,188 @@ def validate_pseudo(pseudo):
     return True, None
 
 
+def peek_next_pseudo_number(cur, pseudo):
+    """Prochain numéro libre pour un pseudo (lecture seule, sans réservation)."""
+    execute_prepared(cur, 'pseudo_next_number', (pseudo,))
+    row = cur.fetchone()
+    return row['next_number'] if row else 1
+
+
+def allocate_pseudo_number(cur, pseudo):
+    """Réserve atomiquement le prochain numéro d'un pseudo (upsert ... RETURNING).
+
+    La ligne du compteur reste verrouillée jusqu'au commit : deux inscriptions
+    simultanées sur le même pseudo obtiennent forcément deux numéros différents.
+    """
+    cur.execute("""
+        INSERT INTO pseudo_counters (pseudo_key, last_number) VALUES (LOWER(%s), 1)
+        ON CONFLICT (pseudo_key) DO UPDATE SET last_number = pseudo_counters.last_number + 1
+        RETURNING last_number
+    """, (pseudo,))
+    return cur.fetchone()['last_number']
+
+
+def resync_pseudo_counter(cur, pseudo):
+    """Recale le compteur d'un pseudo sur le MAX(pseudo_number) réel de la table users."""
+    cur.execute("""
+        INSERT INTO pseudo_counters (pseudo_key, last_number)
+        SELECT LOWER(%s), COALESCE(MAX(pseudo_number), 0) FROM users WHERE LOWER(pseudo) = LOWER(%s)
+        ON CONFLICT (pseudo_key) DO UPDATE
+            SET last_number = GREATEST(pseudo_counters.last_number, EXCLUDED.last_number)
+    """, (pseudo, pseudo))
+
+
+def run_with_pseudo_number(conn, cur, pseudo, apply):
+    """Attribue un numéro au pseudo, exécute apply(numéro) puis commit.
+
+    Si UNIQUE(pseudo, pseudo_number) est violée (compteur désynchronisé, ligne
+    insérée hors de l'appli), le compteur est recalé et l'opération retentée.
+    Retourne le numéro attribué.
+    """
+    for _ in range(PSEUDO_ALLOCATION_RETRIES):
+        pseudo_number = allocate_pseudo_number(cur, pseudo)
+        try:
+            apply(pseudo_number)
+            conn.commit()
+            return pseudo_number
+        except UniqueViolation as e:
+            conn.rollback()
+            if e.diag.constraint_name != PSEUDO_UNIQUE_CONSTRAINT:
+                raise
+            print(f"⚠️ Collision pseudo {pseudo}#{pseudo_number}, recalage du compteur")
+            resync_pseudo_counter(cur, pseudo)
+            conn.commit()
+    raise RuntimeError(f"Impossible d'attribuer un numéro au pseudo {pseudo}")
+
+
 # ============================================================================
-# INITIALISATION TABLE USERS
+# HACHAGE DES MOTS DE PASSE & LIMITATION DES CONNEXIONS
 # ============================================================================
 
-def init_user_tables():
-    """Crée la table users si elle n'existe pas."""
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor()
+class HashingBusyError(Exception):
+    """File de hachage pleine : la requête doit être refusée (503)."""
 
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                pseudo VARCHAR(25) NOT NULL,
-                pseudo_number INT NOT NULL DEFAULT 1,
-                email VARCHAR(255) NOT NULL UNIQUE,
-                password_hash VARCHAR(255) NOT NULL,
-                email_confirmed BOOLEAN DEFAULT FALSE,
-                confirmation_token VARCHAR(64),
-                confirmation_sent_at TIMESTAMP,
-                reset_token VARCHAR(64),
-                reset_sent_at TIMESTAMP,
-                device_id VARCHAR(64),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(pseudo, pseudo_number)
-            )
-        """)
 
-        cur.execute("""
-            DO $$
-            BEGIN
-                IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='email') THEN
-                    ALTER TABLE users ADD COLUMN email VARCHAR(255);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='email_confirmed') THEN
-                    ALTER TABLE users ADD COLUMN email_confirmed BOOLEAN DEFAULT FALSE;
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='confirmation_token') THEN
-                    ALTER TABLE users ADD COLUMN confirmation_token VARCHAR(64);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='confirmation_sent_at') THEN
-                    ALTER TABLE users ADD COLUMN confirmation_sent_at TIMESTAMP;
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='reset_token') THEN
-                    ALTER TABLE users ADD COLUMN reset_token VARCHAR(64);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='reset_sent_at') THEN
-                    ALTER TABLE users ADD COLUMN reset_sent_at TIMESTAMP;
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='password_hash') THEN
-                    ALTER TABLE users ADD COLUMN password_hash VARCHAR(255);
-                END IF;
-                -- Migration: ajouter pseudo_number et ajuster les contraintes
-                IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='pseudo_number') THEN
-                    ALTER TABLE users ADD COLUMN pseudo_number INT NOT NULL DEFAULT 1;
-                    -- Supprimer l'ancienne contrainte UNIQUE sur pseudo seul si elle existe
-                    IF EXISTS (SELECT 1 FROM information_schema.table_constraints WHERE table_name='users' AND constraint_type='UNIQUE' AND constraint_name='users_pseudo_key') THEN
-                        ALTER TABLE users DROP CONSTRAINT users_pseudo_key;
-                    END IF;
-                    -- Ajouter la contrainte UNIQUE composite (pseudo, pseudo_number)
-                    IF NOT EXISTS (SELECT 1 FROM information_schema.table_constraints WHERE table_name='users' AND constraint_name='users_pseudo_pseudo_number_key') THEN
-                        ALTER TABLE users ADD CONSTRAINT users_pseudo_pseudo_number_key UNIQUE (pseudo, pseudo_number);
-                    END IF;
-                END IF;
-                -- Ajouter colonne preferences JSONB si elle n'existe pas
-                IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='preferences') THEN
-                    ALTER TABLE users ADD COLUMN preferences JSONB DEFAULT '{}';
-                END IF;
-                -- Agrandir pseudo si nécessaire
-                ALTER TABLE users ALTER COLUMN pseudo TYPE VARCHAR(25);
-            END $$;
-        """)
+_hash_pool = None
+_hash_pool_pid = None
+_hash_pool_lock = threading.Lock()
+_hash_slots = threading.BoundedSemaphore(HASH_QUEUE_MAX)
 
-        # Migration colonne image sur la table evenements (si elle existe)
-        cur.execute("""
-            DO $$
-            BEGIN
-                IF EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name='evenements') THEN
-                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='evenements' AND column_name='image') THEN
-                        ALTER TABLE evenements ADD COLUMN image TEXT DEFAULT NULL;
-                    END IF;
-                END IF;
-            END $$;
-        """)
+_login_attempts = {}  # clé ('ip'|'email', valeur) → deque de timestamps
+_login_attempts_lock = threading.Lock()
 
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_users_pseudo ON users(pseudo)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_users_confirmation_token ON users(confirmation_token)")
 
-        conn.commit()
-        cur.close()
-        conn.close()
-        print("✅ Tables users initialisées")
-        return True
+def _get_hash_pool():
+    """
+    Pool de processus pour les KDF (créé à la demande, un par worker après fork).
+    Processus lancés par forkserver (spawn à défaut) : jamais forkés depuis un
+    worker qui a déjà des threads (last_seen, envoi des emails, requêtes).
+    """
+    global _hash_pool, _hash_pool_pid
+    if _hash_pool_pid != os.getpid():
+        with _hash_pool_lock:
+            if _hash_pool_pid != os.getpid():
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                _hash_pool = ProcessPoolExecutor(
+                    max_workers=HASH_POOL_SIZE, mp_context=multiprocessing.get_context(method)
+                )
+                _hash_pool_pid = os.getpid()
+    return _hash_pool
 
+
+def _run_hash(fn, *args):
+    """
+    Exécute fn(*args) dans le pool, avec une profondeur de file bornée : une
+    place est occupée jusqu'à la fin effective du calcul, même après un timeout.
+    """
+    if not _hash_slots.acquire(blocking=False):
+        raise HashingBusyError()
+    try:
+        future = _get_hash_pool().submit(fn, *args)
     except Exception as e:
-        print(f"❌ Erreur init tables: {e}")
+        # Pool indisponible (ex: pas de /dev/shm) : calcul sur place
+        print(f"⚠️ Pool de hachage indisponible, calcul dans le thread de requête: {e}")
+        metrics.increment('password_hash', 'inline_fallback')
+        try:
+            return fn(*args)
+        finally:
+            _hash_slots.release()
+    future.add_done_callback(lambda _: _hash_slots.release())
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except FutureTimeoutError:
+        # Pool saturé ou bloqué : même réponse qu'une file pleine (503) ; la
+        # place reste prise tant que le calcul n'est pas terminé ou annulé
+        future.cancel()
+        metrics.increment('password_hash', 'timeouts')
+        print(f"⚠️ Hachage non terminé après {HASH_TIMEOUT}s")
+        raise HashingBusyError()
+
+
+def hash_password(password):
+    """Hache un mot de passe avec les paramètres courants (hors thread de requête)."""
+    return _run_hash(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+
+def verify_password(password_hash, password):
+    """Vérifie un mot de passe (hors thread de requête)."""
+    return _run_hash(check_password_hash, password_hash, password)
+
+
+def password_needs_rehash(password_hash):
+    """True si le hash a été calculé avec d'autres paramètres que PASSWORD_HASH_METHOD."""
+    return password_hash.split('$', 1)[0] != PASSWORD_HASH_METHOD
+
+
+def get_client_ip():
+    """
+    IP du client (derrière le proxy Render : dernier X-Forwarded-For, ajouté
+    par le proxy ; les entrées précédentes sont fournies par le client).
+    """
+    forwarded = request.headers.get('X-Forwarded-For', '')
+    if forwarded:
+        return forwarded.split(',')[-1].strip()
+    return request.remote_addr or ''
+
+
+def _recent_attempts(key, now):
+    """Deque des tentatives récentes pour une clé, purgée de la fenêtre expirée."""
+    attempts = _login_attempts.get(key)
+    if attempts is None:
+        attempts = _login_attempts[key] = deque()
+    while attempts and now - attempts[0] > LOGIN_WINDOW:
+        attempts.popleft()
+    return attempts
+
+
+def login_throttled(ip, email):
+    """Enregistre une tentative pour l'IP ; True si l'IP ou l'email dépasse son budget."""
+    now = time.time()
+    with _login_attempts_lock:
+        ip_attempts = _recent_attempts(('ip', ip), now)
+        email_failures = _recent_attempts(('email', email), now)
+        if len(ip_attempts) >= LOGIN_MAX_ATTEMPTS_PER_IP or len(email_failures) >= LOGIN_MAX_FAILURES_PER_EMAIL:
+            return True
+        ip_attempts.append(now)
+        # Purge des clés vides pour borner la mémoire
+        if len(_login_attempts) > 10000:
+            for key in [k for k, v in _login_attempts.items() if not v]:
+                del _login_attempts[key]
         return False
 
 
+def record_login_failure(email):
+    """Comptabilise un échec de mot de passe pour un email."""
+    with _login_attempts_lock:
+        _recent_attempts(('email', email), time.time()).append(time.time())
+
+
+def clear_login_failures(email):
+    """Remet à zéro les échecs d'un email après une connexion réussie."""
+    with _login_attempts_lock:
+        _login_attempts.pop(('email', email), None)
+
+
 # ============================================================================
 # ROUTES - STATIC FILES
 # ============================================================================
@@ -655,6 +1462,18 @@ def health():
     return jsonify({"status": "ok", "service": "gedeon-user", "mode": "readonly"})
 
 
+@app.route('/health/memory')
+def health_memory():
+    """Mémoire du worker qui répond (PSS = part réelle une fois les pages partagées réparties)"""
+    return jsonify({"status": "ok", "memory": memory_stats()})
+
+
+@app.route('/health/metrics')
+def health_metrics():
+    """Métriques par endpoint du worker qui répond (tailles, temps d'encodage et de compression)"""
+    return jsonify({"status": "ok", "pid": os.getpid(), "metrics": metrics.snapshot()})
+
+
 # ============================================================================
 # API - INSCRIPTION / CONNEXION / CONFIRMATION
 # ============================================================================
@@ -668,13 +1487,11 @@ def check_pseudo():
         return jsonify({"status": "error", "message": error}), 400
 
     try:
+        # Lecture du compteur par clé primaire (requête préparée) : toujours à
+        # jour, quel que soit le worker qui a attribué le dernier numéro
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute(
-            "SELECT COALESCE(MAX(pseudo_number), 0) + 1 AS next_number FROM users WHERE LOWER(pseudo) = LOWER(%s)",
-            (pseudo,)
-        )
-        next_number = cur.fetchone()['next_number']
+        next_number = peek_next_pseudo_number(cur, pseudo)
         cur.close()
         conn.close()
         return jsonify({"status": "success", "pseudo": pseudo, "next_number": next_number}), 200
@@ -708,6 +1525,8 @@ def register():
         if len(password) > 50:
             return jsonify({"status": "error", "message": "Mot de passe trop long (50 max)"}), 400
 
+        password_hash = hash_password(password)
+
         conn = get_db_connection()
         cur = conn.cursor()
 
@@ -721,24 +1540,17 @@ def register():
                 return jsonify({"status": "error", "message": "Cet email est en attente de confirmation. Vérifiez vos emails."}), 409
             return jsonify({"status": "error", "message": "Cet email est déjà utilisé"}), 409
 
-        # Calculer le prochain numéro pour ce pseudo
-        cur.execute(
-            "SELECT COALESCE(MAX(pseudo_number), 0) + 1 AS next_number FROM users WHERE LOWER(pseudo) = LOWER(%s)",
-            (pseudo,)
-        )
-        pseudo_number = cur.fetchone()['next_number']
-
-        # Créer l'utilisateur
+        # Créer l'utilisateur avec le prochain numéro pour ce pseudo
         confirmation_token = generate_confirmation_token()
-        password_hash = generate_password_hash(password)
-        cur.execute(
-            """INSERT INTO users (email, pseudo, pseudo_number, password_hash, device_id, email_confirmed, confirmation_token, confirmation_sent_at)
-               VALUES (%s, %s, %s, %s, %s, FALSE, %s, CURRENT_TIMESTAMP)
-               RETURNING id, pseudo, pseudo_number, email""",
-            (email, pseudo, pseudo_number, password_hash, device_id or None, confirmation_token)
-        )
-        new_user = cur.fetchone()
-        conn.commit()
+
+        def insert_user(pseudo_number):
+            cur.execute(
+                """INSERT INTO users (email, pseudo, pseudo_number, password_hash, device_id, email_confirmed, confirmation_token, confirmation_sent_at)
+                   VALUES (%s, %s, %s, %s, %s, FALSE, %s, CURRENT_TIMESTAMP)""",
+                (email, pseudo, pseudo_number, password_hash, device_id or None, confirmation_token)
+            )
+
+        pseudo_number = run_with_pseudo_number(conn, cur, pseudo, insert_user)
 
         display_name = pseudo + '_' + str(pseudo_number)
 
@@ -758,6 +1570,8 @@ def register():
             "message": "Compte créé ! Vérifiez votre email pour confirmer."
         }), 201
 
+    except HashingBusyError:
+        return jsonify({"status": "error", "message": "Serveur occupé, réessayez dans un instant"}), 503
     except Exception as e:
         print(f"❌ Erreur register: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -774,13 +1588,13 @@ def login():
         if not email or not password:
             return jsonify({"status": "error", "message": "Email et mot de passe requis"}), 400
 
+        if login_throttled(get_client_ip(), email):
+            return jsonify({"status": "error", "message": "Trop de tentatives, réessayez dans quelques minutes"}), 429
+
         conn = get_db_connection()
         cur = conn.cursor()
 
-        cur.execute(
-            "SELECT id, pseudo, pseudo_number, email, password_hash, email_confirmed, COALESCE(preferences, '{}') as preferences FROM users WHERE email = %s",
-            (email,)
-        )
+        execute_prepared(cur, 'login_user', (email,))
         user = cur.fetchone()
 
         if not user:
@@ -788,11 +1602,21 @@ def login():
             conn.close()
             return jsonify({"status": "error", "message": "Email ou mot de passe incorrect"}), 401
 
-        if not user['password_hash'] or not check_password_hash(user['password_hash'], password):
+        try:
+            password_ok = bool(user['password_hash']) and verify_password(user['password_hash'], password)
+        except HashingBusyError:
+            cur.close()
+            conn.close()
+            raise
+
+        if not password_ok:
             cur.close()
             conn.close()
+            record_login_failure(email)
             return jsonify({"status": "error", "message": "Email ou mot de passe incorrect"}), 401
 
+        clear_login_failures(email)
+
         if not user['email_confirmed']:
             cur.close()
             conn.close()
@@ -802,20 +1626,28 @@ def login():
                 "code": "EMAIL_NOT_CONFIRMED"
             }), 403
 
-        # Mise à jour last_seen
-        cur.execute("UPDATE users SET last_seen = CURRENT_TIMESTAMP WHERE id = %s", (user['id'],))
+        # Rehash transparent si les paramètres du KDF ont changé
+        if password_needs_rehash(user['password_hash']):
+            try:
+                cur.execute("UPDATE users SET password_hash = %s WHERE id = %s", (hash_password(password), user['id']))
+            except HashingBusyError:
+                pass  # sera fait à une prochaine connexion
+
         conn.commit()
         cur.close()
         conn.close()
+        touch_last_seen(user['id'])
 
-        # Session
+        # Session (nouvel identifiant à chaque connexion)
+        if hasattr(session, 'rotate'):
+            session.rotate()
         session.permanent = True
         display_name = user['pseudo'] + '_' + str(user['pseudo_number'])
         session['user_logged_in'] = True
         session['user_id'] = user['id']
         session['user_pseudo'] = display_name
         session['user_email'] = user['email']
-        session['user_preferences'] = user.get('preferences') or {}
+        cache_user_preferences(user['id'], user.get('preferences'))
 
         print(f"✅ Login: {display_name} ({email})")
 
@@ -825,6 +1657,8 @@ def login():
             "username": display_name
         }), 200
 
+    except HashingBusyError:
+        return jsonify({"status": "error", "message": "Serveur occupé, réessayez dans un instant"}), 503
     except Exception as e:
         print(f"❌ Erreur login: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -847,7 +1681,7 @@ def check_login():
             "status": "success",
             "logged_in": True,
             "username": session.get('user_pseudo'),
-            "preferences": session.get('user_preferences', {})
+            "preferences": get_user_preferences()
         }), 200
     else:
         return jsonify({
@@ -869,6 +1703,7 @@ def get_preferences():
         cur.close()
         conn.close()
         prefs = row['preferences'] if row else {}
+        cache_user_preferences(user_id, prefs)
         return jsonify({"status": "success", "preferences": prefs}), 200
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -893,7 +1728,7 @@ def save_preferences():
         cur.close()
         conn.close()
 
-        session['user_preferences'] = preferences
+        cache_user_preferences(user_id, preferences)
         print(f"⚙️ Préférences sauvées: user_id={user_id}, interests={preferences.get('interests', [])}")
         return jsonify({"status": "success", "message": "Préférences sauvegardées"}), 200
     except Exception as e:
@@ -925,16 +1760,13 @@ def update_profile():
         if current['pseudo'].lower() == new_pseudo.lower():
             display_name = current['pseudo'] + '_' + str(current['pseudo_number'])
         else:
-            cur.execute(
-                "SELECT COALESCE(MAX(pseudo_number), 0) + 1 AS next_number FROM users WHERE LOWER(pseudo) = LOWER(%s)",
-                (new_pseudo,)
-            )
-            pseudo_number = cur.fetchone()['next_number']
-            cur.execute(
-                "UPDATE users SET pseudo = %s, pseudo_number = %s WHERE id = %s",
-                (new_pseudo, pseudo_number, user_id)
-            )
-            conn.commit()
+            def rename_user(pseudo_number):
+                cur.execute(
+                    "UPDATE users SET pseudo = %s, pseudo_number = %s WHERE id = %s",
+                    (new_pseudo, pseudo_number, user_id)
+                )
+
+            pseudo_number = run_with_pseudo_number(conn, cur, new_pseudo, rename_user)
             display_name = new_pseudo + '_' + str(pseudo_number)
             session['user_pseudo'] = display_name
             print(f"✏️ Pseudo mis à jour: user_id={user_id}, pseudo={display_name}")
@@ -1079,7 +1911,7 @@ def forgot_password():
                 display_name = user['pseudo'] + '_' + str(user['pseudo_number'])
                 success, error_msg = send_password_reset_email(email, display_name, reset_token)
                 if success:
-                    print(f"📧 Email reset envoyé à {email} pour {display_name}")
+                    print(f"📧 Email reset mis en file pour {email} ({display_name})")
                 else:
                     print(f"⚠️ Erreur envoi email reset: {error_msg}")
             else:
@@ -1117,6 +1949,8 @@ def reset_password():
         if not new_password or len(new_password) < 4:
             return jsonify({"status": "error", "message": "Mot de passe: 4 caractères minimum"}), 400
 
+        password_hash = hash_password(new_password)
+
         conn = get_db_connection()
         cur = conn.cursor()
 
@@ -1133,7 +1967,6 @@ def reset_password():
             conn.close()
             return jsonify({"status": "error", "message": "Token expiré. Refaites une demande."}), 400
 
-        password_hash = generate_password_hash(new_password)
         cur.execute(
             "UPDATE users SET password_hash = %s, reset_token = NULL WHERE id = %s",
             (password_hash, user['id'])
@@ -1146,6 +1979,8 @@ def reset_password():
         print(f"🔐 Mot de passe réinitialisé: {display_name}")
         return jsonify({"status": "success", "message": "Mot de passe modifié !"}), 200
 
+    except HashingBusyError:
+        return jsonify({"status": "error", "message": "Serveur occupé, réessayez dans un instant"}), 503
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -1175,12 +2010,6 @@ def list_users():
         cur.close()
         conn.close()
 
-        for user in users:
-            if user.get('created_at'):
-                user['created_at'] = user['created_at'].isoformat()
-            if user.get('last_seen'):
-                user['last_seen'] = user['last_seen'].isoformat()
-
         return jsonify({"status": "success", "users": users}), 200
 
     except Exception as e:
@@ -1191,15 +2020,24 @@ def list_users():
 # API - SCANNED EVENTS (LECTURE SEULE)
 # ============================================================================
 
+def format_scanned_event(event):
+    """Dates d'un événement scanné au format texte de l'API (identique en flux et hors flux)."""
+    if event.get('begin_date'):
+        event['begin_date'] = str(event['begin_date'])
+    if event.get('end_date'):
+        event['end_date'] = str(event['end_date'])
+    if event.get('created_at'):
+        event['created_at'] = event['created_at'].isoformat()
+    return event
+
+
 @app.route('/api/scanned', methods=['GET'])
 @require_auth
 def get_scanned_events():
     """Récupère les événements scannés (lecture seule, publics uniquement)"""
     try:
         conn = get_db_connection()
-        cur = conn.cursor()
-
-        cur.execute("""
+        query = """
             SELECT
                 s.id, s.user_id, s.uid, s.title, s.category,
                 s.begin_date, s.end_date, s.start_time, s.end_time,
@@ -1212,19 +2050,33 @@ def get_scanned_events():
             JOIN users u ON s.user_id = u.id
             WHERE s.is_private = FALSE
             ORDER BY s.created_at DESC
-        """)
+        """
+
+        # Mode flux (?stream=1) : curseur serveur, mémoire constante quel que soit le volume
+        if request.args.get('stream') == '1':
+            try:
+                cur = open_server_side_cursor(conn, query)
+            except Exception:
+                conn.close()
+                raise
+
+            def close():
+                cur.close()
+                conn.close()
+
+            return stream_json_response({"status": "success"}, "events", cur,
+                                        encode=lambda row: app.json.dumps(format_scanned_event(row)),
+                                        on_close=close)
+
+        cur = conn.cursor()
+        cur.execute(query)
         events = cur.fetchall()
 
         cur.close()
         conn.close()
 
         for e in events:
-            if e.get('begin_date'):
-                e['begin_date'] = str(e['begin_date'])
-            if e.get('end_date'):
-                e['end_date'] = str(e['end_date'])
-            if e.get('created_at'):
-                e['created_at'] = e['created_at'].isoformat()
+            format_scanned_event(e)
 
         return jsonify({
             "status": "success",
@@ -1249,10 +2101,7 @@ def get_event_image(event_id):
         conn = get_db_connection()
         cur = conn.cursor()
 
-        cur.execute(
-            "SELECT image_data, image_mime, image_path FROM scanned_events WHERE id = %s",
-            (event_id,)
-        )
+        execute_prepared(cur, 'scanned_image', (event_id,))
         row = cur.fetchone()
 
         cur.close()
@@ -1304,23 +2153,279 @@ def get_nearby_events():
         if center_lat is None or center_lon is None:
             return jsonify({"status": "error", "message": "Paramètres 'lat' et 'lon' requis"}), 400
 
-        events = fetch_datatourisme_events(center_lat, center_lon, radius_km, days_ahead)
+        envelope = {
+            "status": "success",
+            "center": {"latitude": center_lat, "longitude": center_lon},
+            "radiusKm": radius_km,
+            "days": days_ahead,
+        }
+
+        # Mode flux (?stream=1) : possible seulement sans score à calculer
+        # (le tri par pertinence demande tous les événements)
+        if request.args.get('stream') == '1' and not (prefs or {}).get('interests'):
+            response = stream_datatourisme_events(envelope, center_lat, center_lon, radius_km, days_ahead)
+            if response is not None:
+                return response, 200
+
+        raw = fetch_datatourisme_events_json(center_lat, center_lon, radius_km, days_ahead)
+        if raw is None:
+            events = fetch_datatourisme_events(center_lat, center_lon, radius_km, days_ahead)
+        elif not (prefs or {}).get('interests'):
+            # Sans centres d'intérêt, tous les scores sont nuls : le JSON produit
+            # par PostgreSQL (déjà trié par distance) est renvoyé sans être décodé
+            events_json, count = raw
+            envelope.update({"count": count, "sources": {"DATAtourisme": count}})
+            return raw_json_response(envelope, "events", events_json), 200
+        else:
+            events = app.json.loads(raw[0])
+
         for event in events:
             event['relevanceScore'] = score_event(event, prefs)
         events.sort(key=lambda e: (-e.get('relevanceScore', 0), e.get("distanceKm") or 999, e.get("begin") or ""))
 
+        envelope.update({"events": events, "count": len(events), "sources": {"DATAtourisme": len(events)}})
+        return jsonify(envelope), 200
+
+    except Exception as e:
+        print(f"❌ Erreur events/nearby: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+# ============================================================================
+# API - RECHERCHE (LECTURE SEULE)
+# ============================================================================
+
+# Recherche plein texte DATAtourisme + événements scannés publics en une requête :
+# tsvector (configuration french, index GIN) OU trigrammes (pg_trgm), score
+# combinant pertinence, distance et date. Paramètres nommés.
+EVENTS_SEARCH_SQL = """
+    WITH q AS (SELECT websearch_to_tsquery('french', %(q)s) AS tsq),
+    datatourisme AS (
+        SELECT json_build_object(
+                   'uid', e.uri, 'title', e.nom, 'description', e.description,
+                   'begin', e.date_debut, 'end', e.date_fin,
+                   'latitude', e.latitude, 'longitude', e.longitude,
+                   'address', e.adresse, 'city', e.commune, 'zipcode', e.code_postal,
+                   'locationName', e.commune, 'image', e.image, 'categories', e.categories,
+                   'source', 'DATAtourisme', 'agendaTitle', 'DATAtourisme'
+               ) AS event,
+               {dt_relevance} AS relevance,
+               ST_Distance(e.geom::geography, ST_SetSRID(ST_MakePoint(%(lon)s::float8, %(lat)s::float8), 4326)::geography) / 1000 AS distance_km,
+               e.date_debut AS begin_date
+        FROM evenements e, q
+        WHERE ({dt_match})
+          AND (e.date_fin >= CURRENT_DATE OR (e.date_fin IS NULL AND e.date_debut >= CURRENT_DATE))
+          AND e.date_debut <= CURRENT_DATE + %(days)s
+          AND (%(lat)s::float8 IS NULL OR ST_DWithin(
+              e.geom::geography, ST_SetSRID(ST_MakePoint(%(lon)s::float8, %(lat)s::float8), 4326)::geography, %(radius_m)s))
+        LIMIT 500
+    ),
+    scanned AS (
+        SELECT json_build_object(
+                   'uid', 'scan-' || s.id, 'id', s.id, 'title', s.title, 'description', s.description,
+                   'begin', s.begin_date, 'end', s.end_date,
+                   'latitude', s.latitude, 'longitude', s.longitude,
+                   'address', s.address, 'city', s.city, 'locationName', s.location_name,
+                   'category', s.category, 'userPseudo', u.pseudo || '_' || u.pseudo_number,
+                   'source', 'Scan'
+               ) AS event,
+               {scan_relevance} AS relevance,
+               CASE WHEN %(lat)s::float8 IS NULL OR s.latitude IS NULL THEN NULL
+                    ELSE 111.045 * SQRT(POWER(s.latitude - %(lat)s::float8, 2)
+                                        + POWER((s.longitude - %(lon)s::float8) * COS(RADIANS(%(lat)s::float8)), 2))
+               END AS distance_km
+        FROM scanned_events s JOIN users u ON s.user_id = u.id, q
+        WHERE s.is_private = FALSE AND ({scan_match})
+          AND (%(lat)s::float8 IS NULL OR (s.latitude BETWEEN %(lat)s::float8 - %(deg)s AND %(lat)s::float8 + %(deg)s
+                                           AND s.longitude BETWEEN %(lon)s::float8 - %(deg)s AND %(lon)s::float8 + %(deg)s))
+        LIMIT 500
+    )
+    SELECT event, distance_km,
+           relevance / (1 + COALESCE(distance_km, 0) / %(distance_scale)s)
+                     / (1 + GREATEST(COALESCE(begin_date - CURRENT_DATE, 0), 0)::float8 / %(date_scale)s) AS score
+    FROM (
+        SELECT event, relevance, distance_km, begin_date FROM datatourisme
+        UNION ALL
+        SELECT event, relevance, distance_km, NULL::date FROM scanned
+    ) AS results
+    WHERE distance_km IS NULL OR distance_km <= %(radius_km)s
+    ORDER BY score DESC
+    LIMIT %(limit)s
+"""
+
+# Variantes avec et sans pg_trgm (extension absente ou non installable)
+EVENTS_SEARCH_TRIGRAM = {
+    'dt_relevance': "GREATEST(ts_rank_cd(e.search_vector, q.tsq, 32), similarity(e.nom, %(q)s))",
+    'dt_match': "e.search_vector @@ q.tsq OR e.nom %% %(q)s",
+    'scan_relevance': "GREATEST(ts_rank_cd(s.search_vector, q.tsq, 32), similarity(s.title, %(q)s))",
+    'scan_match': "s.search_vector @@ q.tsq OR s.title %% %(q)s",
+}
+EVENTS_SEARCH_TEXT_ONLY = {
+    'dt_relevance': "ts_rank_cd(e.search_vector, q.tsq, 32)",
+    'dt_match': "e.search_vector @@ q.tsq",
+    'scan_relevance': "ts_rank_cd(s.search_vector, q.tsq, 32)",
+    'scan_match': "s.search_vector @@ q.tsq",
+}
+
+
+def search_score(relevance, distance_km=None, days_until=None):
+    """Score de recherche (même formule que EVENTS_SEARCH_SQL)."""
+    score = relevance / (1 + (distance_km or 0) / SEARCH_DISTANCE_SCALE_KM)
+    return score / (1 + max(days_until or 0, 0) / SEARCH_DATE_SCALE_DAYS)
+
+
+def search_database_events(query, center_lat, center_lon, radius_km, days_ahead, limit):
+    """Recherche plein texte en base (DATAtourisme + scans publics). None si indisponible."""
+    params = {
+        'q': query, 'lat': center_lat, 'lon': center_lon,
+        'radius_m': radius_km * 1000, 'radius_km': radius_km, 'deg': radius_km / 111.0,
+        'days': days_ahead, 'limit': limit,
+        'distance_scale': SEARCH_DISTANCE_SCALE_KM, 'date_scale': SEARCH_DATE_SCALE_DAYS,
+    }
+    try:
+        conn = get_db_connection()
+    except Exception as e:
+        print(f"   ⚠️ Recherche en base indisponible: {e}")
+        return None
+    try:
+        cur = conn.cursor()
+        for variant in (EVENTS_SEARCH_TRIGRAM, EVENTS_SEARCH_TEXT_ONLY):
+            try:
+                cur.execute(EVENTS_SEARCH_SQL.format(**variant), params)
+                rows = cur.fetchall()
+                break
+            except psycopg2.Error as e:
+                conn.rollback()
+                print(f"   ⚠️ Recherche en base ({'trigrammes' if variant is EVENTS_SEARCH_TRIGRAM else 'texte'}): {e}")
+        else:
+            return None
+        cur.close()
+    finally:
+        conn.close()
+
+    events = []
+    for row in rows:
+        event = row['event']
+        if row['distance_km'] is not None:
+            event['distanceKm'] = round(row['distance_km'], 1)
+        event['searchScore'] = round(row['score'], 4)
+        events.append(event)
+    return events
+
+
+def search_reference_events(query, center_lat, center_lon, radius_km, days_ahead):
+    """Recherche dans les cinémas et salons en mémoire (index inversé Python)."""
+    events = []
+    has_position = center_lat is not None and center_lon is not None
+
+    if CINEMAS_TEXT_INDEX is not None:
+        cinemas = CINEMAS_ALLOCINE_DATA
+        lats, lons = cinemas.column('lat'), cinemas.column('lon')
+        for i, relevance in CINEMAS_TEXT_INDEX.search(query).items():
+            dist = None
+            if has_position:
+                if not lats[i] or not lons[i]:
+                    continue
+                dist = haversine_km(center_lat, center_lon, lats[i], lons[i])
+                if dist > radius_km:
+                    continue
+            cinema = cinemas.record(i)
+            events.append({
+                "uid": f"allocine-{cinema.id}",
+                "title": f"🎬 {cinema.name}",
+                "locationName": cinema.name,
+                "address": cinema.address,
+                "city": cinema.city,
+                "latitude": lats[i] or None,
+                "longitude": lons[i] or None,
+                "distanceKm": round(dist, 1) if dist is not None else None,
+                "source": "Allocine",
+                "searchScore": round(search_score(relevance, dist), 4),
+            })
+
+    if SALONS_TEXT_INDEX is not None:
+        salons = SALONS_DATA
+        lats, lons = salons.column('lat'), salons.column('lon')
+        date_ordinals = salons.column('date_ordinal')
+        today = date.today().toordinal()
+        for i, relevance in SALONS_TEXT_INDEX.search(query).items():
+            # Date pré-parsée dans le snapshot (0 = inconnue)
+            if date_ordinals[i] and (date_ordinals[i] < today or date_ordinals[i] > today + days_ahead):
+                continue
+            dist = None
+            if has_position:
+                if not lats[i] or not lons[i]:
+                    continue
+                dist = haversine_km(center_lat, center_lon, lats[i], lons[i])
+                if dist > radius_km:
+                    continue
+            salon = salons.record(i)
+            days_until = date_ordinals[i] - today if date_ordinals[i] else None
+            events.append({
+                "uid": f"salon-{hash(salon.name) % 100000}",
+                "title": salon.name,
+                "begin": salon.dates,
+                "duration": salon.duration,
+                "locationName": salon.venue,
+                "city": salon.city,
+                "latitude": lats[i] or None,
+                "longitude": lons[i] or None,
+                "distanceKm": round(dist, 1) if dist is not None else None,
+                "frequency": salon.frequency,
+                "openagendaUrl": salon.url,
+                "source": "EventsEye",
+                "searchScore": round(search_score(relevance, dist, days_until), 4),
+            })
+
+    return events
+
+
+@app.route('/api/events/search', methods=['GET'])
+@require_auth
+def search_events():
+    """Recherche par mots-clés (DATAtourisme, scans publics, cinémas, salons)."""
+    try:
+        query = request.args.get('q', '').strip()
+        center_lat = request.args.get('lat', type=float)
+        center_lon = request.args.get('lon', type=float)
+        prefs = get_user_preferences()
+        radius_km = request.args.get('radiusKm', get_default_radius_from_prefs(prefs), type=int)
+        days_ahead = request.args.get('days', DAYS_AHEAD_DEFAULT, type=int)
+        limit = min(request.args.get('limit', SEARCH_LIMIT_DEFAULT, type=int), SEARCH_LIMIT_MAX)
+
+        if len(query) < 2:
+            return jsonify({"status": "error", "message": "Paramètre 'q' requis (2 caractères minimum)"}), 400
+        if (center_lat is None) != (center_lon is None):
+            return jsonify({"status": "error", "message": "Paramètres 'lat' et 'lon' requis ensemble"}), 400
+
+        if not CINEMAS_ALLOCINE_DATA:
+            load_cinemas_allocine()
+        if not SALONS_DATA:
+            load_salons_data()
+
+        db_events = search_database_events(query, center_lat, center_lon, radius_km, days_ahead, limit)
+        events = (db_events or []) + search_reference_events(query, center_lat, center_lon, radius_km, days_ahead)
+        events.sort(key=lambda e: (-e['searchScore'], e.get('distanceKm') or 0))
+        events = events[:limit]
+
+        sources = {}
+        for event in events:
+            sources[event['source']] = sources.get(event['source'], 0) + 1
+
         return jsonify({
             "status": "success",
-            "center": {"latitude": center_lat, "longitude": center_lon},
+            "query": query,
+            "center": {"latitude": center_lat, "longitude": center_lon} if center_lat is not None else None,
             "radiusKm": radius_km,
             "days": days_ahead,
             "events": events,
             "count": len(events),
-            "sources": {"DATAtourisme": len(events)}
+            "sources": sources,
+            "database": db_events is not None
         }), 200
 
     except Exception as e:
-        print(f"❌ Erreur events/nearby: {e}")
+        print(f"❌ Erreur events/search: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
@@ -1339,6 +2444,7 @@ def get_nearby_cinema():
         radius_km = request.args.get('radiusKm', get_default_radius_from_prefs(prefs), type=int)
         batch = request.args.get('batch', 0, type=int)
         batch_size = request.args.get('batchSize', 5, type=int)
+        days = max(1, min(request.args.get('days', CINEMA_DAYS_DEFAULT, type=int), CINEMA_DAYS_MAX))
 
         if center_lat is None or center_lon is None:
             return jsonify({"status": "error", "message": "Paramètres 'lat' et 'lon' requis"}), 400
@@ -1349,29 +2455,25 @@ def get_nearby_cinema():
         if not CINEMAS_ALLOCINE_DATA:
             return jsonify({"status": "success", "events": [], "count": 0, "hasMore": False}), 200
 
+        # Candidats (distance, index) : aucun objet cinéma tant que le lot n'est pas choisi
+        cinemas = CINEMAS_ALLOCINE_DATA
+        lats, lons = cinemas.column('lat'), cinemas.column('lon')
         nearby_cinemas = []
-        for cinema in CINEMAS_ALLOCINE_DATA:
-            lat = cinema.get('lat')
-            lon = cinema.get('lon')
+        for i in cinema_candidates(center_lat, center_lon, radius_km):
+            lat = lats[i]
+            lon = lons[i]
             if not lat or not lon:
                 continue
             dist = haversine_km(center_lat, center_lon, lat, lon)
             if dist <= radius_km:
-                nearby_cinemas.append({
-                    'id': cinema['id'],
-                    'name': cinema['name'],
-                    'address': cinema.get('address', ''),
-                    'lat': lat,
-                    'lon': lon,
-                    'distance': dist
-                })
-
-        nearby_cinemas.sort(key=lambda c: c['distance'])
+                nearby_cinemas.append((dist, i))
+
+        nearby_cinemas.sort()
         total_cinemas = len(nearby_cinemas)
 
         start_idx = batch * batch_size
         end_idx = start_idx + batch_size
-        cinemas_batch = nearby_cinemas[start_idx:end_idx]
+        cinemas_batch = [NearbyCinema(cinemas.record(i), dist) for dist, i in nearby_cinemas[start_idx:end_idx]]
         has_more = end_idx < total_cinemas and end_idx < 50
 
         if not cinemas_batch:
@@ -1380,30 +2482,20 @@ def get_nearby_cinema():
                 "totalCinemas": total_cinemas, "batch": batch, "hasMore": False
             }), 200
 
-        today_str = date.today().strftime("%Y-%m-%d")
-        tomorrow_str = (date.today() + timedelta(days=1)).strftime("%Y-%m-%d")
+        today = date.today()
+        purge_films_cache(today)
+        horizon = [today + timedelta(days=n) for n in range(days)]
         all_events = []
         cache_hits = 0
 
-        for i, cinema in enumerate(cinemas_batch):
+        for i, nearby in enumerate(cinemas_batch):
+            cinema = nearby.cinema
             try:
-                cinema_id = cinema['id']
-                now = time.time()
-                from_cache = False
-                movies = []
-
-                if cinema_id in FILMS_CACHE:
-                    cached = FILMS_CACHE[cinema_id]
-                    if now - cached['timestamp'] < FILMS_CACHE_TTL:
-                        movies = cached['films']
-                        from_cache = True
-                        cache_hits += 1
-
-                if not from_cache:
-                    cinema_info, movies = fetch_movies_for_cinema(cinema, today_str, tomorrow_str)
-                    FILMS_CACHE[cinema_id] = {'films': movies, 'timestamp': now}
-                    if i < len(cinemas_batch) - 1:
-                        time.sleep(0.5)
+                movies, fetched = get_cinema_films(cinema, horizon)
+                if not fetched:
+                    cache_hits += 1
+                elif i < len(cinemas_batch) - 1:
+                    time.sleep(0.5)
 
                 if movies:
                     for movie in movies:
@@ -1417,7 +2509,8 @@ def get_nearby_cinema():
                         else:
                             duration = ""
 
-                        showtimes_str = movie.get('showtimes_str', '')
+                        showtimes = movie.get('showtimes', [])
+                        showtimes_str = format_showtimes(showtimes, today)
                         genres = movie.get('genres', [])
                         genres_str = ", ".join(genres[:3]) if genres else ""
 
@@ -1429,21 +2522,21 @@ def get_nearby_cinema():
                         if showtimes_str:
                             desc_parts.append(showtimes_str)
 
-                        movie_date = today_str
-                        if showtimes_str and 'Dem:' in showtimes_str and 'Auj:' not in showtimes_str:
-                            movie_date = tomorrow_str
+                        # Dates de la première et de la dernière séance
+                        movie_date = showtimes[0].starts_at.date() if showtimes else today
+                        last_date = showtimes[-1].starts_at.date() if showtimes else today
 
                         event = {
-                            "uid": f"allocine-{cinema['id']}-{movie.get('title', '')[:20]}",
+                            "uid": f"allocine-{cinema.id}-{movie.get('title', '')[:20]}",
                             "title": f"🎬 {movie.get('title', 'Film')}",
                             "begin": movie_date,
-                            "end": movie_date,
-                            "locationName": cinema['name'],
+                            "end": last_date,
+                            "locationName": cinema.name,
                             "city": "",
-                            "address": cinema['address'],
-                            "latitude": cinema['lat'],
-                            "longitude": cinema['lon'],
-                            "distanceKm": round(cinema['distance'], 1),
+                            "address": cinema.address,
+                            "latitude": cinema.lat,
+                            "longitude": cinema.lon,
+                            "distanceKm": round(nearby.distance, 1),
                             "openagendaUrl": "",
                             "source": "Allocine",
                             "description": " • ".join(desc_parts) if desc_parts else "",
@@ -1451,13 +2544,14 @@ def get_nearby_cinema():
                         event['relevanceScore'] = score_event(event, prefs)
                         all_events.append(event)
             except Exception as e:
-                print(f"      ❌ Erreur {cinema.get('name', '?')[:20]}: {e}")
+                print(f"      ❌ Erreur {cinema.name[:20]}: {e}")
 
         all_events.sort(key=lambda e: (-e.get('relevanceScore', 0), e.get('distanceKm') or 999))
         return jsonify({
             "status": "success",
             "center": {"latitude": center_lat, "longitude": center_lon},
             "radiusKm": radius_km,
+            "days": days,
             "events": all_events,
             "count": len(all_events),
             "totalCinemas": total_cinemas,
@@ -1471,6 +2565,71 @@ def get_nearby_cinema():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@app.route('/api/cinema/film', methods=['GET'])
+@require_auth
+def get_film_screenings():
+    """Séances les plus proches d'un film dans les prochaines heures (index des séances en cache)."""
+    try:
+        title = request.args.get('title', '').strip()
+        center_lat = request.args.get('lat', type=float)
+        center_lon = request.args.get('lon', type=float)
+        prefs = get_user_preferences()
+        radius_km = request.args.get('radiusKm', get_default_radius_from_prefs(prefs), type=int)
+        hours = request.args.get('hours', 24, type=int)
+        limit = request.args.get('limit', 20, type=int)
+
+        if not title:
+            return jsonify({"status": "error", "message": "Paramètre 'title' requis"}), 400
+        if center_lat is None or center_lon is None:
+            return jsonify({"status": "error", "message": "Paramètres 'lat' et 'lon' requis"}), 400
+
+        now = datetime.now()
+        horizon = now + timedelta(hours=hours)
+        results = []
+
+        for cinema, film_title, showtimes in find_film_screenings(title):
+            if not cinema.lat or not cinema.lon:
+                continue
+            dist = haversine_km(center_lat, center_lon, cinema.lat, cinema.lon)
+            if dist > radius_km:
+                continue
+            # Séances triées : simples comparaisons de datetime
+            screenings = [st for st in showtimes if now <= st.starts_at <= horizon]
+            if not screenings:
+                continue
+            results.append({
+                "cinemaId": cinema.id,
+                "locationName": cinema.name,
+                "address": cinema.address,
+                "latitude": cinema.lat,
+                "longitude": cinema.lon,
+                "distanceKm": round(dist, 1),
+                "title": film_title,
+                "nextScreening": screenings[0].starts_at,
+                "screenings": [{"startsAt": st.starts_at, "version": st.version} for st in screenings],
+                "source": "Allocine"
+            })
+
+        results.sort(key=lambda r: (r['distanceKm'], r['nextScreening']))
+        results = results[:limit]
+
+        return jsonify({
+            "status": "success",
+            "title": title,
+            "center": {"latitude": center_lat, "longitude": center_lon},
+            "radiusKm": radius_km,
+            "hours": hours,
+            "cinemas": results,
+            "count": len(results),
+            "indexedCinemas": len(_FILMS_INDEX_BY_CINEMA),
+            "source": "Allocine"
+        }), 200
+
+    except Exception as e:
+        print(f"❌ Erreur cinema/film: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
 # ============================================================================
 # API - SALONS NEARBY (LECTURE SEULE)
 # ============================================================================
@@ -1491,32 +2650,39 @@ def get_nearby_salons():
         if not SALONS_DATA:
             load_salons_data()
 
-        today = date.today()
+        if not SALONS_DATA:
+            return jsonify({"status": "success", "events": [], "count": 0, "source": "EventsEye"}), 200
+
+        today = date.today().toordinal()
         nearby_salons = []
 
-        for salon in SALONS_DATA:
-            lat = salon.get('lat')
-            lon = salon.get('lon')
+        salons = SALONS_DATA
+        lats, lons = salons.column('lat'), salons.column('lon')
+        date_ordinals = salons.column('date_ordinal')
+        for i in range(len(salons)):
+            lat = lats[i]
+            lon = lons[i]
             if not lat or not lon:
                 continue
             dist = haversine_km(center_lat, center_lon, lat, lon)
             if dist > radius_km:
                 continue
-            salon_date = parse_salon_date(salon.get('dates', ''))
-            if salon_date and salon_date < today:
+            # Date pré-parsée dans le snapshot (0 = inconnue)
+            if date_ordinals[i] and date_ordinals[i] < today:
                 continue
+            salon = salons.record(i)
             salon_event = {
-                "uid": f"salon-{hash(salon['name']) % 100000}",
-                "title": salon['name'],
-                "begin": salon.get('dates', ''),
-                "duration": salon.get('duration', ''),
-                "locationName": salon.get('venue', ''),
-                "city": salon.get('city', ''),
+                "uid": f"salon-{hash(salon.name) % 100000}",
+                "title": salon.name,
+                "begin": salon.dates,
+                "duration": salon.duration,
+                "locationName": salon.venue,
+                "city": salon.city,
                 "latitude": lat,
                 "longitude": lon,
                 "distanceKm": round(dist, 1),
-                "frequency": salon.get('frequency', ''),
-                "openagendaUrl": salon.get('url', ''),
+                "frequency": salon.frequency,
+                "openagendaUrl": salon.url,
                 "source": "EventsEye"
             }
             salon_event['relevanceScore'] = score_event(salon_event, prefs)
@@ -1538,6 +2704,40 @@ def get_nearby_salons():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@app.route('/api/location/department', methods=['GET'])
+@require_auth
+def get_location_department():
+    """
+    Département d'une position, résolu localement (sans Nominatim), et IDs
+    Allociné des départements à moins de radiusKm (table des voisinages).
+    """
+    try:
+        lat = request.args.get('lat', type=float)
+        lon = request.args.get('lon', type=float)
+        radius_km = request.args.get('radiusKm', get_default_radius_from_prefs(get_user_preferences()), type=int)
+
+        if lat is None or lon is None:
+            return jsonify({"status": "error", "message": "Paramètres 'lat' et 'lon' requis"}), 400
+
+        if not CINEMAS_ALLOCINE_DATA:
+            load_cinemas_allocine()
+
+        dept = CINEMAS_DEPT_INDEX.department_of(lat, lon) if CINEMAS_DEPT_INDEX is not None else None
+        if dept is None:
+            return jsonify({"status": "error", "message": "Aucun département pour cette position"}), 404
+
+        return jsonify({
+            "status": "success",
+            "department": dept,
+            "radiusKm": radius_km,
+            "allocineIds": get_all_dept_ids_for_location(None, postcode=dept, radius_km=radius_km)
+        }), 200
+
+    except Exception as e:
+        print(f"❌ Erreur location/department: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
 # ============================================================================
 # API - STATS (LECTURE SEULE)
 # ============================================================================
@@ -1600,7 +2800,10 @@ def get_stats():
 # ============================================================================
 
 if DB_CONFIG:
-    init_user_tables()
+    # Une requête de version ; migrations en attente appliquées sous verrou (AUTO_MIGRATE=0 pour désactiver)
+    ensure_schema(get_db_connection, apply=os.environ.get('AUTO_MIGRATE', '1') != '0')
+    # Les workers ouvrent leur propre pool : ne pas hériter des sockets du master
+    close_db_pool()
 
 # Charger les données statiques au démarrage
 load_cinemas_allocine()
@@ -3,12 +3,24 @@
 Module d'authentification GEDEON - Interface Lecture Seule
 - Email + Pseudo + Mot de passe
 - Confirmation par email via SMTP (Gmail)
+- Envoi asynchrone : file d'attente + thread d'envoi avec connexion SMTP persistante
+- File persistante (table email_outbox, configure_outbox) : un message n'est
+  retiré qu'une fois envoyé ; un worker tué n'en perd aucun, un autre worker
+  (ou le suivant) les reprend. Sans base, file en mémoire non durable (dev).
+
+Pour les tests, un serveur SMTP local de debug peut remplacer Gmail :
+    python -m aiosmtpd -n -l localhost:1025
+    SMTP_HOST=localhost SMTP_PORT=1025 SMTP_STARTTLS=0 (sans SMTP_USER/SMTP_PASSWORD)
 """
 
 import os
+import re
 import ssl
+import time
+import atexit
 import secrets
 import smtplib
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
@@ -19,27 +31,37 @@ SMTP_HOST = os.environ.get('SMTP_HOST', 'smtp.gmail.com')
 SMTP_PORT = int(os.environ.get('SMTP_PORT', '587'))
 SMTP_USER = os.environ.get('SMTP_USER')
 SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
-SMTP_FROM_EMAIL = os.environ.get('SMTP_FROM_EMAIL') or SMTP_USER
+SMTP_FROM_EMAIL = os.environ.get('SMTP_FROM_EMAIL') or SMTP_USER or 'gedeon@localhost'
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', '1') != '0'
 APP_URL = os.environ.get('APP_URL', 'https://gedeon-readonly.onrender.com')
 
 # Duree de validite du token de confirmation (24h)
 TOKEN_EXPIRY_HOURS = 24
 
+# File d'envoi asynchrone
+OUTBOX_BATCH_SIZE = int(os.environ.get('SMTP_BATCH_SIZE', '20'))
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_BASE_DELAY = 2   # secondes, double a chaque nouvel essai
+OUTBOX_POLL_INTERVAL = 5      # secondes entre deux releves de la file
+OUTBOX_LEASE = 300            # un message reserve par un worker tue redevient disponible apres ce delai
+OUTBOX_RETENTION_DAYS = 7     # conservation des messages envoyes ou abandonnes
+SMTP_IDLE_TIMEOUT = 60        # fermeture de la connexion apres inactivite
+SMTP_TIMEOUT = 30
+
+_outbox = None
+_outbox_pid = None
+_outbox_lock = threading.Lock()
+_outbox_wakeup = threading.Event()
+
 
 def _smtp_available():
     """Verifie si la config SMTP est presente."""
-    return bool(SMTP_USER and SMTP_PASSWORD)
+    # Sans STARTTLS (serveur local de debug), pas besoin d'identifiants
+    return bool(SMTP_USER and SMTP_PASSWORD) or not SMTP_STARTTLS
 
 
-def _send_email(to_email, subject, html_content, text_content=None):
-    """
-    Envoie un email via SMTP.
-    Retourne (success, error_message)
-    """
-    if not _smtp_available():
-        print("SMTP_USER ou SMTP_PASSWORD non configure")
-        return False, "Configuration email manquante"
-
+def _build_message(to_email, subject, html_content, text_content=None):
+    """Construit le message MIME multipart (texte + HTML)."""
     msg = MIMEMultipart('alternative')
     msg['From'] = SMTP_FROM_EMAIL
     msg['To'] = to_email
@@ -48,46 +70,385 @@ def _send_email(to_email, subject, html_content, text_content=None):
     if text_content:
         msg.attach(MIMEText(text_content, 'plain', 'utf-8'))
     msg.attach(MIMEText(html_content, 'html', 'utf-8'))
+    return msg.as_string()
+
+
+def _smtp_connect():
+    """Ouvre une connexion SMTP authentifiee."""
+    server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    if SMTP_STARTTLS:
+        server.starttls(context=ssl.create_default_context())
+    if SMTP_USER and SMTP_PASSWORD:
+        server.login(SMTP_USER, SMTP_PASSWORD)
+    return server
+
+
+def _smtp_close(server):
+    """Ferme une connexion SMTP sans lever d'exception."""
+    try:
+        server.quit()
+    except Exception:
+        pass
+
+
+# ============================================================================
+# FILE D'ENVOI
+# ============================================================================
+
+class MemoryOutbox:
+    """
+    File en memoire du processus (dev, sans base) : NON durable, les messages
+    en attente sont perdus si le worker est tue. flush_outbox() a la sortie
+    normale limite la perte.
+    """
+
+    def __init__(self):
+        self._messages = {}  # id -> [to_email, message, attempts, next_attempt_at]
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def add(self, messages):
+        with self._lock:
+            for to_email, message in messages:
+                self._next_id += 1
+                self._messages[self._next_id] = [to_email, message, 0, 0.0]
+
+    def claim(self, limit):
+        """Reserve jusqu'a limit messages echus : liste de (id, to_email, message, attempts)."""
+        now = time.time()
+        with self._lock:
+            due = [msg_id for msg_id, item in self._messages.items() if item[3] <= now][:limit]
+            for msg_id in due:
+                self._messages[msg_id][3] = now + OUTBOX_LEASE
+            return [(msg_id,) + tuple(self._messages[msg_id][:3]) for msg_id in due]
+
+    def mark_sent(self, msg_id):
+        with self._lock:
+            self._messages.pop(msg_id, None)
+
+    def mark_failed(self, msg_id, attempts, error, retry_delay=None):
+        """Echec d'envoi : nouvel essai dans retry_delay secondes, abandon si None."""
+        with self._lock:
+            if retry_delay is None:
+                self._messages.pop(msg_id, None)
+            elif msg_id in self._messages:
+                self._messages[msg_id][2:] = [attempts, time.time() + retry_delay]
+
+    def purge(self):
+        pass
+
+    def pending(self):
+        with self._lock:
+            return len(self._messages)
+
+
+class PostgresOutbox:
+    """
+    File persistante dans la table email_outbox (migration 6). Les workers se
+    partagent les messages (FOR UPDATE SKIP LOCKED) ; un message reserve mais
+    jamais marque envoye (worker tue) redevient disponible apres OUTBOX_LEASE.
+    """
+
+    def __init__(self, get_connection):
+        self.get_connection = get_connection
 
+    def _execute(self, sql, params=None, fetch=False):
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            rows = cur.fetchall() if fetch else None
+            conn.commit()
+            cur.close()
+            return rows
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def add(self, messages):
+        """Enregistre les messages (une transaction) ; leve une exception si la base refuse."""
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.executemany(
+                "INSERT INTO email_outbox (to_email, message) VALUES (%s, %s)",
+                list(messages)
+            )
+            conn.commit()
+            cur.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def claim(self, limit):
+        """Reserve jusqu'a limit messages echus : liste de (id, to_email, message, attempts)."""
+        rows = self._execute("""
+            UPDATE email_outbox SET next_attempt_at = NOW() + make_interval(secs => %s)
+            WHERE id IN (
+                SELECT id FROM email_outbox
+                WHERE sent_at IS NULL AND failed_at IS NULL AND next_attempt_at <= NOW()
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, to_email, message, attempts
+        """, (OUTBOX_LEASE, limit), fetch=True)
+        return [(row['id'], row['to_email'], row['message'], row['attempts']) for row in rows]
+
+    def mark_sent(self, msg_id):
+        self._execute("UPDATE email_outbox SET sent_at = NOW() WHERE id = %s", (msg_id,))
+
+    def mark_failed(self, msg_id, attempts, error, retry_delay=None):
+        """Echec d'envoi : nouvel essai dans retry_delay secondes, abandon si None."""
+        if retry_delay is None:
+            self._execute(
+                "UPDATE email_outbox SET attempts = %s, last_error = %s, failed_at = NOW() WHERE id = %s",
+                (attempts, error, msg_id)
+            )
+        else:
+            self._execute(
+                "UPDATE email_outbox SET attempts = %s, last_error = %s, "
+                "next_attempt_at = NOW() + make_interval(secs => %s) WHERE id = %s",
+                (attempts, error, retry_delay, msg_id)
+            )
+
+    def purge(self):
+        """Supprime les messages envoyes ou abandonnes depuis plus de OUTBOX_RETENTION_DAYS jours."""
+        self._execute(
+            "DELETE FROM email_outbox WHERE COALESCE(sent_at, failed_at) < NOW() - make_interval(days => %s)",
+            (OUTBOX_RETENTION_DAYS,)
+        )
+
+    def pending(self):
+        # Durable : rien a attendre a la sortie du processus
+        return 0
+
+
+def configure_outbox(get_connection):
+    """Utilise la table email_outbox de PostgreSQL comme file d'envoi (durable)."""
+    global _outbox, _outbox_pid
+    with _outbox_lock:
+        _outbox = PostgresOutbox(get_connection)
+        _outbox_pid = None
+
+
+def _send_one(server, to_email, message):
+    """Envoie un message, en rouvrant la connexion si besoin. Retourne la connexion."""
     try:
-        context = ssl.create_default_context()
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-            server.starttls(context=context)
-            server.login(SMTP_USER, SMTP_PASSWORD)
-            server.sendmail(SMTP_FROM_EMAIL, to_email, msg.as_string())
+        if server is None:
+            server = _smtp_connect()
+        server.sendmail(SMTP_FROM_EMAIL, to_email, message)
+    except smtplib.SMTPServerDisconnected:
+        # Connexion fermee par le serveur : une reconnexion immediate
+        server = _smtp_connect()
+        server.sendmail(SMTP_FROM_EMAIL, to_email, message)
+    return server
+
+
+def _sender_loop(outbox, wakeup):
+    """
+    Thread d'envoi : garde une connexion SMTP ouverte, envoie par lots et
+    replanifie les echecs avec un delai exponentiel. Un message n'est marque
+    envoye qu'apres acceptation par le serveur SMTP.
+    """
+    server = None
+    last_activity = time.time()
+    last_purge = 0.0
+
+    while True:
+        try:
+            batch = outbox.claim(OUTBOX_BATCH_SIZE)
+        except Exception as e:
+            print(f"Outbox indisponible: {e}")
+            batch = []
+
+        if not batch:
+            if server is not None and time.time() - last_activity >= SMTP_IDLE_TIMEOUT:
+                _smtp_close(server)
+                server = None
+            if time.time() - last_purge >= 3600:
+                last_purge = time.time()
+                try:
+                    outbox.purge()
+                except Exception as e:
+                    print(f"Outbox purge: {e}")
+            wakeup.wait(OUTBOX_POLL_INTERVAL)
+            wakeup.clear()
+            continue
+
+        for msg_id, to_email, message, attempts in batch:
+            try:
+                server = _send_one(server, to_email, message)
+            except Exception as e:
+                if server is not None and not isinstance(e, smtplib.SMTPRecipientsRefused):
+                    _smtp_close(server)
+                    server = None
+                attempts += 1
+                if attempts >= OUTBOX_MAX_ATTEMPTS or isinstance(e, smtplib.SMTPRecipientsRefused):
+                    print(f"SMTP abandon pour {to_email} apres {attempts} essai(s): {e}")
+                    retry_delay = None
+                else:
+                    retry_delay = OUTBOX_RETRY_BASE_DELAY * (2 ** (attempts - 1))
+                    print(f"SMTP exception ({to_email}), nouvel essai dans {retry_delay}s: {e}")
+                try:
+                    outbox.mark_failed(msg_id, attempts, str(e), retry_delay)
+                except Exception as db_error:
+                    print(f"Outbox: echec non enregistre pour {to_email}: {db_error}")
+                continue
+            print(f"Email envoye a {to_email}")
+            try:
+                outbox.mark_sent(msg_id)
+            except Exception as e:
+                # Le message sera renvoye apres OUTBOX_LEASE (au moins une fois)
+                print(f"Outbox: envoi non enregistre pour {to_email}: {e}")
+        last_activity = time.time()
 
-        print(f"Email envoye a {to_email}")
-        return True, None
 
+def _ensure_sender():
+    """Demarre le thread d'envoi (une fois par processus, y compris apres un fork)."""
+    global _outbox, _outbox_pid, _outbox_wakeup
+    if _outbox_pid == os.getpid():
+        return _outbox
+    with _outbox_lock:
+        if _outbox_pid != os.getpid():
+            if _outbox is None or isinstance(_outbox, MemoryOutbox):
+                _outbox = MemoryOutbox()
+            _outbox_wakeup = threading.Event()
+            threading.Thread(
+                target=_sender_loop, args=(_outbox, _outbox_wakeup), name='smtp-outbox', daemon=True
+            ).start()
+            _outbox_pid = os.getpid()
+    return _outbox
+
+
+def start_outbox_sender():
+    """Demarre le thread d'envoi du worker (reprend les messages laisses en attente)."""
+    if _smtp_available():
+        _ensure_sender()
+
+
+def flush_outbox(timeout=10):
+    """Attend que la file en memoire soit videe (envoyes ou abandonnes). Retourne True si vide."""
+    if _outbox_pid != os.getpid():
+        return True
+    deadline = time.time() + timeout
+    while _outbox.pending():
+        if time.time() >= deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+atexit.register(flush_outbox)
+
+
+def _send_email(to_email, subject, html_content, text_content=None):
+    """
+    Met un email en file d'envoi (envoi SMTP en arriere-plan).
+    Retourne (success, error_message)
+    """
+    try:
+        message = _build_message(to_email, subject, html_content, text_content)
     except Exception as e:
         print(f"SMTP exception: {e}")
         return False, str(e)
+    return _enqueue_messages([(to_email, message)])
 
 
-def generate_confirmation_token():
-    """Genere un token de confirmation unique (32 caracteres hex)"""
-    return secrets.token_hex(16)
+def _enqueue_messages(messages):
+    """
+    Met en file une liste de (to_email, message) deja rendus.
+    Retourne (success, error_message) ; echec si la file n'a pas pu les enregistrer.
+    """
+    if not _smtp_available():
+        print("SMTP_USER ou SMTP_PASSWORD non configure")
+        return False, "Configuration email manquante"
 
+    try:
+        _ensure_sender().add(messages)
+    except Exception as e:
+        print(f"Outbox: mise en file impossible: {e}")
+        return False, str(e)
+    _outbox_wakeup.set()
+    return True, None
 
-def send_confirmation_email(email, pseudo, token):
+
+# ============================================================================
+# TEMPLATES D'EMAILS (pre-compiles au chargement du module)
+# ============================================================================
+
+_FIELD_RE = re.compile(r'\{(pseudo|link)\}')
+_MIME_BOUNDARY = '===============gedeon-' + secrets.token_hex(8) + '=='
+
+
+class _EmailTemplate:
     """
-    Envoie l'email de confirmation via SMTP.
-    Retourne (success, error_message)
+    Template d'email pre-compile : les parties statiques (HTML, CSS, texte,
+    en-tetes MIME) sont decoupees une seule fois, seuls le pseudo et le lien
+    sont inseres a chaque envoi.
     """
-    confirmation_link = f"{APP_URL}/confirm?token={token}"
 
-    html_content = f"""
+    def __init__(self, subject, html, text):
+        self.subject = subject
+        self.html_parts = _FIELD_RE.split(html)
+        self.text_parts = _FIELD_RE.split(text)
+        # Contenu 100% ASCII : le message MIME peut etre assemble sans encodage
+        self.ascii = (subject + html + text).isascii()
+        self.mime_head = (
+            f'Content-Type: multipart/alternative; boundary="{_MIME_BOUNDARY}"\n'
+            'MIME-Version: 1.0\n'
+            f'From: {SMTP_FROM_EMAIL}\n'
+        )
+        self.mime_subject = f'Subject: {subject}\n\n'
+
+    @staticmethod
+    def _fill(parts, values):
+        # parts alterne [statique, champ, statique, champ, ..., statique]
+        return ''.join(values[part] if i % 2 else part for i, part in enumerate(parts))
+
+    def render(self, pseudo, link):
+        """Retourne (subject, html, text)."""
+        values = {'pseudo': pseudo, 'link': link}
+        return self.subject, self._fill(self.html_parts, values), self._fill(self.text_parts, values)
+
+    def render_message(self, to_email, pseudo, link):
+        """Retourne le message MIME complet, pret pour sendmail."""
+        subject, html, text = self.render(pseudo, link)
+        if not (self.ascii and pseudo.isascii() and link.isascii() and to_email.isascii()):
+            return _build_message(to_email, subject, html, text)
+        return ''.join((
+            self.mime_head, f'To: {to_email}\n', self.mime_subject,
+            f'--{_MIME_BOUNDARY}\n',
+            'Content-Type: text/plain; charset="us-ascii"\nMIME-Version: 1.0\n'
+            'Content-Transfer-Encoding: 7bit\n\n', text, '\n',
+            f'--{_MIME_BOUNDARY}\n',
+            'Content-Type: text/html; charset="us-ascii"\nMIME-Version: 1.0\n'
+            'Content-Transfer-Encoding: 7bit\n\n', html, '\n',
+            f'--{_MIME_BOUNDARY}--\n',
+        ))
+
+
+_EMAIL_STYLE = """
+            body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; line-height: 1.6; color: #333; }
+            .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+            .header { background: %(header)s; color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }
+            .content { background: #f9fafb; padding: 30px; border-radius: 0 0 10px 10px; }
+            .button { display: inline-block; background: %(accent)s; color: white; padding: 15px 30px; text-decoration: none; border-radius: 8px; font-weight: bold; margin: 20px 0; }
+            .footer { text-align: center; color: #888; font-size: 12px; margin-top: 20px; }"""
+
+EMAIL_TEMPLATES = {
+    'confirmation': _EmailTemplate(
+        subject='Confirmez votre compte GEDEON',
+        html="""
     <!DOCTYPE html>
     <html>
     <head>
         <meta charset="utf-8">
-        <style>
-            body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; line-height: 1.6; color: #333; }}
-            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-            .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-            .content {{ background: #f9fafb; padding: 30px; border-radius: 0 0 10px 10px; }}
-            .button {{ display: inline-block; background: #667eea; color: white; padding: 15px 30px; text-decoration: none; border-radius: 8px; font-weight: bold; margin: 20px 0; }}
-            .footer {{ text-align: center; color: #888; font-size: 12px; margin-top: 20px; }}
+        <style>""" + _EMAIL_STYLE % {'header': 'linear-gradient(135deg, #667eea 0%, #764ba2 100%)', 'accent': '#667eea'} + """
         </style>
     </head>
     <body>
@@ -100,11 +461,11 @@ def send_confirmation_email(email, pseudo, token):
                 <p>Merci de vous etre inscrit sur GEDEON pour consulter les evenements.</p>
                 <p>Pour activer votre compte, cliquez sur le bouton ci-dessous :</p>
                 <p style="text-align: center;">
-                    <a href="{confirmation_link}" class="button">Confirmer mon compte</a>
+                    <a href="{link}" class="button">Confirmer mon compte</a>
                 </p>
                 <p>Ou copiez ce lien dans votre navigateur :</p>
                 <p style="word-break: break-all; background: #e5e7eb; padding: 10px; border-radius: 5px; font-size: 12px;">
-                    {confirmation_link}
+                    {link}
                 </p>
                 <p><strong>Ce lien expire dans 24 heures.</strong></p>
             </div>
@@ -115,40 +476,26 @@ def send_confirmation_email(email, pseudo, token):
         </div>
     </body>
     </html>
-    """
-
-    text_content = f"""
+    """,
+        text="""
     Bienvenue sur GEDEON, {pseudo} !
 
     Pour confirmer votre compte, cliquez sur ce lien :
-    {confirmation_link}
+    {link}
 
     Ce lien expire dans 24 heures.
 
     Si vous n'avez pas cree de compte, ignorez cet email.
-    """
-
-    return _send_email(email, 'Confirmez votre compte GEDEON', html_content, text_content)
-
-
-def send_password_reset_email(email, pseudo, token):
-    """
-    Envoie l'email de reinitialisation de mot de passe.
-    """
-    reset_link = f"{APP_URL}/reset-password?token={token}"
-
-    html_content = f"""
+    """,
+    ),
+    'password_reset': _EmailTemplate(
+        subject='Reinitialisez votre mot de passe GEDEON',
+        html="""
     <!DOCTYPE html>
     <html>
     <head>
         <meta charset="utf-8">
-        <style>
-            body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; line-height: 1.6; color: #333; }}
-            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-            .header {{ background: #f59e0b; color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-            .content {{ background: #f9fafb; padding: 30px; border-radius: 0 0 10px 10px; }}
-            .button {{ display: inline-block; background: #f59e0b; color: white; padding: 15px 30px; text-decoration: none; border-radius: 8px; font-weight: bold; margin: 20px 0; }}
-            .footer {{ text-align: center; color: #888; font-size: 12px; margin-top: 20px; }}
+        <style>""" + _EMAIL_STYLE % {'header': '#f59e0b', 'accent': '#f59e0b'} + """
         </style>
     </head>
     <body>
@@ -160,7 +507,7 @@ def send_password_reset_email(email, pseudo, token):
                 <p>Bonjour <strong>{pseudo}</strong>,</p>
                 <p>Vous avez demande a reinitialiser votre mot de passe GEDEON.</p>
                 <p style="text-align: center;">
-                    <a href="{reset_link}" class="button">Changer mon mot de passe</a>
+                    <a href="{link}" class="button">Changer mon mot de passe</a>
                 </p>
                 <p><strong>Ce lien expire dans 1 heure.</strong></p>
                 <p>Si vous n'avez pas fait cette demande, ignorez cet email.</p>
@@ -171,14 +518,75 @@ def send_password_reset_email(email, pseudo, token):
         </div>
     </body>
     </html>
+    """,
+        text="""
+    Bonjour {pseudo},
+
+    Vous avez demande a reinitialiser votre mot de passe GEDEON.
+    Pour choisir un nouveau mot de passe, cliquez sur ce lien :
+    {link}
+
+    Ce lien expire dans 1 heure.
+
+    Si vous n'avez pas fait cette demande, ignorez cet email.
+    """,
+    ),
+}
+
+# Lien inclus dans chaque template
+_TEMPLATE_LINKS = {
+    'confirmation': APP_URL + '/confirm?token=',
+    'password_reset': APP_URL + '/reset-password?token=',
+}
+
+
+def render_emails(template_name, recipients):
+    """
+    Rendu en masse : recipients est un iterable de (email, pseudo, token).
+    Retourne une liste de (email, message MIME) a passer au sender par lots.
     """
+    template = EMAIL_TEMPLATES[template_name]
+    link_prefix = _TEMPLATE_LINKS[template_name]
+    return [
+        (email, template.render_message(email, pseudo, link_prefix + token))
+        for email, pseudo, token in recipients
+    ]
+
+
+def send_bulk_emails(template_name, recipients):
+    """
+    Rend et met en file un lot d'emails du meme template.
+    Retourne (success, error_message)
+    """
+    try:
+        return _enqueue_messages(render_emails(template_name, recipients))
+    except Exception as e:
+        print(f"SMTP exception: {e}")
+        return False, str(e)
+
 
-    return _send_email(email, 'Reinitialisez votre mot de passe GEDEON', html_content)
+def generate_confirmation_token():
+    """Genere un token de confirmation unique (32 caracteres hex)"""
+    return secrets.token_hex(16)
+
+
+def send_confirmation_email(email, pseudo, token):
+    """
+    Envoie l'email de confirmation via SMTP.
+    Retourne (success, error_message)
+    """
+    return send_bulk_emails('confirmation', [(email, pseudo, token)])
+
+
+def send_password_reset_email(email, pseudo, token):
+    """
+    Envoie l'email de reinitialisation de mot de passe.
+    """
+    return send_bulk_emails('password_reset', [(email, pseudo, token)])
 
 
 def is_valid_email(email):
     """Validation basique d'email"""
-    import re
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return bool(re.match(pattern, email))
 
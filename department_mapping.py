@@ -10,6 +10,13 @@ Utilisation :
     from department_mapping import get_allocine_dept_id, get_all_dept_ids_for_location
 """
 
+import os
+import re
+import math
+import unicodedata
+from bisect import bisect_right
+from functools import lru_cache
+
 # ============================================================================
 # MAPPING PRINCIPAL : Nom Nominatim → ID Allociné
 # ============================================================================
@@ -770,6 +777,114 @@ ADJACENT_DEPARTMENTS = {
 }
 
 
+# ============================================================================
+# POSITION DES DÉPARTEMENTS (lat, lon)
+# ============================================================================
+#
+# Centroïdes approchés par la préfecture : suffisant pour convertir un rayon
+# en liste de départements Allociné (les recherches de cinémas utilisent les
+# centroïdes réels calculés sur les données, cf. reference_data.DepartmentIndex)
+
+DEPARTMENT_CENTROIDS = {
+    "01": (46.205, 5.225),    # Ain (Bourg-en-Bresse)
+    "02": (49.564, 3.620),    # Aisne (Laon)
+    "03": (46.566, 3.333),    # Allier (Moulins)
+    "04": (44.092, 6.236),    # Alpes-de-Haute-Provence (Digne-les-Bains)
+    "05": (44.559, 6.079),    # Hautes-Alpes (Gap)
+    "06": (43.710, 7.262),    # Alpes-Maritimes (Nice)
+    "07": (44.735, 4.599),    # Ardèche (Privas)
+    "08": (49.762, 4.726),    # Ardennes (Charleville-Mézières)
+    "09": (42.965, 1.607),    # Ariège (Foix)
+    "10": (48.297, 4.074),    # Aube (Troyes)
+    "11": (43.213, 2.351),    # Aude (Carcassonne)
+    "12": (44.350, 2.575),    # Aveyron (Rodez)
+    "13": (43.296, 5.370),    # Bouches-du-Rhône (Marseille)
+    "14": (49.183, -0.371),   # Calvados (Caen)
+    "15": (44.927, 2.440),    # Cantal (Aurillac)
+    "16": (45.649, 0.156),    # Charente (Angoulême)
+    "17": (46.160, -1.151),   # Charente-Maritime (La Rochelle)
+    "18": (47.081, 2.399),    # Cher (Bourges)
+    "19": (45.267, 1.772),    # Corrèze (Tulle)
+    "2A": (41.919, 8.738),    # Corse-du-Sud (Ajaccio)
+    "2B": (42.697, 9.450),    # Haute-Corse (Bastia)
+    "21": (47.322, 5.041),    # Côte-d'Or (Dijon)
+    "22": (48.514, -2.765),   # Côtes-d'Armor (Saint-Brieuc)
+    "23": (46.171, 1.871),    # Creuse (Guéret)
+    "24": (45.184, 0.721),    # Dordogne (Périgueux)
+    "25": (47.238, 6.024),    # Doubs (Besançon)
+    "26": (44.933, 4.892),    # Drôme (Valence)
+    "27": (49.024, 1.151),    # Eure (Évreux)
+    "28": (48.446, 1.489),    # Eure-et-Loir (Chartres)
+    "29": (47.996, -4.102),   # Finistère (Quimper)
+    "30": (43.837, 4.360),    # Gard (Nîmes)
+    "31": (43.605, 1.444),    # Haute-Garonne (Toulouse)
+    "32": (43.646, 0.586),    # Gers (Auch)
+    "33": (44.838, -0.579),   # Gironde (Bordeaux)
+    "34": (43.611, 3.877),    # Hérault (Montpellier)
+    "35": (48.117, -1.678),   # Ille-et-Vilaine (Rennes)
+    "36": (46.811, 1.686),    # Indre (Châteauroux)
+    "37": (47.394, 0.685),    # Indre-et-Loire (Tours)
+    "38": (45.188, 5.724),    # Isère (Grenoble)
+    "39": (46.675, 5.555),    # Jura (Lons-le-Saunier)
+    "40": (43.894, -0.500),   # Landes (Mont-de-Marsan)
+    "41": (47.586, 1.336),    # Loir-et-Cher (Blois)
+    "42": (45.440, 4.387),    # Loire (Saint-Étienne)
+    "43": (45.043, 3.885),    # Haute-Loire (Le Puy-en-Velay)
+    "44": (47.218, -1.554),   # Loire-Atlantique (Nantes)
+    "45": (47.903, 1.909),    # Loiret (Orléans)
+    "46": (44.448, 1.441),    # Lot (Cahors)
+    "47": (44.203, 0.616),    # Lot-et-Garonne (Agen)
+    "48": (44.518, 3.500),    # Lozère (Mende)
+    "49": (47.478, -0.563),   # Maine-et-Loire (Angers)
+    "50": (49.116, -1.091),   # Manche (Saint-Lô)
+    "51": (48.957, 4.365),    # Marne (Châlons-en-Champagne)
+    "52": (48.111, 5.139),    # Haute-Marne (Chaumont)
+    "53": (48.073, -0.770),   # Mayenne (Laval)
+    "54": (48.692, 6.184),    # Meurthe-et-Moselle (Nancy)
+    "55": (48.773, 5.160),    # Meuse (Bar-le-Duc)
+    "56": (47.658, -2.760),   # Morbihan (Vannes)
+    "57": (49.120, 6.176),    # Moselle (Metz)
+    "58": (46.990, 3.159),    # Nièvre (Nevers)
+    "59": (50.629, 3.057),    # Nord (Lille)
+    "60": (49.430, 2.081),    # Oise (Beauvais)
+    "61": (48.432, 0.091),    # Orne (Alençon)
+    "62": (50.291, 2.777),    # Pas-de-Calais (Arras)
+    "63": (45.778, 3.087),    # Puy-de-Dôme (Clermont-Ferrand)
+    "64": (43.296, -0.370),   # Pyrénées-Atlantiques (Pau)
+    "65": (43.233, 0.078),    # Hautes-Pyrénées (Tarbes)
+    "66": (42.699, 2.895),    # Pyrénées-Orientales (Perpignan)
+    "67": (48.573, 7.752),    # Bas-Rhin (Strasbourg)
+    "68": (48.079, 7.358),    # Haut-Rhin (Colmar)
+    "69": (45.764, 4.836),    # Rhône (Lyon)
+    "70": (47.622, 6.155),    # Haute-Saône (Vesoul)
+    "71": (46.307, 4.828),    # Saône-et-Loire (Mâcon)
+    "72": (48.006, 0.199),    # Sarthe (Le Mans)
+    "73": (45.564, 5.918),    # Savoie (Chambéry)
+    "74": (45.899, 6.129),    # Haute-Savoie (Annecy)
+    "75": (48.857, 2.352),    # Paris
+    "76": (49.443, 1.100),    # Seine-Maritime (Rouen)
+    "77": (48.540, 2.660),    # Seine-et-Marne (Melun)
+    "78": (48.801, 2.130),    # Yvelines (Versailles)
+    "79": (46.323, -0.464),   # Deux-Sèvres (Niort)
+    "80": (49.894, 2.296),    # Somme (Amiens)
+    "81": (43.929, 2.148),    # Tarn (Albi)
+    "82": (44.018, 1.355),    # Tarn-et-Garonne (Montauban)
+    "83": (43.124, 5.928),    # Var (Toulon)
+    "84": (43.949, 4.806),    # Vaucluse (Avignon)
+    "85": (46.670, -1.426),   # Vendée (La Roche-sur-Yon)
+    "86": (46.580, 0.340),    # Vienne (Poitiers)
+    "87": (45.834, 1.262),    # Haute-Vienne (Limoges)
+    "88": (48.174, 6.450),    # Vosges (Épinal)
+    "89": (47.798, 3.567),    # Yonne (Auxerre)
+    "90": (47.640, 6.863),    # Territoire de Belfort (Belfort)
+    "91": (48.629, 2.441),    # Essonne (Évry-Courcouronnes)
+    "92": (48.892, 2.207),    # Hauts-de-Seine (Nanterre)
+    "93": (48.909, 2.440),    # Seine-Saint-Denis (Bobigny)
+    "94": (48.790, 2.455),    # Val-de-Marne (Créteil)
+    "95": (49.036, 2.076),    # Val-d'Oise (Cergy)
+}
+
+
 # ============================================================================
 # FONCTIONS UTILITAIRES
 # ============================================================================
@@ -781,6 +896,114 @@ def normalize_name(name):
     return name.lower().strip()
 
 
+def fold_name(name):
+    """
+    Forme canonique d'un nom : minuscules, sans accents, tirets/apostrophes
+    remplacés par des espaces ("Côtes-d'Armor" → "cotes d armor").
+    """
+    if not name:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", name.lower())
+    ascii_name = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(re.split(r"[\s\-'’_,.()/]+", ascii_name)).strip()
+
+
+# ============================================================================
+# RÉSOLUTION DES NOMS (table exacte + automates)
+# ============================================================================
+#
+# Construits une fois à l'import à partir de NOMINATIM_TO_ALLOCINE, sur les
+# clés repliées par fold_name (la première clé de la table l'emporte) :
+# - _FOLDED_NAMES : correspondance exacte
+# - automate d'Aho-Corasick : clés contenues dans le nom (mots entiers),
+#   la plus longue gagne ("charente maritime" avant "charente")
+# - trie des suffixes de clés (à chaque début de mot) : nom contenu dans
+#   une clé ("garonne" → "haute garonne"), la clé la plus ancienne gagne
+
+# Longueur minimale d'un nom pour la recherche « nom contenu dans une clé »
+MIN_PARTIAL_LENGTH = 3
+
+_FOLDED_NAMES = {}
+for _key, _value in NOMINATIM_TO_ALLOCINE.items():
+    _FOLDED_NAMES.setdefault(fold_name(_key), _value)
+_FOLDED_KEYS = list(_FOLDED_NAMES)
+
+
+def _build_contained_automaton(keys):
+    """Automate d'Aho-Corasick : (transitions, liens d'échec, clés reconnues par état)."""
+    goto, fail, out = [{}], [0], [[]]
+    for key_id, key in enumerate(keys):
+        state = 0
+        for char in key:
+            if char not in goto[state]:
+                goto.append({})
+                fail.append(0)
+                out.append([])
+                goto[state][char] = len(goto) - 1
+            state = goto[state][char]
+        out[state].append(key_id)
+    queue = list(goto[0].values())
+    for state in queue:
+        for char, child in goto[state].items():
+            queue.append(child)
+            fallback = fail[state]
+            while fallback and char not in goto[fallback]:
+                fallback = fail[fallback]
+            fail[child] = goto[fallback].get(char, 0) if goto[fallback].get(char) != child else 0
+            out[child] = out[child] + out[fail[child]]
+    return goto, fail, out
+
+
+def _build_suffix_trie(keys):
+    """Trie des suffixes de clés commençant en début de mot : nœud → (enfants, clé)."""
+    root = ({}, None)
+    for key_id, key in enumerate(keys):
+        starts = [0] + [i + 1 for i, c in enumerate(key) if c == " "]
+        for start in starts:
+            node = root
+            for char in key[start:]:
+                if char not in node[0]:
+                    node[0][char] = ({}, key_id)  # première clé insérée = la plus ancienne
+                node = node[0][char]
+    return root
+
+
+_AC_GOTO, _AC_FAIL, _AC_OUT = _build_contained_automaton(_FOLDED_KEYS)
+_SUFFIX_TRIE = _build_suffix_trie(_FOLDED_KEYS)
+
+
+def _find_contained_key(folded):
+    """Clé la plus longue présente en mots entiers dans le nom (un seul passage)."""
+    best = None
+    state = 0
+    for end, char in enumerate(folded, 1):
+        while state and char not in _AC_GOTO[state]:
+            state = _AC_FAIL[state]
+        state = _AC_GOTO[state].get(char, 0)
+        if not _AC_OUT[state] or (end < len(folded) and folded[end] != " "):
+            continue
+        for key_id in _AC_OUT[state]:
+            start = end - len(_FOLDED_KEYS[key_id])
+            if start and folded[start - 1] != " ":
+                continue
+            if best is None or (len(_FOLDED_KEYS[key_id]), -key_id) > (len(_FOLDED_KEYS[best]), -best):
+                best = key_id
+    return best
+
+
+def _find_containing_key(folded):
+    """Clé la plus ancienne contenant le nom à partir d'un début de mot."""
+    if len(folded) < MIN_PARTIAL_LENGTH:
+        return None
+    node = _SUFFIX_TRIE
+    for char in folded:
+        node = node[0].get(char)
+        if node is None:
+            return None
+    return node[1]
+
+
+@lru_cache(maxsize=4096)
 def get_allocine_dept_id(nominatim_name):
     """
     Retourne l'ID Allociné pour un nom de département/ville/région Nominatim.
@@ -794,16 +1017,18 @@ def get_allocine_dept_id(nominatim_name):
     if not nominatim_name:
         return None
     
-    normalized = normalize_name(nominatim_name)
+    folded = fold_name(nominatim_name)
     
-    # Recherche exacte
-    if normalized in NOMINATIM_TO_ALLOCINE:
-        return NOMINATIM_TO_ALLOCINE[normalized]
+    # Recherche exacte (accents, casse et ponctuation ignorés)
+    if folded in _FOLDED_NAMES:
+        return _FOLDED_NAMES[folded]
     
-    # Recherche partielle (le nom Nominatim contient le nom du mapping)
-    for key, value in NOMINATIM_TO_ALLOCINE.items():
-        if key in normalized or normalized in key:
-            return value
+    # Recherche partielle : le nom contient une clé, sinon une clé contient le nom
+    key_id = _find_contained_key(folded)
+    if key_id is None:
+        key_id = _find_containing_key(folded)
+    if key_id is not None:
+        return _FOLDED_NAMES[_FOLDED_KEYS[key_id]]
     
     return None
 
@@ -841,18 +1066,25 @@ def get_allocine_dept_id_from_postcode(postcode):
     return None
 
 
-def get_all_dept_ids_for_location(nominatim_name, postcode=None):
+def get_all_dept_ids_for_location(nominatim_name, postcode=None, radius_km=None):
     """
     Retourne une liste d'IDs Allociné pour une localisation.
     Pour l'Île-de-France, retourne tous les départements IDF.
+    Avec un rayon, retourne les départements à portée, du plus proche au plus lointain.
     
     Args:
         nominatim_name: Nom de la localisation
         postcode: Code postal (optionnel, plus fiable)
+        radius_km: Rayon de recherche en km (optionnel)
     
     Returns:
         Liste d'IDs Allociné
     """
+    if radius_km is not None:
+        dept_ids = _get_dept_ids_within(nominatim_name, postcode, radius_km)
+        if dept_ids:
+            return dept_ids
+    
     # Si code postal disponible, l'utiliser en priorité
     if postcode:
         dept_id = get_allocine_dept_id_from_postcode(postcode)
@@ -880,6 +1112,175 @@ def get_all_dept_ids_for_location(nominatim_name, postcode=None):
     return []
 
 
+def _get_dept_ids_within(nominatim_name, postcode, radius_km):
+    """
+    IDs Allociné des départements à moins de `radius_km` (approximatif, voir
+    estimate_extents), ou [] si indéterminable.
+    """
+    dept_id = get_allocine_dept_id_from_postcode(postcode) if postcode else None
+    if not dept_id and nominatim_name:
+        dept_id = get_allocine_dept_id(nominatim_name)
+    dept_code = ALLOCINE_TO_DEPARTMENT.get(dept_id)
+    depts = departments_within(dept_code, radius_km) if dept_code else None
+    if depts is None:
+        return []
+    dept_ids = []
+    for _, _, code in DEPARTMENT_NEIGHBOURHOODS[dept_code]["entries"]:
+        code_id = POSTCODE_TO_ALLOCINE.get(code)
+        if code in depts and code_id and code_id not in dept_ids:
+            dept_ids.append(code_id)
+    return dept_ids
+
+
+def _build_adjacency_graph():
+    """Graphe d'adjacence symétrique (ADJACENT_DEPARTMENTS n'est pas réciproque partout)."""
+    graph = {}
+    for code, neighbours in ADJACENT_DEPARTMENTS.items():
+        for neighbour in neighbours:
+            graph.setdefault(code, set()).add(neighbour)
+            graph.setdefault(neighbour, set()).add(code)
+    return {code: frozenset(neighbours) for code, neighbours in graph.items()}
+
+
+ADJACENCY_GRAPH = _build_adjacency_graph()
+
+# ID Allociné → code département (le premier code listé l'emporte)
+ALLOCINE_TO_DEPARTMENT = {}
+for _code, _allocine_id in POSTCODE_TO_ALLOCINE.items():
+    ALLOCINE_TO_DEPARTMENT.setdefault(_allocine_id, _code)
+
+
+def get_adjacent_departments(dept_code, hops=1):
+    """
+    Retourne les codes département à au plus `hops` sauts du département donné
+    (lui compris), ou None si le département est absent du graphe (DOM-TOM...).
+
+    Args:
+        dept_code: Code département (ex: "31", "2A")
+        hops: Nombre de sauts dans le graphe d'adjacence (0 = le département seul)
+    """
+    if dept_code not in ADJACENCY_GRAPH:
+        return None
+    seen = {dept_code}
+    frontier = {dept_code}
+    for _ in range(hops):
+        frontier = {n for code in frontier for n in ADJACENCY_GRAPH[code]} - seen
+        if not frontier:
+            break
+        seen |= frontier
+    return frozenset(seen)
+
+
+# ============================================================================
+# VOISINAGES MULTI-SAUTS
+# ============================================================================
+
+# Profondeur (en sauts d'adjacence) des voisinages précalculés ; rayon au-delà
+# → parcours complet (reprise par reference_data.DepartmentIndex)
+DEPT_NEIGHBOURHOOD_HOPS = int(os.environ.get('DEPT_NEIGHBOURHOOD_HOPS', 4))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distance orthodromique en km."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def build_neighbourhood_table(centroids, extents=None, max_hops=DEPT_NEIGHBOURHOOD_HOPS):
+    """
+    Précalcule, pour chaque département, son voisinage à `max_hops` sauts trié
+    par distance, avec les ensembles cumulés correspondants.
+
+    La distance retenue entre deux départements est celle de leurs centroïdes
+    diminuée de leurs rayons (`extents`, en km). C'est un minorant de la
+    distance entre deux points des deux départements seulement si chaque rayon
+    majore la distance du centroïde à tout point du département ; avec des
+    rayons approchés (estimate_extents), la table est elle-même approchée.
+
+    Args:
+        centroids: {code: (lat, lon)}
+        extents: {code: rayon en km} (optionnel, 0 par défaut)
+        max_hops: Profondeur du voisinage
+
+    Returns:
+        {code: {"entries": [(distance_km, sauts, code)], "distances": [...],
+                "sets": [frozenset cumulés], "reach_km": distance au premier
+                département hors voisinage}}
+    """
+    extents = extents or {}
+    table = {}
+    for origin, (o_lat, o_lon) in centroids.items():
+        hops_by_dept = {}
+        for hops in range(max_hops + 1):
+            ring = get_adjacent_departments(origin, hops)
+            if ring is None:
+                break
+            for dept in ring:
+                hops_by_dept.setdefault(dept, hops)
+        if not hops_by_dept:
+            continue
+
+        def bound(dept):
+            d_lat, d_lon = centroids[dept]
+            distance = haversine_km(o_lat, o_lon, d_lat, d_lon)
+            return max(0.0, distance - extents.get(origin, 0.0) - extents.get(dept, 0.0))
+
+        entries = sorted(
+            (0.0 if dept == origin else bound(dept), hops, dept)
+            for dept, hops in hops_by_dept.items() if dept in centroids
+        )
+        sets, members = [], set()
+        for _, _, dept in entries:
+            members.add(dept)
+            sets.append(frozenset(members))
+        outside = [bound(dept) for dept in centroids if dept not in hops_by_dept]
+        table[origin] = {
+            "entries": entries,
+            "distances": [entry[0] for entry in entries],
+            "sets": sets,
+            "reach_km": min(outside) if outside else math.inf,
+        }
+    return table
+
+
+def departments_within(dept_code, radius_km, table=None):
+    """
+    Départements (codes) pouvant se trouver à moins de `radius_km` du
+    département donné, en une recherche dichotomique dans la table.
+    None si le département est inconnu ou si le rayon dépasse le voisinage
+    précalculé (l'appelant doit alors tout parcourir).
+    """
+    entry = (DEPARTMENT_NEIGHBOURHOODS if table is None else table).get(dept_code)
+    if entry is None or radius_km >= entry["reach_km"]:
+        return None
+    return entry["sets"][bisect_right(entry["distances"], radius_km) - 1]
+
+
+def estimate_extents(centroids):
+    """
+    Rayon approximatif de chaque département : la moitié de la distance au
+    centroïde voisin (adjacent) le plus proche. Ce n'est PAS un majorant (un
+    département allongé dépasse ce rayon) : faute de contours géographiques,
+    DEPARTMENT_NEIGHBOURHOODS et _get_dept_ids_within sont approximatifs près
+    de la limite du rayon. DepartmentIndex (reference_data) calcule ses propres
+    rayons, majorants, à partir des emprises des cinémas.
+    """
+    extents = {}
+    for dept, (lat, lon) in centroids.items():
+        distances = [
+            haversine_km(lat, lon, *centroids[neighbour])
+            for neighbour in ADJACENCY_GRAPH.get(dept, ()) if neighbour in centroids
+        ]
+        extents[dept] = min(distances) / 2 if distances else 0.0
+    return extents
+
+
+DEPARTMENT_NEIGHBOURHOODS = build_neighbourhood_table(
+    DEPARTMENT_CENTROIDS, estimate_extents(DEPARTMENT_CENTROIDS)
+)
+
+
 def is_in_idf(nominatim_name=None, postcode=None):
     """Vérifie si une localisation est en Île-de-France."""
     if postcode:
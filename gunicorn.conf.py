@@ -0,0 +1,52 @@
+"""
+Configuration gunicorn GEDEON (lue automatiquement par `gunicorn app:app`)
+
+Mode preload : l'application (snapshots mmap des cinémas/salons, constantes)
+est chargée une seule fois dans le master avant le fork. Le GC, coupé pendant
+le chargement, est gelé puis réactivé dans le master dès qu'il est prêt, et de
+nouveau gelé juste avant chaque fork pour que les objets hérités ne soient plus
+touchés par le collecteur : leurs pages restent partagées (copy-on-write)
+entre les workers.
+GUNICORN_PRELOAD=0 revient au chargement par worker.
+"""
+
+import gc
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+if preload_app:
+    # Pas de collecte pendant le chargement : les objets restent compacts et non touchés
+    gc.disable()
+
+
+def when_ready(server):
+    """Master prêt (application préchargée) : GC réactivé, rapport mémoire de référence."""
+    if preload_app:
+        # Objets du chargement gelés, puis collecte normale dans le master
+        # (qui vit aussi longtemps que le serveur et relance des workers)
+        gc.collect()
+        gc.freeze()
+        gc.enable()
+        from app import memory_stats
+        server.log.info("Master préchargé, mémoire: %s", memory_stats())
+
+
+def pre_fork(server, worker):
+    """Gel des objets du master juste avant le fork."""
+    if preload_app:
+        gc.collect()
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    """Réactive le GC dans le worker (les objets gelés en sont exclus)."""
+    if preload_app:
+        gc.enable()
+
+
+def post_worker_init(worker):
+    """Rapport mémoire par worker (PSS / pages partagées)."""
+    if preload_app:
+        from app import memory_stats
+        worker.log.info("Worker %s prêt, mémoire: %s", worker.pid, memory_stats())
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Ingestion des séances Allociné GEDEON (job nocturne)
+
+Parcourt tous les cinémas de cinemas_france_data.json et écrit leurs séances
+des prochains jours dans le store persistant (PostgreSQL ou SQLite) que
+/api/cinema/nearby lit avant d'appeler Allociné.
+
+- Concurrence bornée : --workers threads, un client Allociné par thread,
+  --delay secondes entre deux appels d'un même thread
+- Reprise : les cinémas terminés sont notés dans un fichier de checkpoint
+  (écrit atomiquement) ; une relance avec la même fenêtre de jours les saute.
+  Le checkpoint est supprimé quand tous les cinémas sont ingérés.
+
+Utilisation :
+    python ingest_showtimes.py                      # 7 jours, store selon SHOWTIMES_STORE
+    python ingest_showtimes.py --days 3 --workers 8
+    python ingest_showtimes.py --store sqlite --fixtures fixtures/allocine        # hors ligne
+    python ingest_showtimes.py --record fixtures/allocine --limit 20               # enregistre des fixtures
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from reference_data import load_cinemas_table, SNAPSHOT_DIR
+from allocine_client import get_client, fetch_cinema_day, FixtureAllocineClient, RecordingAllocineClient
+from showtime_store import create_store
+
+DEFAULT_DAYS = 7
+DEFAULT_WORKERS = 4
+DEFAULT_DELAY = 0.5
+# Fréquence d'écriture du checkpoint (cinémas terminés)
+CHECKPOINT_EVERY = 25
+DEFAULT_CHECKPOINT = os.path.join(SNAPSHOT_DIR, 'ingest_showtimes.checkpoint.json')
+
+
+# ============================================================================
+# CHECKPOINT
+# ============================================================================
+
+def load_checkpoint(path, days):
+    """Cinémas déjà ingérés pour cette fenêtre de jours (vide si autre fenêtre)."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    if checkpoint.get('days') != [day.isoformat() for day in days]:
+        return set()
+    return set(checkpoint.get('done', []))
+
+
+def save_checkpoint(path, days, done):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'days': [day.isoformat() for day in days], 'done': sorted(done)}, f)
+    os.replace(path + '.tmp', path)
+
+
+# ============================================================================
+# INGESTION
+# ============================================================================
+
+class Ingestion:
+    """Ingestion des séances d'une liste de cinémas sur une fenêtre de jours."""
+
+    def __init__(self, store, days, make_client, delay=DEFAULT_DELAY):
+        self.store = store
+        self.days = days
+        self.make_client = make_client
+        self.delay = delay
+        self._local = threading.local()
+
+    def _client(self):
+        # Un client par thread (pas de partage d'état HTTP entre threads)
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.make_client()
+        return client
+
+    def ingest_cinema(self, cinema_id):
+        """Récupère et stocke toutes les journées d'un cinéma. True si complet."""
+        client = self._client()
+        movies_by_day = {}
+        for day in self.days:
+            movies = fetch_cinema_day(client, cinema_id, day)
+            if movies is not None:
+                movies_by_day[day] = movies
+            if self.delay:
+                time.sleep(self.delay)
+        if movies_by_day:
+            self.store.put_days(cinema_id, movies_by_day)
+        return len(movies_by_day) == len(self.days)
+
+    def run(self, cinema_ids, workers, checkpoint_path=None):
+        """Ingère les cinémas non encore terminés. Retourne (terminés, en échec)."""
+        done = load_checkpoint(checkpoint_path, self.days) if checkpoint_path else set()
+        pending = [cinema_id for cinema_id in cinema_ids if cinema_id not in done]
+        if done:
+            print(f"↩️  Reprise : {len(done)} cinémas déjà ingérés, {len(pending)} restants")
+
+        failed = []
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.ingest_cinema, cinema_id): cinema_id for cinema_id in pending}
+            for count, future in enumerate(as_completed(futures), 1):
+                cinema_id = futures[future]
+                try:
+                    complete = future.result()
+                except Exception as e:
+                    print(f"   ❌ {cinema_id}: {e}")
+                    complete = False
+                if complete:
+                    done.add(cinema_id)
+                else:
+                    failed.append(cinema_id)
+                if checkpoint_path and count % CHECKPOINT_EVERY == 0:
+                    save_checkpoint(checkpoint_path, self.days, done)
+                    print(f"   ⏳ {count}/{len(pending)} cinémas ({time.time() - start_time:.0f}s)")
+
+        if checkpoint_path:
+            if failed:
+                save_checkpoint(checkpoint_path, self.days, done)
+            else:
+                try:
+                    os.remove(checkpoint_path)
+                except OSError:
+                    pass
+        return len(done), failed
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingestion des séances Allociné dans le store persistant")
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help="jours à ingérer à partir d'aujourd'hui")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="threads de récupération")
+    parser.add_argument('--delay', type=float, default=DEFAULT_DELAY, help="pause (s) entre deux appels d'un thread")
+    parser.add_argument('--store', default=os.environ.get('SHOWTIMES_STORE'), help="postgres | sqlite")
+    parser.add_argument('--sqlite-path', default=os.environ.get('SHOWTIMES_SQLITE_PATH'))
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help="fichier de reprise ('' pour désactiver)")
+    parser.add_argument('--fixtures', help="rejouer des fixtures enregistrées au lieu de l'API")
+    parser.add_argument('--record', help="enregistrer les réponses de l'API dans ce dossier de fixtures")
+    parser.add_argument('--limit', type=int, help="n'ingérer que les N premiers cinémas")
+    args = parser.parse_args(argv)
+
+    database_url = os.environ.get('DATABASE_URL_RENDER') or os.environ.get('DATABASE_URL')
+    backend = args.store or ('postgres' if database_url else 'sqlite')
+    if backend == 'postgres' and not database_url:
+        print("⚠️ DATABASE_URL not set")
+        return 1
+    store = create_store(
+        backend,
+        get_connection=lambda: psycopg2.connect(database_url, cursor_factory=RealDictCursor),
+        sqlite_path=args.sqlite_path,
+    )
+    if store is None:
+        print(f"⚠️ Store inconnu: {backend}")
+        return 2
+
+    if args.fixtures:
+        make_client = lambda: FixtureAllocineClient(args.fixtures)
+    elif args.record:
+        make_client = lambda: RecordingAllocineClient(get_client(), args.record)
+    else:
+        make_client = get_client
+
+    table = load_cinemas_table()
+    if table is None:
+        print("⚠️ Fichier cinemas_france_data.json non trouvé")
+        return 1
+    cinema_ids = [table.string('id', i) for i in range(len(table))]
+    cinema_ids = [cinema_id for cinema_id in dict.fromkeys(cinema_ids) if cinema_id]
+    if args.limit:
+        cinema_ids = cinema_ids[:args.limit]
+
+    today = date.today()
+    days = [today + timedelta(days=n) for n in range(args.days)]
+    store.purge(today)
+
+    print(f"🎬 Ingestion: {len(cinema_ids)} cinémas × {len(days)} jours → {backend} ({args.workers} threads)")
+    start_time = time.time()
+    ingestion = Ingestion(store, days, make_client, delay=args.delay)
+    done, failed = ingestion.run(cinema_ids, args.workers, checkpoint_path=args.checkpoint or None)
+    print(f"✅ {done} cinémas ingérés en {time.time() - start_time:.0f}s, {len(failed)} en échec")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Métriques GEDEON par processus (par worker gunicorn)
+- observe(nom, mesure, valeur) : série (nombre, total, max) par nom et mesure
+  (ex. taille des réponses et temps d'encodage par endpoint)
+- increment(nom, mesure) : simple compteur
+- snapshot() : état courant, exposé par /health/metrics
+
+Utilisation :
+    import metrics
+    metrics.observe('get_nearby_cinema', 'encode_ms', 1.8)
+"""
+
+import threading
+
+_lock = threading.Lock()
+_series = {}    # (nom, mesure) → [nombre, total, max]
+_counters = {}  # (nom, mesure) → valeur
+
+
+def observe(name, metric, value):
+    """Ajoute une observation à la série (nom, mesure)."""
+    with _lock:
+        serie = _series.get((name, metric))
+        if serie is None:
+            _series[(name, metric)] = [1, value, value]
+        else:
+            serie[0] += 1
+            serie[1] += value
+            if value > serie[2]:
+                serie[2] = value
+
+
+def increment(name, metric, amount=1):
+    """Incrémente le compteur (nom, mesure)."""
+    with _lock:
+        _counters[(name, metric)] = _counters.get((name, metric), 0) + amount
+
+
+def snapshot():
+    """Retourne {nom: {mesure: {count, avg, max, total} ou valeur du compteur}}."""
+    result = {}
+    with _lock:
+        for (name, metric), (count, total, peak) in _series.items():
+            result.setdefault(name, {})[metric] = {
+                "count": count,
+                "avg": round(total / count, 3),
+                "max": round(peak, 3),
+                "total": round(total, 3),
+            }
+        for (name, metric), value in _counters.items():
+            result.setdefault(name, {})[metric] = value
+    return result
+
+
+def reset():
+    """Remet toutes les métriques à zéro."""
+    with _lock:
+        _series.clear()
+        _counters.clear()
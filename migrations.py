@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+Migrations de schéma GEDEON (table schema_version)
+
+Au démarrage, une seule requête vérifie la version du schéma ; les migrations
+en attente ne sont appliquées que si nécessaire, sous verrou consultatif
+PostgreSQL (un seul worker gunicorn les exécute).
+
+Utilisation :
+    from migrations import ensure_schema
+    ensure_schema(get_db_connection)
+
+En ligne de commande (hors démarrage web) :
+    python migrations.py            # applique les migrations en attente
+    python migrations.py status     # affiche la version courante
+    python migrations.py backfill-search   # remplit et indexe la recherche (hors démarrage)
+"""
+
+import os
+import sys
+
+import psycopg2
+from psycopg2.errors import UndefinedTable
+from psycopg2.extras import RealDictCursor
+
+# Clé du verrou consultatif (pg_advisory_lock) réservé aux migrations
+MIGRATION_LOCK_ID = 4_337_001
+
+
+# ============================================================================
+# MIGRATIONS (version, description, requêtes) — ne jamais modifier une migration livrée
+# ============================================================================
+
+MIGRATION_0001 = [
+    """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            pseudo VARCHAR(25) NOT NULL,
+            pseudo_number INT NOT NULL DEFAULT 1,
+            email VARCHAR(255) NOT NULL UNIQUE,
+            password_hash VARCHAR(255) NOT NULL,
+            email_confirmed BOOLEAN DEFAULT FALSE,
+            confirmation_token VARCHAR(64),
+            confirmation_sent_at TIMESTAMP,
+            reset_token VARCHAR(64),
+            reset_sent_at TIMESTAMP,
+            device_id VARCHAR(64),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(pseudo, pseudo_number)
+        )
+    """,
+    """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='email') THEN
+                ALTER TABLE users ADD COLUMN email VARCHAR(255);
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='email_confirmed') THEN
+                ALTER TABLE users ADD COLUMN email_confirmed BOOLEAN DEFAULT FALSE;
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='confirmation_token') THEN
+                ALTER TABLE users ADD COLUMN confirmation_token VARCHAR(64);
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='confirmation_sent_at') THEN
+                ALTER TABLE users ADD COLUMN confirmation_sent_at TIMESTAMP;
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='reset_token') THEN
+                ALTER TABLE users ADD COLUMN reset_token VARCHAR(64);
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='reset_sent_at') THEN
+                ALTER TABLE users ADD COLUMN reset_sent_at TIMESTAMP;
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='password_hash') THEN
+                ALTER TABLE users ADD COLUMN password_hash VARCHAR(255);
+            END IF;
+            -- Migration: ajouter pseudo_number et ajuster les contraintes
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='pseudo_number') THEN
+                ALTER TABLE users ADD COLUMN pseudo_number INT NOT NULL DEFAULT 1;
+                -- Supprimer l'ancienne contrainte UNIQUE sur pseudo seul si elle existe
+                IF EXISTS (SELECT 1 FROM information_schema.table_constraints WHERE table_name='users' AND constraint_type='UNIQUE' AND constraint_name='users_pseudo_key') THEN
+                    ALTER TABLE users DROP CONSTRAINT users_pseudo_key;
+                END IF;
+                -- Ajouter la contrainte UNIQUE composite (pseudo, pseudo_number)
+                IF NOT EXISTS (SELECT 1 FROM information_schema.table_constraints WHERE table_name='users' AND constraint_name='users_pseudo_pseudo_number_key') THEN
+                    ALTER TABLE users ADD CONSTRAINT users_pseudo_pseudo_number_key UNIQUE (pseudo, pseudo_number);
+                END IF;
+            END IF;
+            -- Ajouter colonne preferences JSONB si elle n'existe pas
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='preferences') THEN
+                ALTER TABLE users ADD COLUMN preferences JSONB DEFAULT '{}';
+            END IF;
+            -- Agrandir pseudo si nécessaire
+            ALTER TABLE users ALTER COLUMN pseudo TYPE VARCHAR(25);
+        END $$;
+    """,
+    # Colonne image sur la table evenements (si elle existe)
+    """
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name='evenements') THEN
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='evenements' AND column_name='image') THEN
+                    ALTER TABLE evenements ADD COLUMN image TEXT DEFAULT NULL;
+                END IF;
+            END IF;
+        END $$;
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)",
+    "CREATE INDEX IF NOT EXISTS idx_users_pseudo ON users(pseudo)",
+    "CREATE INDEX IF NOT EXISTS idx_users_confirmation_token ON users(confirmation_token)",
+]
+
+MIGRATION_0002 = [
+    """
+        CREATE TABLE IF NOT EXISTS pseudo_counters (
+            pseudo_key VARCHAR(25) PRIMARY KEY,
+            last_number INT NOT NULL
+        )
+    """,
+    """
+        INSERT INTO pseudo_counters (pseudo_key, last_number)
+        SELECT LOWER(pseudo), MAX(pseudo_number) FROM users GROUP BY LOWER(pseudo)
+        ON CONFLICT (pseudo_key) DO UPDATE
+            SET last_number = GREATEST(pseudo_counters.last_number, EXCLUDED.last_number)
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_users_pseudo_lower ON users(LOWER(pseudo))",
+]
+
+MIGRATION_0003 = [
+    """
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            sid VARCHAR(64) PRIMARY KEY,
+            data JSONB NOT NULL,
+            expires_at TIMESTAMPTZ NOT NULL
+        )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_user_sessions_expires ON user_sessions(expires_at)",
+]
+
+# Recherche plein texte : colonnes tsvector (configuration french) tenues à jour
+# par trigger. Uniquement des changements de catalogue (colonne nullable, sans
+# réécriture de table) : le remplissage par lots et les index GIN / trigrammes
+# sont faits hors démarrage par `python migrations.py backfill-search`.
+MIGRATION_0004 = [
+    # pg_trgm est optionnelle (la recherche retombe sur le plein texte seul) :
+    # absente ou non installable, elle est sautée sans bloquer les migrations suivantes
+    """
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+                BEGIN
+                    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+                EXCEPTION WHEN insufficient_privilege THEN
+                    RAISE WARNING 'pg_trgm non installable (droits insuffisants) : recherche sans trigrammes';
+                END;
+            ELSE
+                RAISE WARNING 'pg_trgm indisponible sur ce serveur : recherche sans trigrammes';
+            END IF;
+        END $$;
+    """,
+    """
+        CREATE OR REPLACE FUNCTION evenements_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(to_tsvector('french', COALESCE(NEW.nom, '')), 'A') ||
+                setweight(to_tsvector('french', COALESCE(NEW.description, '')), 'B');
+            RETURN NEW;
+        END $$ LANGUAGE plpgsql
+    """,
+    """
+        CREATE OR REPLACE FUNCTION scanned_events_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(to_tsvector('french', COALESCE(NEW.title, '')), 'A') ||
+                setweight(to_tsvector('french', COALESCE(NEW.description, '')), 'B');
+            RETURN NEW;
+        END $$ LANGUAGE plpgsql
+    """,
+    # evenements est alimentée hors de l'application : elle peut ne pas exister
+    """
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name='evenements') THEN
+                ALTER TABLE evenements ADD COLUMN IF NOT EXISTS search_vector tsvector;
+                DROP TRIGGER IF EXISTS evenements_search_vector ON evenements;
+                CREATE TRIGGER evenements_search_vector
+                    BEFORE INSERT OR UPDATE OF nom, description ON evenements
+                    FOR EACH ROW EXECUTE FUNCTION evenements_search_vector_update();
+            END IF;
+        END $$;
+    """,
+    """
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name='scanned_events') THEN
+                ALTER TABLE scanned_events ADD COLUMN IF NOT EXISTS search_vector tsvector;
+                DROP TRIGGER IF EXISTS scanned_events_search_vector ON scanned_events;
+                CREATE TRIGGER scanned_events_search_vector
+                    BEFORE INSERT OR UPDATE OF title, description ON scanned_events
+                    FOR EACH ROW EXECUTE FUNCTION scanned_events_search_vector_update();
+            END IF;
+        END $$;
+    """,
+]
+
+# Remplissage hors démarrage (backfill-search) : (table, colonne touchée pour
+# déclencher le trigger, clé unique parcourue par lots) puis index créés sans
+# bloquer les écritures
+SEARCH_BACKFILL_TABLES = (('evenements', 'nom', 'uri'), ('scanned_events', 'title', 'id'))
+SEARCH_BACKFILL_BATCH = 5000
+# (table, nécessite pg_trgm, requête)
+SEARCH_INDEXES = (
+    ('evenements', False, "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_evenements_search ON evenements USING GIN (search_vector)"),
+    ('evenements', True, "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_evenements_nom_trgm ON evenements USING GIN (nom gin_trgm_ops)"),
+    ('evenements', True, "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_evenements_description_trgm ON evenements USING GIN (description gin_trgm_ops)"),
+    ('scanned_events', False, "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_scanned_events_search ON scanned_events USING GIN (search_vector)"),
+    ('scanned_events', True, "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_scanned_events_title_trgm ON scanned_events USING GIN (title gin_trgm_ops)"),
+)
+
+# Séances Allociné persistantes (job ingest_showtimes.py, lues avant l'API)
+MIGRATION_0005 = [
+    """
+        CREATE TABLE IF NOT EXISTS cinema_showtime_days (
+            cinema_id VARCHAR(16) NOT NULL,
+            day DATE NOT NULL,
+            film_count INT NOT NULL,
+            fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (cinema_id, day)
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS cinema_showtimes (
+            cinema_id VARCHAR(16) NOT NULL,
+            day DATE NOT NULL,
+            title TEXT NOT NULL,
+            duration TEXT,
+            starts_at TIMESTAMP,
+            version VARCHAR(8)
+        )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_cinema_showtimes_day ON cinema_showtimes(cinema_id, day)",
+    "CREATE INDEX IF NOT EXISTS idx_cinema_showtime_days_day ON cinema_showtime_days(day)",
+]
+
+# File d'emails persistante (auth_email.py) : un message n'est retiré qu'une fois envoyé
+MIGRATION_0006 = [
+    """
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            to_email VARCHAR(255) NOT NULL,
+            message TEXT NOT NULL,
+            attempts INT NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP,
+            failed_at TIMESTAMP
+        )
+    """,
+    """
+        CREATE INDEX IF NOT EXISTS idx_email_outbox_pending ON email_outbox(next_attempt_at)
+        WHERE sent_at IS NULL AND failed_at IS NULL
+    """,
+]
+
+MIGRATIONS = [
+    (1, "Table users et colonnes historiques", MIGRATION_0001),
+    (2, "Compteurs de numéros de pseudo", MIGRATION_0002),
+    (3, "Sessions côté serveur", MIGRATION_0003),
+    (4, "Recherche plein texte et trigrammes", MIGRATION_0004),
+    (5, "Séances Allociné persistantes", MIGRATION_0005),
+    (6, "File d'emails persistante", MIGRATION_0006),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# ============================================================================
+# EXÉCUTION
+# ============================================================================
+
+def get_schema_version(cur):
+    """Version courante du schéma (0 si la table schema_version n'existe pas)."""
+    try:
+        cur.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_version")
+        return cur.fetchone()['version']
+    except UndefinedTable:
+        cur.connection.rollback()
+        return 0
+
+
+def apply_migrations(conn):
+    """
+    Applique les migrations en attente sous verrou consultatif.
+    Chaque migration est commitée avec sa ligne schema_version.
+    Retourne la liste des versions appliquées.
+    """
+    cur = conn.cursor()
+    applied = []
+    cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+
+        # Relecture sous verrou : un autre worker a pu migrer entre-temps
+        current = get_schema_version(cur)
+        for version, description, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            for statement in statements:
+                cur.execute(statement)
+            cur.execute(
+                "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                (version, description)
+            )
+            conn.commit()
+            applied.append(version)
+            print(f"   ✅ Migration {version:04d} appliquée: {description}")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        conn.commit()
+        cur.close()
+    return applied
+
+
+def ensure_schema(get_connection, apply=True):
+    """
+    Chemin rapide au démarrage : une requête de version, puis migrations
+    uniquement s'il y en a en attente (et si apply=True).
+    Retourne True si le schéma est à jour.
+    """
+    try:
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            current = get_schema_version(cur)
+            cur.close()
+            if current >= LATEST_VERSION:
+                return True
+            if not apply:
+                print(f"⚠️ Schéma en version {current}, {LATEST_VERSION} attendue (python migrations.py)")
+                return False
+            apply_migrations(conn)
+            print(f"✅ Schéma migré en version {LATEST_VERSION}")
+            return True
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"❌ Erreur migrations: {e}")
+        return False
+
+
+def backfill_search_vectors(conn, batch_size=SEARCH_BACKFILL_BATCH):
+    """
+    Remplit search_vector par lots (un commit par lot, verrous de ligne
+    seulement) puis crée les index de recherche en CONCURRENTLY.
+    Les lots suivent la clé de la table (clé > dernière clé traitée) : chaque
+    lot ne lit que sa tranche. Relançable : ne touche que les lignes encore vides.
+    """
+    cur = conn.cursor()
+    for table, column, key in SEARCH_BACKFILL_TABLES:
+        cur.execute("SELECT to_regclass(%s) AS oid", (table,))
+        if cur.fetchone()['oid'] is None:
+            continue
+        total = 0
+        last_key = None
+        while True:
+            after = f"WHERE {key} > %s" if last_key is not None else f"WHERE {key} IS NOT NULL"
+            params = (last_key,) if last_key is not None else ()
+            cur.execute(
+                f"SELECT MAX({key}) AS upper FROM (SELECT {key} FROM {table} {after} ORDER BY {key} LIMIT %s) AS batch",
+                params + (batch_size,)
+            )
+            upper = cur.fetchone()['upper']
+            if upper is None:
+                break
+            # SET colonne = colonne : déclenche le trigger qui calcule search_vector
+            cur.execute(f"""
+                UPDATE {table} SET {column} = {column}
+                {after} AND {key} <= %s AND search_vector IS NULL
+            """, params + (upper,))
+            total += cur.rowcount
+            conn.commit()
+            last_key = upper
+            print(f"   ⏳ {table}: {total} lignes indexées (jusqu'à {key} = {upper})")
+        print(f"   ✅ {table}: search_vector rempli ({total} lignes)")
+
+    cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+    trigram = cur.fetchone() is not None
+    conn.commit()
+    if not trigram:
+        print("   ⚠️ pg_trgm absente : index trigrammes non créés")
+
+    # CREATE INDEX CONCURRENTLY ne peut pas tourner dans une transaction
+    conn.autocommit = True
+    try:
+        for table, needs_trigram, statement in SEARCH_INDEXES:
+            if needs_trigram and not trigram:
+                continue
+            cur.execute("SELECT to_regclass(%s) AS oid", (table,))
+            if cur.fetchone()['oid'] is not None:
+                cur.execute(statement)
+    finally:
+        conn.autocommit = False
+        cur.close()
+    print("   ✅ Index de recherche créés")
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+if __name__ == "__main__":
+    database_url = os.environ.get('DATABASE_URL_RENDER') or os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("⚠️ DATABASE_URL not set")
+        sys.exit(1)
+
+    conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    try:
+        command = sys.argv[1] if len(sys.argv) > 1 else 'migrate'
+        if command == 'status':
+            cur = conn.cursor()
+            current = get_schema_version(cur)
+            cur.close()
+            print(f"Version du schéma: {current} / {LATEST_VERSION}")
+            for version, description, _ in MIGRATIONS:
+                print(f"  {'✅' if version <= current else '⏳'} {version:04d} {description}")
+        elif command == 'migrate':
+            applied = apply_migrations(conn)
+            print(f"✅ {len(applied)} migration(s) appliquée(s), schéma en version {LATEST_VERSION}")
+        elif command == 'backfill-search':
+            backfill_search_vectors(conn)
+        else:
+            print("Usage: python migrations.py [migrate|status|backfill-search]")
+            sys.exit(2)
+    finally:
+        conn.close()
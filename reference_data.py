@@ -0,0 +1,590 @@
+#!/usr/bin/env python3
+"""
+Données de référence GEDEON (cinémas Allociné, salons) en snapshots binaires
+
+Les fichiers JSON sont nettoyés (encodage, types, dates de salons) une seule
+fois puis écrits dans un snapshot colonne par colonne :
+- colonnes numériques : tableaux de doubles (array('d'))
+- colonnes texte : table d'offsets (array('I')) + blob UTF-8
+
+Les workers ouvrent le snapshot en mmap (pages partagées par l'OS, aucun
+objet Python par ligne). Le snapshot est reconstruit automatiquement quand
+le JSON source change (taille ou date de modification).
+
+Utilisation :
+    from reference_data import load_cinemas_table, load_salons_table
+
+En ligne de commande (étape de build) :
+    python reference_data.py
+"""
+
+import os
+import re
+import json
+import math
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+
+from department_mapping import (
+    get_adjacent_departments, build_neighbourhood_table, departments_within, haversine_km, fold_name,
+    DEPT_NEIGHBOURHOOD_HOPS, DEPARTMENT_CENTROIDS,
+)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR') or os.path.join(BASE_DIR, '.snapshots')
+
+CINEMAS_JSON = os.path.join(BASE_DIR, 'cinemas_france_data.json')
+SALONS_JSON = os.path.join(BASE_DIR, 'salons_france.json')
+
+SNAPSHOT_MAGIC = b'GDNSNAP1'
+SNAPSHOT_FORMAT = 1
+
+CINEMA_STR_COLUMNS = ('id', 'name', 'address', 'city', 'dept', 'source')
+SALON_STR_COLUMNS = ('name', 'url', 'dates', 'duration', 'city', 'venue', 'frequency', 'country', 'address')
+# date_ordinal : date du salon pré-parsée (date.toordinal(), 0 si inconnue)
+SALON_FLOAT_COLUMNS = ('lat', 'lon', 'date_ordinal')
+CINEMA_FLOAT_COLUMNS = ('lat', 'lon')
+
+
+# ============================================================================
+# ENREGISTREMENTS COMPACTS (__slots__, pas de dict par ligne)
+# ============================================================================
+
+class Cinema:
+    """Cinéma Allociné / DataGouv."""
+    __slots__ = CINEMA_STR_COLUMNS + CINEMA_FLOAT_COLUMNS
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+
+class Salon:
+    """Salon ou foire EventsEye."""
+    __slots__ = SALON_STR_COLUMNS + SALON_FLOAT_COLUMNS
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+
+class Showtime:
+    """Séance Allociné : début (datetime local), version (VF, VO, VOST), cinéma."""
+    __slots__ = ('starts_at', 'version', 'cinema_id')
+
+    def __init__(self, starts_at, version, cinema_id):
+        self.starts_at = starts_at
+        self.version = version
+        self.cinema_id = cinema_id
+
+    def __lt__(self, other):
+        return (self.starts_at, self.version) < (other.starts_at, other.version)
+
+    def __repr__(self):
+        return f"Showtime({self.starts_at.isoformat()}, {self.version}, {self.cinema_id})"
+
+
+class NearbyCinema:
+    """Résultat intermédiaire de recherche de proximité : cinéma + distance (km)."""
+    __slots__ = ('cinema', 'distance')
+
+    def __init__(self, cinema, distance):
+        self.cinema = cinema
+        self.distance = distance
+
+
+# ============================================================================
+# NETTOYAGE DES SOURCES
+# ============================================================================
+
+def fix_encoding(text):
+    """Corrige le double encodage latin-1/UTF-8 ('allÃ©e' → 'allée')."""
+    if not isinstance(text, str):
+        return text
+    try:
+        return text.encode('latin-1').decode('utf-8')
+    except (UnicodeDecodeError, UnicodeEncodeError):
+        return text
+
+
+def parse_salon_date(date_str):
+    """Parse une date de salon (formats: DD/MM/YYYY ou 'mois YYYY')."""
+    if not date_str:
+        return None
+    try:
+        if '/' in date_str:
+            return datetime.strptime(date_str, '%d/%m/%Y').date()
+
+        MOIS = {
+            'janv': 1, 'janvier': 1,
+            'fév': 2, 'fevr': 2, 'février': 2, 'fevrier': 2,
+            'mars': 3,
+            'avril': 4, 'avr': 4,
+            'mai': 5,
+            'juin': 6,
+            'juil': 7, 'juillet': 7,
+            'août': 8, 'aout': 8,
+            'sept': 9, 'septembre': 9,
+            'oct': 10, 'octobre': 10,
+            'nov': 11, 'novembre': 11,
+            'déc': 12, 'dec': 12, 'décembre': 12, 'decembre': 12
+        }
+
+        date_lower = date_str.lower().replace('.', '').strip()
+        for mois_str, mois_num in MOIS.items():
+            if mois_str in date_lower:
+                year_match = re.search(r'(\d{4})', date_str)
+                if year_match:
+                    year = int(year_match.group(1))
+                    return datetime(year, mois_num, 1).date()
+        return None
+    except Exception:
+        return None
+
+
+def _read_cinemas(path):
+    """Lit le JSON des cinémas et corrige l'encodage des noms/adresses."""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    for cinema in data:
+        if 'name' in cinema:
+            cinema['name'] = fix_encoding(cinema['name'])
+        if 'address' in cinema:
+            cinema['address'] = fix_encoding(cinema['address'])
+    return data
+
+
+def _read_salons(path):
+    """Lit le JSON des salons (liste ou {'events': [...]}) et pré-parse les dates."""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict) and 'events' in data:
+        data = data['events']
+    if not isinstance(data, list) or (data and not isinstance(data[0], dict)):
+        return []
+    for salon in data:
+        salon_date = parse_salon_date(salon.get('dates', ''))
+        salon['date_ordinal'] = salon_date.toordinal() if salon_date else 0
+    return data
+
+
+# ============================================================================
+# FORMAT DU SNAPSHOT
+# ============================================================================
+#
+# [magic 8 octets][longueur en-tête uint32][en-tête JSON][sections alignées sur 8]
+# L'en-tête décrit la source (taille, mtime), le nombre de lignes et la
+# position (offset, longueur) de chaque section.
+
+def _align(buf):
+    buf.extend(b'\0' * (-len(buf) % 8))
+
+
+def build_snapshot(records, str_columns, float_columns, source_stat=None):
+    """Sérialise une liste de dicts en snapshot binaire (bytes)."""
+    body = bytearray()
+    sections = {}
+
+    for name in float_columns:
+        values = array('d', (float(r.get(name) or 0.0) for r in records))
+        _align(body)
+        sections[name] = [len(body), len(values) * values.itemsize]
+        body.extend(values.tobytes())
+
+    for name in str_columns:
+        offsets = array('I', [0])
+        blob = bytearray()
+        for r in records:
+            value = r.get(name)
+            blob.extend(('' if value is None else str(value)).encode('utf-8'))
+            offsets.append(len(blob))
+        _align(body)
+        sections[name + '.offsets'] = [len(body), len(offsets) * offsets.itemsize]
+        body.extend(offsets.tobytes())
+        sections[name + '.blob'] = [len(body), len(blob)]
+        body.extend(blob)
+
+    header = json.dumps({
+        'format': SNAPSHOT_FORMAT,
+        'count': len(records),
+        'float_columns': list(float_columns),
+        'str_columns': list(str_columns),
+        'source_size': source_stat.st_size if source_stat else None,
+        'source_mtime_ns': source_stat.st_mtime_ns if source_stat else None,
+        'sections': sections,
+    }).encode('utf-8')
+    prefix = bytearray(SNAPSHOT_MAGIC + struct.pack('<I', len(header)) + header)
+    _align(prefix)
+    return bytes(prefix) + bytes(body)
+
+
+def _read_header(buf):
+    if bytes(buf[:8]) != SNAPSHOT_MAGIC:
+        raise ValueError("snapshot invalide")
+    (header_len,) = struct.unpack('<I', buf[8:12])
+    header = json.loads(bytes(buf[12:12 + header_len]))
+    if header.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError("format de snapshot obsolète")
+    data_start = 12 + header_len + (-(12 + header_len) % 8)
+    return header, data_start
+
+
+class SnapshotTable:
+    """Table en colonnes adossée à un snapshot (mmap ou bytes en mémoire)."""
+
+    def __init__(self, buf, record_type, mapping=None):
+        self._mapping = mapping  # garde le mmap ouvert
+        self.record_type = record_type
+        view = memoryview(buf)
+        header, start = _read_header(view)
+        self.header = header
+        self.count = header['count']
+        self.columns = {}
+        self._strings = {}
+        sections = header['sections']
+        for name in header['float_columns']:
+            offset, length = sections[name]
+            self.columns[name] = view[start + offset:start + offset + length].cast('d')
+        for name in header['str_columns']:
+            offset, length = sections[name + '.offsets']
+            offsets = view[start + offset:start + offset + length].cast('I')
+            offset, length = sections[name + '.blob']
+            self._strings[name] = (offsets, view[start + offset:start + offset + length])
+
+    def __len__(self):
+        return self.count
+
+    def column(self, name):
+        """Colonne numérique (memoryview de doubles, sans copie)."""
+        return self.columns[name]
+
+    def string(self, name, i):
+        """Valeur texte de la ligne i (décodée à la demande)."""
+        offsets, blob = self._strings[name]
+        return str(blob[offsets[i]:offsets[i + 1]], 'utf-8')
+
+    def record(self, i):
+        """Ligne i sous forme d'enregistrement compact (Cinema, Salon...)."""
+        values = []
+        for name in self.record_type.__slots__:
+            if name in self.columns:
+                values.append(self.columns[name][i])
+            else:
+                values.append(self.string(name, i))
+        return self.record_type(*values)
+
+
+# Écart max (en degrés) à la médiane du département pour être indexé dans celui-ci
+DEPT_OUTLIER_DEGREES = 1.5
+# Géocodage inverse local : grille de recherche des cinémas, tuiles de cache
+# (~1 km) et distance max au cinéma le plus proche pour conclure
+GEO_GRID_DEGREES = 0.25
+GEO_TILE_DEGREES = 0.01
+GEO_TILE_CACHE_MAX = 50000
+GEO_MAX_DEGREES = 1.0
+# Coordonnées partagées par au moins autant de cinémas : géocodage par défaut
+# (ex. tous les cinémas de l'Essonne placés au centre de Paris), ignorées
+GEO_PLACEHOLDER_MIN = 5
+
+
+class DepartmentIndex:
+    """
+    Index des lignes d'une table par département (colonne 'dept') :
+    emprise (bbox) de chaque département, table des voisinages à distance et
+    listes de candidats mises en cache par ensemble de départements. Sert aussi de géocodage inverse
+    hors ligne (point → département du cinéma indexé le plus proche).
+    """
+
+    def __init__(self, table):
+        self.table = table
+        rows = {}
+        unindexed = array('I')
+        for i in range(len(table)):
+            dept = table.string('dept', i)
+            if dept and get_adjacent_departments(dept, 0) is not None:
+                rows.setdefault(dept, array('I')).append(i)
+            else:
+                unindexed.append(i)  # sans département ou hors graphe : toujours candidats
+        # Certains cinémas sont géocodés loin de leur département : écartés de
+        # l'index (et donc toujours candidats) pour garder des emprises serrées
+        lats, lons = table.column('lat'), table.column('lon')
+        for dept, indices in rows.items():
+            med_lat = sorted(lats[i] for i in indices)[len(indices) // 2]
+            med_lon = sorted(lons[i] for i in indices)[len(indices) // 2]
+            kept = array('I')
+            for i in indices:
+                if abs(lats[i] - med_lat) <= DEPT_OUTLIER_DEGREES and abs(lons[i] - med_lon) <= DEPT_OUTLIER_DEGREES:
+                    kept.append(i)
+                else:
+                    unindexed.append(i)
+            rows[dept] = kept
+        self.rows = rows
+        self.unindexed = unindexed
+        self.bboxes = {}
+        self.centroids = {}
+        for dept, indices in rows.items():
+            points = [(lats[i], lons[i]) for i in indices]
+            if points:
+                dept_lats = [p[0] for p in points]
+                dept_lons = [p[1] for p in points]
+                self.bboxes[dept] = (min(dept_lats), min(dept_lons), max(dept_lats), max(dept_lons))
+                self.centroids[dept] = (sum(dept_lats) / len(points), sum(dept_lons) / len(points))
+        # Rayon de chaque département : distance du centroïde au coin le plus
+        # éloigné de son emprise (tout point de l'emprise est à moins de ce rayon)
+        extents = {}
+        for dept, (min_lat, min_lon, max_lat, max_lon) in self.bboxes.items():
+            c_lat, c_lon = self.centroids[dept]
+            extents[dept] = max(
+                haversine_km(c_lat, c_lon, corner_lat, corner_lon)
+                for corner_lat in (min_lat, max_lat) for corner_lon in (min_lon, max_lon)
+            )
+        self.neighbourhoods = build_neighbourhood_table(
+            self.centroids, extents, max_hops=DEPT_NEIGHBOURHOOD_HOPS
+        )
+        self._candidates = {}
+        shared = {}
+        for i in range(len(table)):
+            shared[(lats[i], lons[i])] = shared.get((lats[i], lons[i]), 0) + 1
+        self.grid = {}
+        located = set()
+        for dept, indices in rows.items():
+            for i in indices:
+                if shared[(lats[i], lons[i])] >= GEO_PLACEHOLDER_MIN:
+                    continue
+                cell = (math.floor(lats[i] / GEO_GRID_DEGREES), math.floor(lons[i] / GEO_GRID_DEGREES))
+                self.grid.setdefault(cell, array('I')).append(i)
+                located.add(dept)
+        # Départements sans aucun cinéma localisable (ex. tous ceux de l'Essonne
+        # géocodés au centre de Paris) : représentés par leur préfecture
+        self.unlocated = {
+            dept: centroid for dept, centroid in DEPARTMENT_CENTROIDS.items() if dept not in located
+        }
+        # Cinémas hors graphe (ex. outre-mer, département « 97 ») : derniers recours
+        self.outside = array('I', (
+            i for i in unindexed
+            if table.string('dept', i) and shared[(lats[i], lons[i])] < GEO_PLACEHOLDER_MIN
+        ))
+        self._tiles = {}
+
+    def departments_at(self, lat, lon):
+        """Départements dont l'emprise contient le point."""
+        return [
+            dept for dept, (min_lat, min_lon, max_lat, max_lon) in self.bboxes.items()
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+        ]
+
+    def department_of(self, lat, lon):
+        """
+        Code département du point (celui du cinéma indexé le plus proche),
+        ou None au-delà de GEO_MAX_DEGREES. Un département voisin sans cinéma
+        localisable l'emporte si sa préfecture est plus proche que celle du
+        département trouvé (approximation, faute de contours). Résultat mis en
+        cache par tuile.
+        """
+        tile = (math.floor(lat / GEO_TILE_DEGREES), math.floor(lon / GEO_TILE_DEGREES))
+        if tile in self._tiles:
+            return self._tiles[tile]
+        if len(self._tiles) >= GEO_TILE_CACHE_MAX:
+            self._tiles.clear()
+        dept = self._nearest_department(
+            (tile[0] + 0.5) * GEO_TILE_DEGREES, (tile[1] + 0.5) * GEO_TILE_DEGREES
+        )
+        self._tiles[tile] = dept
+        return dept
+
+    def _nearest_department(self, lat, lon):
+        dept = self._nearest_located_department(lat, lon)
+        if dept is None:
+            return self._nearest_outside_department(lat, lon)
+        if not self.unlocated or dept not in DEPARTMENT_CENTROIDS:
+            return dept
+        best_km = haversine_km(lat, lon, *DEPARTMENT_CENTROIDS[dept])
+        for neighbour in get_adjacent_departments(dept, 1) or ():
+            centroid = self.unlocated.get(neighbour)
+            if centroid is not None:
+                distance = haversine_km(lat, lon, *centroid)
+                if distance < best_km:
+                    dept, best_km = neighbour, distance
+        return dept
+
+    def _nearest_outside_department(self, lat, lon):
+        # Peu de lignes : parcours linéaire
+        lats, lons = self.table.column('lat'), self.table.column('lon')
+        cos_lat = math.cos(math.radians(lat))
+        best, best_d2 = None, (GEO_MAX_DEGREES ** 2)
+        for i in self.outside:
+            d2 = (lats[i] - lat) ** 2 + ((lons[i] - lon) * cos_lat) ** 2
+            if d2 < best_d2:
+                best, best_d2 = i, d2
+        return self.table.string('dept', best) if best is not None else None
+
+    def _nearest_located_department(self, lat, lon):
+        # Parcours de la grille par anneaux jusqu'à ce qu'aucune cellule plus
+        # lointaine ne puisse contenir un cinéma plus proche
+        lats, lons = self.table.column('lat'), self.table.column('lon')
+        cos_lat = math.cos(math.radians(lat))
+        cell_lat, cell_lon = math.floor(lat / GEO_GRID_DEGREES), math.floor(lon / GEO_GRID_DEGREES)
+        best, best_d2 = None, (GEO_MAX_DEGREES ** 2)
+        max_ring = int(GEO_MAX_DEGREES / (GEO_GRID_DEGREES * cos_lat)) + 1
+        for ring in range(max_ring + 1):
+            if best is not None and ((ring - 1) * GEO_GRID_DEGREES * cos_lat) ** 2 > best_d2:
+                break
+            for d_lat in range(-ring, ring + 1):
+                for d_lon in range(-ring, ring + 1):
+                    if max(abs(d_lat), abs(d_lon)) != ring:
+                        continue
+                    for i in self.grid.get((cell_lat + d_lat, cell_lon + d_lon), ()):
+                        d2 = (lats[i] - lat) ** 2 + ((lons[i] - lon) * cos_lat) ** 2
+                        if d2 < best_d2:
+                            best, best_d2 = i, d2
+        return self.table.string('dept', best) if best is not None else None
+
+    def candidates(self, lat, lon, radius_km):
+        """
+        Indices des lignes pouvant être à moins de `radius_km` du point : lignes
+        des départements à portée de ceux qui contiennent le point, plus les
+        lignes non indexées. None si le point est hors de toute emprise ou si
+        le rayon dépasse les voisinages précalculés.
+        """
+        depts = set()
+        for origin in self.departments_at(lat, lon):
+            reachable = departments_within(origin, radius_km, self.neighbourhoods)
+            if reachable is None:
+                return None
+            depts |= reachable
+        if not depts:
+            return None
+        key = frozenset(depts)
+        cached = self._candidates.get(key)
+        if cached is None:
+            cached = array('I', sorted(
+                [i for dept in depts for i in self.rows.get(dept, ())] + list(self.unindexed)
+            ))
+            self._candidates[key] = cached
+        return cached
+
+
+# Mots ignorés par l'index texte
+TEXT_STOPWORDS = frozenset((
+    'le', 'la', 'les', 'de', 'du', 'des', 'un', 'une', 'et', 'ou', 'au', 'aux',
+    'en', 'sur', 'pour', 'par', 'dans', 'avec', 'the', 'of', 'and',
+))
+# Longueur minimale d'un mot de requête pour la recherche par préfixe
+TEXT_PREFIX_MIN = 3
+
+
+def tokenize(text):
+    """Mots repliés (minuscules, sans accents) d'un texte, hors mots vides."""
+    return [word for word in fold_name(text).split() if len(word) > 1 and word not in TEXT_STOPWORDS]
+
+
+class TextIndex:
+    """
+    Index inversé (mot replié → lignes) sur des colonnes texte d'une table.
+    Les mots de requête assez longs correspondent aussi par préfixe.
+    """
+
+    def __init__(self, table, columns):
+        postings = {}
+        for i in range(len(table)):
+            words = set()
+            for column in columns:
+                words.update(tokenize(table.string(column, i)))
+            for word in words:
+                postings.setdefault(word, array('I')).append(i)
+        self.postings = postings
+        self.words = sorted(postings)
+
+    def _lookup(self, token):
+        if len(token) < TEXT_PREFIX_MIN:
+            return set(self.postings.get(token, ()))
+        rows = set()
+        for position in range(bisect_left(self.words, token), len(self.words)):
+            word = self.words[position]
+            if not word.startswith(token):
+                break
+            rows.update(self.postings[word])
+        return rows
+
+    def search(self, query):
+        """{indice de ligne: part des mots de la requête trouvés (0-1)}"""
+        tokens = set(tokenize(query))
+        if not tokens:
+            return {}
+        hits = {}
+        for token in tokens:
+            for i in self._lookup(token):
+                hits[i] = hits.get(i, 0) + 1
+        return {i: count / len(tokens) for i, count in hits.items()}
+
+
+def _is_fresh(path, source_stat):
+    """True si le snapshot existe et correspond à la version courante du JSON."""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(4096)
+        header, _ = _read_header(memoryview(head))
+    except (OSError, ValueError, struct.error, json.JSONDecodeError):
+        return False
+    return (header.get('source_size') == source_stat.st_size
+            and header.get('source_mtime_ns') == source_stat.st_mtime_ns)
+
+
+def load_snapshot(source_path, name, reader, record_type, str_columns, float_columns):
+    """
+    Ouvre le snapshot `name` en mmap, en le reconstruisant si le JSON a changé.
+    Si le répertoire n'est pas inscriptible, le snapshot est gardé en mémoire.
+    Retourne une SnapshotTable, ou None si la source est absente.
+    """
+    if not os.path.exists(source_path):
+        return None
+    source_stat = os.stat(source_path)
+    path = os.path.join(SNAPSHOT_DIR, name + '.snap')
+
+    if not _is_fresh(path, source_stat):
+        data = build_snapshot(reader(source_path), str_columns, float_columns, source_stat)
+        try:
+            os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)  # atomique : les autres workers voient l'ancien ou le nouveau
+            print(f"   🧱 Snapshot {name} reconstruit ({len(data) // 1024} Ko)")
+        except OSError as e:
+            print(f"   ⚠️ Snapshot {name} non écrit ({e}), utilisé en mémoire")
+            return SnapshotTable(data, record_type)
+
+    with open(path, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return SnapshotTable(mapping, record_type, mapping)
+
+
+def load_cinemas_table():
+    """Table des cinémas Allociné (id, name, address, city, dept, source, lat, lon)."""
+    return load_snapshot(CINEMAS_JSON, 'cinemas', _read_cinemas, Cinema, CINEMA_STR_COLUMNS, CINEMA_FLOAT_COLUMNS)
+
+
+def load_salons_table():
+    """Table des salons (colonnes texte + lat, lon, date_ordinal)."""
+    return load_snapshot(SALONS_JSON, 'salons', _read_salons, Salon, SALON_STR_COLUMNS, SALON_FLOAT_COLUMNS)
+
+
+# ============================================================================
+# CLI (étape de build)
+# ============================================================================
+
+if __name__ == "__main__":
+    for source in (CINEMAS_JSON, SALONS_JSON):
+        if os.path.exists(source):
+            # Forcer la reconstruction
+            name = 'cinemas' if source == CINEMAS_JSON else 'salons'
+            try:
+                os.remove(os.path.join(SNAPSHOT_DIR, name + '.snap'))
+            except OSError:
+                pass
+    cinemas = load_cinemas_table()
+    salons = load_salons_table()
+    print(f"✅ Cinémas: {len(cinemas) if cinemas else 0}, salons: {len(salons) if salons else 0}")
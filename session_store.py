@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Sessions Flask côté serveur GEDEON
+- Le cookie ne contient qu'un identifiant opaque (sid)
+- Les données de session sont stockées dans un backend enfichable :
+  mémoire (LRU), SQLite local ou table PostgreSQL, avec un cache LRU en frontal
+
+Utilisation :
+    from session_store import ServerSideSessionInterface, MemoryBackend
+    app.session_interface = ServerSideSessionInterface(MemoryBackend())
+"""
+
+import os
+import json
+import random
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+# Probabilité de purger les sessions expirées à chaque écriture
+CLEANUP_PROBABILITY = 0.01
+
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+
+class MemoryBackend:
+    """Stockage LRU en mémoire du processus (borné en taille et en durée)."""
+
+    def __init__(self, max_entries=10000, max_age=None):
+        self.max_entries = max_entries
+        self.max_age = max_age  # durée max de conservation locale (cache frontal)
+        self._data = OrderedDict()  # sid → (data, expires_at, cached_at)
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        """Retourne (data, expires_at) ou None."""
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None:
+                return None
+            data, expires_at, cached_at = entry
+            now = time.time()
+            if expires_at <= now or (self.max_age and now - cached_at > self.max_age):
+                del self._data[sid]
+                return None
+            self._data.move_to_end(sid)
+            return data, expires_at
+
+    def set(self, sid, data, expires_at):
+        with self._lock:
+            self._data[sid] = (data, expires_at, time.time())
+            self._data.move_to_end(sid)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+
+class SQLiteBackend:
+    """Stockage dans un fichier SQLite local (partagé entre les workers d'une machine)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS user_sessions (
+                sid TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_user_sessions_expires ON user_sessions(expires_at)")
+        conn.commit()
+
+    def _conn(self):
+        # Une connexion par thread, jamais héritée d'un fork (gunicorn --preload)
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.conn = None
+            self._local.pid = os.getpid()
+        conn = self._local.conn
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        row = self._conn().execute(
+            "SELECT data, expires_at FROM user_sessions WHERE sid = ? AND expires_at > ?",
+            (sid, time.time())
+        ).fetchone()
+        if not row:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, sid, data, expires_at):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO user_sessions (sid, data, expires_at) VALUES (?, ?, ?)",
+            (sid, json.dumps(data), expires_at)
+        )
+        if random.random() < CLEANUP_PROBABILITY:
+            conn.execute("DELETE FROM user_sessions WHERE expires_at <= ?", (time.time(),))
+        conn.commit()
+
+    def delete(self, sid):
+        conn = self._conn()
+        conn.execute("DELETE FROM user_sessions WHERE sid = ?", (sid,))
+        conn.commit()
+
+
+class PostgresBackend:
+    """Stockage dans la table user_sessions de PostgreSQL (partagé entre toutes les instances)."""
+
+    def __init__(self, get_connection):
+        self.get_connection = get_connection
+
+    def get(self, sid):
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT data, EXTRACT(EPOCH FROM expires_at) AS expires_at FROM user_sessions "
+                "WHERE sid = %s AND expires_at > NOW()",
+                (sid,)
+            )
+            row = cur.fetchone()
+            cur.close()
+        finally:
+            conn.close()
+        if not row:
+            return None
+        return row['data'], float(row['expires_at'])
+
+    def set(self, sid, data, expires_at):
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO user_sessions (sid, data, expires_at) VALUES (%s, %s, TO_TIMESTAMP(%s))
+                ON CONFLICT (sid) DO UPDATE SET data = EXCLUDED.data, expires_at = EXCLUDED.expires_at
+            """, (sid, json.dumps(data), expires_at))
+            if random.random() < CLEANUP_PROBABILITY:
+                cur.execute("DELETE FROM user_sessions WHERE expires_at <= NOW()")
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()
+
+    def delete(self, sid):
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM user_sessions WHERE sid = %s", (sid,))
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()
+
+
+class CachedBackend:
+    """Backend persistant précédé d'un cache LRU mémoire (écriture directe)."""
+
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+
+    def get(self, sid):
+        entry = self.cache.get(sid)
+        if entry is None:
+            entry = self.backend.get(sid)
+            if entry is not None:
+                self.cache.set(sid, *entry)
+        return entry
+
+    def set(self, sid, data, expires_at):
+        self.backend.set(sid, data, expires_at)
+        self.cache.set(sid, data, expires_at)
+
+    def delete(self, sid):
+        self.cache.delete(sid)
+        self.backend.delete(sid)
+
+
+# ============================================================================
+# SESSION FLASK
+# ============================================================================
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dont seul l'identifiant voyage dans le cookie."""
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.previous_sid = None
+        self.modified = False
+        self.accessed = False
+
+    def rotate(self):
+        """Change l'identifiant de session (à appeler au login, contre la fixation)."""
+        if self.sid:
+            self.previous_sid = self.sid
+        self.sid = None
+        self.modified = True
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """SessionInterface Flask stockant les données dans un backend serveur."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            try:
+                entry = self.backend.get(sid)
+            except Exception as e:
+                print(f"⚠️ Session store indisponible: {e}")
+                entry = None
+            if entry is not None:
+                data, expires_at = entry
+                return ServerSideSession(data, sid=sid, expires_at=expires_at)
+        return ServerSideSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if session.previous_sid:
+            self.backend.delete(session.previous_sid)
+
+        if not session:
+            if session.modified:
+                if session.sid:
+                    self.backend.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+                response.vary.add("Cookie")
+            return
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        now = time.time()
+        # Prolonger une session permanente quand plus de la moitié de sa durée est écoulée
+        needs_refresh = session.permanent and (
+            session.expires_at is None or session.expires_at - now < lifetime / 2
+        )
+        if not (session.modified or needs_refresh):
+            return
+
+        if not session.sid:
+            session.sid = secrets.token_urlsafe(32)
+        # Session non permanente : conservée côté serveur 1 jour au plus
+        expires_at = now + (lifetime if session.permanent else 86400)
+        self.backend.set(session.sid, dict(session), expires_at)
+        session.expires_at = expires_at
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=httponly,
+            domain=domain,
+            path=path,
+            secure=secure,
+            samesite=samesite,
+        )
+        response.vary.add("Cookie")
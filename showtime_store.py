@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Stockage persistant des séances Allociné GEDEON
+- Une ligne par séance (cinéma, jour, film, début, version) et une ligne par
+  journée ingérée (une journée sans film reste connue comme « vide »)
+- Backends : table PostgreSQL (migration 5) ou fichier SQLite local
+- Alimenté par le job d'ingestion (ingest_showtimes.py) et en écriture directe
+  par les requêtes ; lu avant tout appel à Allociné
+
+Utilisation :
+    from showtime_store import create_store
+    store = create_store('postgres', get_connection=get_db_connection)
+    films_par_jour = store.get_days('P0671', [date.today()])
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import date, datetime
+
+from psycopg2.extras import execute_values
+
+from reference_data import Showtime
+
+
+def _rows_to_movies(cinema_id, rows):
+    """Lignes (title, duration, starts_at, version) triées → films avec séances Showtime."""
+    movies = {}
+    for title, duration, starts_at, version in rows:
+        if title is None:
+            continue
+        movie = movies.get(title)
+        if movie is None:
+            movie = movies[title] = {
+                'title': title,
+                'runtime': 0,
+                'genres': [],
+                'showtimes': [],
+                'duration': duration or '',
+            }
+        if starts_at is not None:
+            movie['showtimes'].append(Showtime(starts_at, version, cinema_id))
+    return list(movies.values())
+
+
+def _movies_to_rows(movies):
+    """Films → lignes (title, duration, starts_at, version) ; un film sans séance garde une ligne."""
+    rows = []
+    for movie in movies:
+        title = movie.get('title', 'Film')
+        duration = movie.get('duration', '') or ''
+        showtimes = movie.get('showtimes') or ()
+        if not showtimes:
+            rows.append((title, duration, None, None))
+        for showtime in showtimes:
+            rows.append((title, duration, showtime.starts_at, showtime.version))
+    return rows
+
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+
+class SQLiteShowtimeStore:
+    """Séances dans un fichier SQLite local (partagé entre les workers d'une machine)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cinema_showtime_days (
+                cinema_id TEXT NOT NULL,
+                day TEXT NOT NULL,
+                film_count INTEGER NOT NULL,
+                fetched_at TEXT NOT NULL,
+                PRIMARY KEY (cinema_id, day)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cinema_showtimes (
+                cinema_id TEXT NOT NULL,
+                day TEXT NOT NULL,
+                title TEXT NOT NULL,
+                duration TEXT,
+                starts_at TEXT,
+                version TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cinema_showtimes_day ON cinema_showtimes(cinema_id, day)")
+        conn.commit()
+
+    def _conn(self):
+        # Une connexion par thread, jamais héritée d'un fork (gunicorn --preload)
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.conn = None
+            self._local.pid = os.getpid()
+        conn = self._local.conn
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get_days(self, cinema_id, days):
+        """{jour: films} des journées ingérées parmi days (absentes = à récupérer)."""
+        if not days:
+            return {}
+        placeholders = ', '.join('?' * len(days))
+        params = [cinema_id] + [day.isoformat() for day in days]
+        conn = self._conn()
+        known = conn.execute(
+            f"SELECT day FROM cinema_showtime_days WHERE cinema_id = ? AND day IN ({placeholders})", params
+        ).fetchall()
+        rows = conn.execute(
+            f"SELECT day, title, duration, starts_at, version FROM cinema_showtimes "
+            f"WHERE cinema_id = ? AND day IN ({placeholders}) ORDER BY day, starts_at, version", params
+        ).fetchall()
+        by_day = {day: [] for (day,) in known}
+        for day, title, duration, starts_at, version in rows:
+            if day in by_day:
+                by_day[day].append((title, duration, datetime.fromisoformat(starts_at) if starts_at else None, version))
+        return {date.fromisoformat(day): _rows_to_movies(cinema_id, day_rows) for day, day_rows in by_day.items()}
+
+    def put_days(self, cinema_id, movies_by_day):
+        """Remplace les journées données d'un cinéma (une transaction)."""
+        conn = self._conn()
+        now = datetime.now().isoformat(timespec='seconds')
+        with conn:
+            for day, movies in movies_by_day.items():
+                conn.execute("DELETE FROM cinema_showtimes WHERE cinema_id = ? AND day = ?", (cinema_id, day.isoformat()))
+                conn.executemany(
+                    "INSERT INTO cinema_showtimes (cinema_id, day, title, duration, starts_at, version) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(cinema_id, day.isoformat(), title, duration, starts_at.isoformat() if starts_at else None, version)
+                     for title, duration, starts_at, version in _movies_to_rows(movies)]
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO cinema_showtime_days (cinema_id, day, film_count, fetched_at) VALUES (?, ?, ?, ?)",
+                    (cinema_id, day.isoformat(), len(movies), now)
+                )
+
+    def purge(self, before):
+        """Supprime les journées antérieures à before."""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM cinema_showtimes WHERE day < ?", (before.isoformat(),))
+            conn.execute("DELETE FROM cinema_showtime_days WHERE day < ?", (before.isoformat(),))
+
+
+class PostgresShowtimeStore:
+    """Séances dans les tables cinema_showtimes / cinema_showtime_days de PostgreSQL."""
+
+    def __init__(self, get_connection):
+        self.get_connection = get_connection
+
+    def get_days(self, cinema_id, days):
+        """{jour: films} des journées ingérées parmi days (absentes = à récupérer)."""
+        if not days:
+            return {}
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT d.day, s.title, s.duration, s.starts_at, s.version
+                FROM cinema_showtime_days d
+                LEFT JOIN cinema_showtimes s ON s.cinema_id = d.cinema_id AND s.day = d.day
+                WHERE d.cinema_id = %s AND d.day = ANY(%s)
+                ORDER BY d.day, s.starts_at, s.version
+            """, (cinema_id, list(days)))
+            rows = cur.fetchall()
+            cur.close()
+        finally:
+            conn.close()
+        by_day = {}
+        for row in rows:
+            by_day.setdefault(row['day'], []).append((row['title'], row['duration'], row['starts_at'], row['version']))
+        return {day: _rows_to_movies(cinema_id, day_rows) for day, day_rows in by_day.items()}
+
+    def put_days(self, cinema_id, movies_by_day):
+        """Remplace les journées données d'un cinéma (une transaction)."""
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            for day, movies in movies_by_day.items():
+                cur.execute("DELETE FROM cinema_showtimes WHERE cinema_id = %s AND day = %s", (cinema_id, day))
+                execute_values(
+                    cur,
+                    "INSERT INTO cinema_showtimes (cinema_id, day, title, duration, starts_at, version) VALUES %s",
+                    [(cinema_id, day) + row for row in _movies_to_rows(movies)]
+                )
+                cur.execute("""
+                    INSERT INTO cinema_showtime_days (cinema_id, day, film_count) VALUES (%s, %s, %s)
+                    ON CONFLICT (cinema_id, day) DO UPDATE
+                        SET film_count = EXCLUDED.film_count, fetched_at = NOW()
+                """, (cinema_id, day, len(movies)))
+            conn.commit()
+            cur.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def purge(self, before):
+        """Supprime les journées antérieures à before."""
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM cinema_showtimes WHERE day < %s", (before,))
+            cur.execute("DELETE FROM cinema_showtime_days WHERE day < %s", (before,))
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()
+
+
+def create_store(backend, get_connection=None, sqlite_path=None):
+    """Store de séances : 'postgres', 'sqlite' ou None (aucun stockage persistant)."""
+    if backend == 'postgres' and get_connection is not None:
+        return PostgresShowtimeStore(get_connection)
+    if backend == 'sqlite':
+        return SQLiteShowtimeStore(sqlite_path or 'showtimes.sqlite3')
+    return None
@@ -0,0 +1,114 @@
+"""File d'emails : envoi via un serveur SMTP local de debug (aiosmtpd)."""
+
+import os
+import socket
+import threading
+import time
+import uuid
+
+import pytest
+
+import auth_email
+
+aiosmtpd_controller = pytest.importorskip('aiosmtpd.controller')
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.recipients = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.recipients.extend(envelope.rcpt_tos)
+        return '250 OK'
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    """Serveur SMTP local sans TLS ni identifiants, à la place de Gmail."""
+    handler = RecordingHandler()
+    controller = aiosmtpd_controller.Controller(handler, hostname='localhost', port=_free_port())
+    controller.start()
+    monkeypatch.setattr(auth_email, 'SMTP_HOST', 'localhost')
+    monkeypatch.setattr(auth_email, 'SMTP_PORT', controller.port)
+    monkeypatch.setattr(auth_email, 'SMTP_STARTTLS', False)
+    monkeypatch.setattr(auth_email, 'SMTP_USER', None)
+    monkeypatch.setattr(auth_email, 'SMTP_PASSWORD', None)
+    yield handler
+    controller.stop()
+
+
+def _start_sender(outbox):
+    wakeup = threading.Event()
+    threading.Thread(target=auth_email._sender_loop, args=(outbox, wakeup), daemon=True).start()
+    return wakeup
+
+
+def _wait_for(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_memory_outbox_sends_rendered_email(smtp_server):
+    outbox = auth_email.MemoryOutbox()
+    outbox.add(auth_email.render_emails('confirmation', [('alice@example.org', 'Alice_1', 'abc123')]))
+    _start_sender(outbox)
+
+    assert _wait_for(lambda: outbox.pending() == 0)
+    assert smtp_server.recipients == ['alice@example.org']
+
+
+def test_enqueue_failure_is_returned_to_caller(monkeypatch, smtp_server):
+    class BrokenOutbox(auth_email.MemoryOutbox):
+        def add(self, messages):
+            raise RuntimeError('base indisponible')
+
+    monkeypatch.setattr(auth_email, '_outbox', BrokenOutbox())
+    monkeypatch.setattr(auth_email, '_outbox_pid', os.getpid())
+
+    assert auth_email.send_confirmation_email('bob@example.org', 'Bob_1', 'tok') == (False, 'base indisponible')
+
+
+@pytest.fixture
+def database_url():
+    url = os.environ.get('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip('TEST_DATABASE_URL non défini (PostgreSQL de test)')
+    return url
+
+
+def test_postgres_outbox_row_marked_sent(smtp_server, database_url):
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+    from migrations import ensure_schema
+
+    def get_connection():
+        return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+
+    ensure_schema(get_connection)
+    to_email = f'outbox-{uuid.uuid4().hex[:8]}@example.org'
+    outbox = auth_email.PostgresOutbox(get_connection)
+    outbox.add(auth_email.render_emails('password_reset', [(to_email, 'Carol_1', 'tok')]))
+    _start_sender(outbox)
+
+    def sent_at():
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT sent_at, failed_at FROM email_outbox WHERE to_email = %s", (to_email,))
+            return cur.fetchone()
+        finally:
+            conn.close()
+
+    assert _wait_for(lambda: sent_at()['sent_at'] is not None)
+    assert sent_at()['failed_at'] is None
+    assert smtp_server.recipients == [to_email]
@@ -0,0 +1,68 @@
+"""Ingestion des séances hors ligne : fixtures enregistrées → store SQLite."""
+
+import os
+from datetime import date, timedelta
+
+import ingest_showtimes
+from allocine_client import FixtureAllocineClient
+from showtime_store import SQLiteShowtimeStore
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'allocine')
+
+
+def test_cli_ingests_fixtures_into_sqlite(tmp_path):
+    sqlite_path = str(tmp_path / 'showtimes.sqlite3')
+    checkpoint = str(tmp_path / 'checkpoint.json')
+
+    status = ingest_showtimes.main([
+        '--store', 'sqlite', '--sqlite-path', sqlite_path, '--fixtures', FIXTURES,
+        '--checkpoint', checkpoint, '--days', '2', '--delay', '0', '--workers', '2', '--limit', '2',
+    ])
+
+    assert status == 0
+    assert not os.path.exists(checkpoint)  # supprimé quand tout est ingéré
+    store = SQLiteShowtimeStore(sqlite_path)
+    days = [date.today(), date.today() + timedelta(days=1)]
+    stored = store.get_days('P0571', days)
+    assert sorted(stored) == days
+    for day, movies in stored.items():
+        assert sorted(movie['title'] for movie in movies) == ['Anora', "L'Attachement"]
+        showtimes = [showtime for movie in movies for showtime in movie['showtimes']]
+        # Séances enregistrées recalées sur le jour demandé
+        assert {showtime.starts_at.date() for showtime in showtimes} == {day}
+        assert {showtime.version for showtime in showtimes} == {'VF', 'VO'}
+    assert [movie['title'] for movie in store.get_days('P8109', days)[days[0]]] == ['Le Robot sauvage']
+
+
+class FlakyClient(FixtureAllocineClient):
+    """Client de fixtures dont un cinéma ne répond pas tant que `failing` est vrai."""
+
+    failing = True
+
+    def get_showtime(self, cinema_id, date_str):
+        if FlakyClient.failing and cinema_id == 'P8109':
+            raise IOError('timeout')
+        return super().get_showtime(cinema_id, date_str)
+
+
+def test_resume_only_retries_failed_cinemas(tmp_path):
+    store = SQLiteShowtimeStore(str(tmp_path / 'showtimes.sqlite3'))
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    days = [date.today(), date.today() + timedelta(days=1)]
+    cinema_ids = ['P0571', 'P8109']
+
+    FlakyClient.failing = True
+    first = ingest_showtimes.Ingestion(store, days, lambda: FlakyClient(FIXTURES), delay=0)
+    assert first.run(cinema_ids, 2, checkpoint_path=checkpoint) == (1, ['P8109'])
+    assert ingest_showtimes.load_checkpoint(checkpoint, days) == {'P0571'}
+    assert store.get_days('P8109', days) == {}
+
+    FlakyClient.failing = False
+    second = ingest_showtimes.Ingestion(store, days, lambda: FlakyClient(FIXTURES), delay=0)
+    ingested = []
+    ingest_cinema = second.ingest_cinema
+    second.ingest_cinema = lambda cinema_id: ingested.append(cinema_id) or ingest_cinema(cinema_id)
+    assert second.run(cinema_ids, 2, checkpoint_path=checkpoint) == (2, [])
+    assert ingested == ['P8109']
+    assert not os.path.exists(checkpoint)
+    assert sorted(store.get_days('P8109', days)) == days